@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Brand, Category, Provider, Product, ProductImage,StockMovement
+from .models import Brand, Category, Provider, Product, ProductImage,StockMovement, Location, StockBalance, StockReservation, DeactivationJob
 from simple_history.admin import SimpleHistoryAdmin
 
 class ProductImageInline(admin.TabularInline):
@@ -9,7 +9,7 @@ class ProductImageInline(admin.TabularInline):
 @admin.register(Product)
 class ProductAdmin(SimpleHistoryAdmin):
     # Qué columnas ver en la lista
-    list_display = ('nombre_comercial', 'sku', 'brand', 'category', 'stock', 'is_active', 'precio_venta', 'user')
+    list_display = ('nombre_comercial', 'sku', 'brand', 'category', 'stock', 'reserved', 'is_active', 'precio_venta', 'user')
     # Por qué campos buscar
     search_fields = ('nombre_comercial', 'sku', 'ean')
     # Filtros laterales
@@ -19,7 +19,7 @@ class ProductAdmin(SimpleHistoryAdmin):
 
 @admin.register(StockMovement)
 class StockMovementAdmin(SimpleHistoryAdmin):
-    list_display = ('product', 'movement_type', 'quantity', 'user', 'created_at')
+    list_display = ('product', 'movement_type', 'quantity', 'location', 'destination', 'user', 'created_at')
     list_filter = ('movement_type', 'created_at', 'user')
     search_fields = ('product__nombre_comercial', 'reason')
     readonly_fields = ('user', 'created_at')
@@ -32,4 +32,24 @@ class StockMovementAdmin(SimpleHistoryAdmin):
 # Registro simple para las otras tablas
 admin.site.register(Brand)
 admin.site.register(Category)
-admin.site.register(Provider)
\ No newline at end of file
+admin.site.register(Provider)
+admin.site.register(Location)
+
+@admin.register(StockBalance)
+class StockBalanceAdmin(admin.ModelAdmin):
+    list_display = ('product', 'location', 'quantity', 'updated_at')
+    list_filter = ('location',)
+    readonly_fields = ('product', 'location', 'quantity')
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'quantity', 'status', 'user', 'expires_at', 'created_at')
+    list_filter = ('status',)
+    # El contador Product.reserved solo se mantiene desde reservar/cancelar/convertir
+    readonly_fields = ('product', 'quantity', 'status', 'user', 'expires_at', 'movement')
+
+@admin.register(DeactivationJob)
+class DeactivationJobAdmin(admin.ModelAdmin):
+    list_display = ('target', 'target_name', 'status', 'processed', 'total', 'user', 'created_at', 'finished_at')
+    list_filter = ('status', 'target')
+    readonly_fields = ('target', 'target_id', 'target_name', 'status', 'total', 'processed', 'error', 'user', 'finished_at')
@@ -0,0 +1,168 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.db import connection, models, transaction
+from django.db.models import Count, F, RowRange, Sum, Window
+from django.utils import timezone
+
+from .models import InventoryValuation, Product
+
+# dimensión -> (campo de agrupación, campo con el nombre visible)
+VALUATION_GROUPS = {
+    'brand': ('brand', 'brand__name'),
+    'category': ('category', 'category__name'),
+    'provider': ('provider', 'provider__name'),
+    'lugar_bodega': ('lugar_bodega', 'lugar_bodega'),
+}
+VALUATION_FIELDS = ['label', 'productos', 'unidades', 'valor_costo', 'valor_venta', 'computed_at']
+
+logger = logging.getLogger(__name__)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='valuation')
+_rebuilding = threading.Lock()
+
+
+def rebuild_inventory_valuation():
+    """
+    Reconstruye la tabla de valorización con un GROUP BY por dimensión
+    (4 consultas de agregación, separadas por empresa) y la reemplaza en una
+    sola transacción: upsert por (empresa, dimensión, clave) y borrado de los
+    grupos que ya no existen, así dos reconstrucciones simultáneas (cron y
+    API) no chocan con la restricción única.
+    """
+    now = timezone.now()
+    money = models.DecimalField(max_digits=20, decimal_places=0)
+    rows = []
+
+    for dimension, (group_field, label_field) in VALUATION_GROUPS.items():
+        groups = (
+            Product.objects.filter(is_active=True)
+            .order_by()
+            .values('company', group_field, label_field)
+            .annotate(
+                productos=Count('id'),
+                unidades=Sum('stock'),
+                valor_costo=Sum(F('stock') * F('costo_cg'), output_field=money),
+                valor_venta=Sum(F('stock') * F('precio_venta'), output_field=money),
+            )
+        )
+        for group in groups:
+            rows.append(InventoryValuation(
+                company_id=group['company'],
+                dimension=dimension,
+                key=str(group[group_field]),
+                label=group[label_field],
+                productos=group['productos'],
+                unidades=group['unidades'] or 0,
+                valor_costo=group['valor_costo'] or 0,
+                valor_venta=group['valor_venta'] or 0,
+                computed_at=now,
+            ))
+
+    with transaction.atomic():
+        InventoryValuation.objects.bulk_create(
+            rows, batch_size=500, update_conflicts=True,
+            unique_fields=['company', 'dimension', 'key'], update_fields=VALUATION_FIELDS,
+        )
+        InventoryValuation.objects.filter(computed_at__lt=now).delete()
+    return len(rows)
+
+
+def schedule_valuation_rebuild():
+    """
+    Encola una reconstrucción en segundo plano, salvo que ya haya una en curso
+    en este proceso (entre procesos, el upsert evita el choque).
+    """
+    if not _rebuilding.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            rebuild_inventory_valuation()
+        except Exception:
+            logger.exception("Falló la reconstrucción de la valorización")
+        finally:
+            _rebuilding.release()
+            connection.close()
+
+    _executor.submit(run)
+
+
+def valuation_computed_at():
+    return InventoryValuation.objects.order_by().values_list('computed_at', flat=True).first()
+
+
+class RunningSum(models.Func):
+    """SUM(...) como función de ventana sobre un agregado ya agrupado (SUM(SUM(x)) OVER ...)."""
+    function = 'SUM'
+    window_compatible = True
+
+
+ABC_WRITE_CHUNK = 2000
+
+
+def classify_abc(days=90, threshold_a=80, threshold_b=95):
+    """
+    Clasificación ABC por ingresos de venta (salidas x precio_venta) en los
+    últimos `days` días, solo sobre productos activos:
+
+    1. UPDATE que reinicia a 'C' y 0 unidades lo que no lo está.
+    2. Una consulta: JOIN con las salidas del periodo, GROUP BY producto y,
+       sobre esos totales, funciones de ventana (acumulado y total de ingresos).
+    3. bulk_update por bloques de la clase y las unidades de los que vendieron
+       (sin pasar por save(): no genera historial).
+
+    Un producto es A si el acumulado de los productos que lo preceden está
+    bajo `threshold_a`% del total, B si está bajo `threshold_b`%, y C si no.
+    El ranking se calcula por separado para cada empresa.
+    """
+    since = timezone.now() - timedelta(days=days)
+    money = models.DecimalField(max_digits=20, decimal_places=0)
+
+    ranked = (
+        Product.objects.order_by()
+        .filter(is_active=True, movements__movement_type='OUT', movements__created_at__gte=since)
+        .values('pk')
+        .annotate(
+            unidades=Sum('movements__quantity'),
+            ingresos=Sum(F('movements__quantity') * F('precio_venta'), output_field=money),
+        )
+        .filter(ingresos__gt=0)
+        .annotate(
+            acumulado=Window(
+                RunningSum(F('ingresos'), output_field=money),
+                partition_by=[F('company')],
+                order_by=[F('ingresos').desc(), F('pk').asc()],
+                frame=RowRange(start=None, end=0),
+            ),
+            total=Window(RunningSum(F('ingresos'), output_field=money), partition_by=[F('company')]),
+        )
+        .values_list('pk', 'unidades', 'ingresos', 'acumulado', 'total')
+    )
+
+    def abc_class(ingresos, acumulado, total):
+        # acumulado anterior al producto (< umbral) => entra en la clase
+        previous = (acumulado - ingresos) * 100
+        if previous < total * threshold_a:
+            return 'A'
+        if previous < total * threshold_b:
+            return 'B'
+        return 'C'
+
+    counts = {'A': 0, 'B': 0}
+    with transaction.atomic():
+        Product.objects.exclude(abc_class='C', ventas_unidades=0).update(abc_class='C', ventas_unidades=0)
+        rows = ranked.iterator(chunk_size=ABC_WRITE_CHUNK)
+        while chunk := list(islice(rows, ABC_WRITE_CHUNK)):
+            products = [
+                Product(pk=pk, ventas_unidades=unidades, abc_class=abc_class(ingresos, acumulado, total))
+                for pk, unidades, ingresos, acumulado, total in chunk
+            ]
+            Product.objects.bulk_update(products, ['abc_class', 'ventas_unidades'])
+            for product in products:
+                if product.abc_class in counts:
+                    counts[product.abc_class] += 1
+
+    return counts
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Conecta las señales que mantienen el índice de códigos EAN/SKU
+        from . import lookup  # noqa: F401
+        # y las que generan las variantes de las imágenes subidas
+        from . import images  # noqa: F401
+        # y las que mantienen el índice de duplicados (firmas y bandas LSH)
+        from . import duplicates  # noqa: F401
@@ -0,0 +1,131 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Product, DeactivationJob
+
+logger = logging.getLogger(__name__)
+
+CASCADE_CHUNK_SIZE = 500
+
+
+# Un solo hilo: las cascadas grandes se encolan y no compiten entre sí por la base de datos
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cascades')
+
+
+def deactivate_products(ids, user, reason):
+    """
+    Descontinúa los productos `ids` por bloques: un UPDATE por bloque y sus
+    filas de historial en un solo INSERT (bulk_history_create), sin save()
+    por producto. Genera la cantidad acumulada después de cada bloque.
+    """
+    for i in range(0, len(ids), CASCADE_CHUNK_SIZE):
+        chunk = ids[i:i + CASCADE_CHUNK_SIZE]
+        with transaction.atomic():
+            # Solo los que siguen activos: el historial registra un cambio por producto apagado
+            active = list(Product.objects.select_for_update().filter(pk__in=chunk, is_active=True).values_list('pk', flat=True))
+            Product.objects.filter(pk__in=active).update(is_active=False, updated_at=timezone.now())
+            Product.history.bulk_history_create(
+                Product.objects.filter(pk__in=active),
+                update=True,
+                default_user=user,
+                default_change_reason=reason,
+            )
+        yield i + len(chunk)
+
+
+def cascade_deactivate(instance, target, user):
+    """
+    Descontinúa una marca, categoría o proveedor y sus productos activos.
+    Hasta CASCADE_SYNC_MAX_PRODUCTS se hace en la misma transacción de la
+    petición y devuelve None; sobre eso crea un DeactivationJob que corre en
+    segundo plano y lo devuelve (la marca queda apagada de inmediato).
+    """
+    reason = f"Descontinuado por {instance._meta.verbose_name} '{instance.name}'"
+    ids = list(instance.product_set.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+
+    with transaction.atomic():
+        instance.is_active = False
+        instance.save()
+        if len(ids) <= settings.CASCADE_SYNC_MAX_PRODUCTS:
+            for _ in deactivate_products(ids, user, reason):
+                pass
+            return None
+
+        job = DeactivationJob.objects.create(
+            company_id=instance.company_id, target=target, target_id=instance.pk,
+            target_name=instance.name, total=len(ids), user=user,
+        )
+        transaction.on_commit(lambda: _executor.submit(run_deactivation_job, job.pk, ids, reason))
+    return job
+
+
+def run_deactivation_job(job_id, ids, reason, done=0):
+    """
+    Tarea de fondo: cada bloque se confirma por separado y actualiza el avance.
+    `done` son los productos ya apagados por una corrida anterior del trabajo.
+    Primero reclama el trabajo (PENDING -> RUNNING con un UPDATE condicional):
+    si otra corrida ya lo tomó, no hace nada.
+    """
+    try:
+        if not DeactivationJob.objects.filter(pk=job_id, status='PENDING').update(status='RUNNING', heartbeat_at=timezone.now()):
+            return
+        job = DeactivationJob.objects.get(pk=job_id)
+        for processed in deactivate_products(ids, job.user, reason):
+            DeactivationJob.objects.filter(pk=job_id).update(processed=done + processed, heartbeat_at=timezone.now())
+        DeactivationJob.objects.filter(pk=job_id).update(status='DONE', finished_at=timezone.now())
+    except Exception as e:
+        logger.exception("Error en la descontinuación en cascada %s", job_id)
+        DeactivationJob.objects.filter(pk=job_id).update(status='FAILED', error=str(e), finished_at=timezone.now())
+    finally:
+        # Hilo del pool: no dejar conexiones abiertas entre tareas
+        connection.close()
+
+
+def resumable_jobs(include_stale=True):
+    """
+    Trabajos que no terminaron: PENDING, FAILED y, con `include_stale`, los
+    RUNNING sin avance en DEACTIVATION_JOB_STALE_MINUTES (su proceso murió).
+    Un RUNNING con avance reciente lo está procesando otro worker y no se toca.
+    """
+    statuses = Q(status__in=('PENDING', 'FAILED'))
+    if include_stale:
+        cutoff = timezone.now() - timedelta(minutes=settings.DEACTIVATION_JOB_STALE_MINUTES)
+        statuses |= Q(status='RUNNING') & (Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True))
+    return DeactivationJob.objects.filter(statuses)
+
+
+def prepare_resume(job, include_stale=True):
+    """
+    Deja `job` listo para reanudarse y devuelve (ids, reason, done): los
+    productos de la marca, categoría o proveedor que siguen activos. Como
+    deactivate_products solo toca los activos, repetir lo ya hecho no duplica
+    cambios ni historial. El paso a PENDING es un UPDATE condicional sobre
+    resumable_jobs(); devuelve None si el trabajo ya no se puede reanudar.
+    """
+    ids = list(
+        Product.objects.filter(**{f'{job.target}_id': job.target_id, 'is_active': True})
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    done = max(job.total - len(ids), 0)
+    if not resumable_jobs(include_stale).filter(pk=job.pk).update(status='PENDING', processed=done, error='', finished_at=None):
+        return None
+    reason = f"Descontinuado por {job.get_target_display()} '{job.target_name}'"
+    return ids, reason, done
+
+
+def resume_deactivation_job(job):
+    """
+    Reanuda `job` (PENDING o FAILED) en el pool de fondo; devuelve False si
+    está en proceso o ya terminó.
+    """
+    prepared = prepare_resume(job, include_stale=False)
+    if prepared is None:
+        return False
+    _executor.submit(run_deactivation_job, job.pk, *prepared)
+    return True
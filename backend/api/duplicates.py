@@ -0,0 +1,214 @@
+import hashlib
+import logging
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+from itertools import groupby
+
+import numpy as np
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Product, ProductBand, ProductSignature
+
+logger = logging.getLogger(__name__)
+
+# MinHash de 64 permutaciones en 16 bandas de 4 filas: pares con similitud
+# sobre ~0.5 caen juntos en algún balde y luego se verifican con la firma.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+DEFAULT_THRESHOLD = 0.7
+# En baldes enormes (nombres genéricos repetidos) se compara contra el primero, no todos contra todos
+MAX_BUCKET_PAIRS = 200
+
+_rng = np.random.default_rng(20250101)
+_A = (_rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1))
+_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+_SHIFT = np.uint64(32)
+
+# Campos que entran en la firma: guardar otros no la recalcula
+SIGNED_FIELDS = ('nombre_comercial', 'brand', 'brand_id', 'dimensiones')
+CHUNK_SIZE = 2000
+
+
+def _normalize(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def shingles(nombre, brand_id, dimensiones):
+    """Trigramas de caracteres del nombre + marca + dimensiones normalizadas."""
+    name = f" {_normalize(nombre)} "
+    tokens = {name[i:i + 3] for i in range(max(len(name) - 2, 1))}
+    tokens.add(f"brand:{brand_id}")
+    dims = re.findall(r'\d+(?:[.,]\d+)?', dimensiones or '')
+    if dims:
+        tokens.add(f"dim:{'x'.join(dims)}")
+    return tokens
+
+
+def signature(tokens):
+    hashes = np.fromiter((zlib.crc32(t.encode('utf-8')) for t in tokens), dtype=np.uint64, count=len(tokens))
+    # Hash multiply-shift: (a*h + b) mod 2^64 >> 32, mínimo por permutación
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) >> _SHIFT).min(axis=1).astype(np.uint32)
+
+
+def similarity(sig_a, sig_b):
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+def band_keys(sig, company_id=None):
+    """
+    Llave de 64 bits por banda. La empresa es parte de la llave: nunca se
+    comparan productos de distintos tenants.
+    """
+    return [
+        int.from_bytes(hashlib.blake2b(
+            f"{company_id}:{band}:".encode() + sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8,
+        ).digest(), 'big', signed=True)
+        for band in range(BANDS)
+    ]
+
+
+def product_signature(product):
+    return signature(shingles(product.nombre_comercial, product.brand_id, product.dimensiones))
+
+
+def index_products(products):
+    """
+    Guarda la firma y las llaves de banda de `products`; los que no cambiaron
+    de firma no se tocan. Una consulta para leer las firmas actuales y, si hay
+    cambios, una transacción con las escrituras.
+    """
+    signed = {product.pk: product_signature(product) for product in products}
+    current = dict(ProductSignature.objects.filter(product_id__in=signed).values_list('product_id', 'minhash'))
+    changed = [product for product in products if current.get(product.pk) != signed[product.pk].tobytes()]
+    if not changed:
+        return 0
+    with transaction.atomic():
+        ids = [product.pk for product in changed]
+        ProductBand.objects.filter(product_id__in=ids).delete()
+        ProductSignature.objects.bulk_create(
+            [ProductSignature(product_id=product.pk, minhash=signed[product.pk].tobytes()) for product in changed],
+            update_conflicts=True, unique_fields=['product'], update_fields=['minhash'],
+        )
+        ProductBand.objects.bulk_create([
+            ProductBand(product_id=product.pk, key=key)
+            for product in changed for key in band_keys(signed[product.pk], product.company_id)
+        ], batch_size=CHUNK_SIZE)
+    return len(changed)
+
+
+def reindex_products(queryset):
+    """Recalcula el índice de `queryset` por bloques (para datos cargados sin señales)."""
+    total = 0
+    last = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last).order_by('pk').only('nombre_comercial', 'brand', 'dimensiones', 'company')[:CHUNK_SIZE])
+        if not chunk:
+            return total
+        total += index_products(chunk)
+        last = chunk[-1].pk
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not set(update_fields) & set(SIGNED_FIELDS)):
+        return
+    index_products([instance])
+
+
+def _signatures(pks):
+    result = {}
+    pks = list(pks)
+    for i in range(0, len(pks), CHUNK_SIZE):
+        rows = ProductSignature.objects.filter(product_id__in=pks[i:i + CHUNK_SIZE]).values_list('product_id', 'minhash')
+        result.update((pk, np.frombuffer(bytes(minhash), dtype=np.uint32)) for pk, minhash in rows)
+    return result
+
+
+def find_duplicates(queryset, threshold=DEFAULT_THRESHOLD):
+    """
+    Pares probablemente duplicados en `queryset` sin comparar todos contra todos:
+    recorre las llaves de banda guardadas en orden (un balde a la vez, desde el
+    índice) y verifica con la firma solo los pares que comparten balde.
+    Devuelve [(id_a, id_b, similitud)] de mayor a menor.
+    """
+    bands = (
+        ProductBand.objects.filter(product__in=queryset.order_by().values('pk'))
+        .order_by('key', 'product_id').values_list('key', 'product_id')
+    )
+    candidates = set()
+    truncated = []
+    for _, rows in groupby(bands.iterator(chunk_size=5000), key=lambda row: row[0]):
+        members = [pk for _, pk in rows]
+        if len(members) < 2:
+            continue
+        if len(members) > MAX_BUCKET_PAIRS:
+            candidates.update((members[0], other) for other in members[1:])
+            truncated.append(len(members))
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                candidates.add((a, b))
+    if truncated:
+        # Entre los demás miembros de esos baldes pueden quedar duplicados sin detectar
+        logger.warning(
+            "%d baldes con más de %d productos (el mayor con %d) se compararon solo contra su primer miembro",
+            len(truncated), MAX_BUCKET_PAIRS, max(truncated),
+        )
+
+    signatures = _signatures({pk for pair in candidates for pk in pair})
+    pairs = []
+    for a, b in candidates:
+        score = similarity(signatures[a], signatures[b])
+        if score >= threshold:
+            pairs.append((a, b, score))
+    pairs.sort(key=lambda pair: -pair[2])
+    return pairs
+
+
+def find_similar(product, threshold=DEFAULT_THRESHOLD, queryset=None):
+    """
+    Chequeo incremental para un producto: busca en el índice los productos
+    activos de su misma marca que comparten alguna llave de banda y los
+    verifica con la firma guardada. Devuelve [(id, similitud)] de mayor a menor.
+    """
+    if queryset is None:
+        queryset = Product.objects.filter(is_active=True, brand_id=product.brand_id)
+    target = product_signature(product)
+    candidates = ProductBand.objects.filter(key__in=band_keys(target, product.company_id)).values('product')
+    rows = ProductSignature.objects.filter(
+        product__in=queryset.filter(pk__in=candidates).exclude(pk=product.pk).order_by().values('pk')
+    ).values_list('product_id', 'minhash')
+
+    matches = []
+    for pk, minhash in rows:
+        score = similarity(target, np.frombuffer(bytes(minhash), dtype=np.uint32))
+        if score >= threshold:
+            matches.append((pk, score))
+    matches.sort(key=lambda match: -match[1])
+    return matches
+
+
+def group_pairs(pairs):
+    """Agrupa pares en conjuntos conexos (union-find)."""
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b, _ in pairs:
+        parent[find(a)] = find(b)
+
+    groups = defaultdict(list)
+    for x in parent:
+        groups[find(x)].append(x)
+    return sorted((sorted(members) for members in groups.values()), key=len, reverse=True)
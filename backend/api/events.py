@@ -0,0 +1,98 @@
+import asyncio
+from collections import deque
+
+from django.conf import settings
+
+from companies.models import get_user_company
+
+from .models import StockEvent
+
+FEED_SIZE = 5000
+FEED_BATCH = 500
+
+
+def event_filter(user):
+    """La misma regla de scope_queryset, como predicado sobre eventos ya leídos."""
+    company = get_user_company(user)
+    if company is not None:
+        return lambda event: event.company_id == company.pk
+    if user.is_superuser:
+        return lambda event: True
+    return lambda event: event.company_id is None
+
+
+class StockEventFeed:
+    """
+    Un solo sondeo de StockEvent por proceso, compartido por todas las
+    conexiones SSE abiertas. Los eventos nuevos quedan en un búfer en memoria
+    (los últimos FEED_SIZE) y se avisa a las conexiones que esperan; una
+    conexión solo consulta la base de datos para ponerse al día con eventos
+    que ya salieron del búfer. El sondeo corre mientras haya alguien escuchando.
+    """
+
+    def __init__(self, size=FEED_SIZE):
+        self.events = deque(maxlen=size)
+        self.last = None
+        self.listeners = 0
+        self._loop = None
+        self._task = None
+        self._changed = None
+
+    async def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Otro event loop (otro worker o un test): lo anterior no sirve aquí
+            self._loop, self._task, self._changed = loop, None, asyncio.Event()
+        if self.last is None:
+            self.last = await StockEvent.objects.order_by('-id').values_list('id', flat=True).afirst() or 0
+        self.listeners += 1
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._poll())
+
+    def unsubscribe(self):
+        self.listeners -= 1
+
+    async def _poll(self):
+        while self.listeners > 0:
+            batch = [event async for event in StockEvent.objects.filter(id__gt=self.last).order_by('id')[:FEED_BATCH]]
+            if batch:
+                self.events.extend(batch)
+                self.last = batch[-1].id
+                changed, self._changed = self._changed, asyncio.Event()
+                changed.set()
+                if len(batch) == FEED_BATCH:
+                    continue
+            await asyncio.sleep(settings.STOCK_EVENTS_POLL_SECONDS)
+
+    def since(self, last, visible):
+        """
+        Eventos visibles posteriores a `last` que están en el búfer, o None si
+        el búfer ya no llega tan atrás.
+        """
+        start = self.events[0].id - 1 if self.events else self.last
+        if last < start:
+            return None
+        newer = []
+        for event in reversed(self.events):
+            if event.id <= last:
+                break
+            if visible(event):
+                newer.append(event)
+        newer.reverse()
+        return newer
+
+    async def wait(self, position, timeout):
+        """
+        Espera eventos posteriores a `position` (el self.last que vio quien
+        llama); devuelve False si se cumplió `timeout`.
+        """
+        if self.last > position:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+stock_event_feed = StockEventFeed()
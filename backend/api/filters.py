@@ -0,0 +1,56 @@
+import django_filters
+
+from .models import Product
+
+RANGE = ['exact', 'lt', 'lte', 'gt', 'gte']
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    Igualdad por FK y rangos numéricos/fecha: ?stock__lt=5, ?precio_venta__gte=X&precio_venta__lte=Y,
+    ?peso__gt=20, ?updated_at__gte=2025-01-01... y disponibilidad por ubicación: ?location=<id>
+    """
+    location = django_filters.NumberFilter(method='filter_location', label='Con stock en la ubicación')
+
+    def filter_location(self, queryset, name, value):
+        return queryset.filter(balances__location=value, balances__quantity__gt=0)
+
+    class Meta:
+        model = Product
+        fields = {
+            'brand': ['exact'],
+            'category': ['exact'],
+            'provider': ['exact'],
+            'abc_class': ['exact'],
+            'stock': RANGE,
+            'precio_venta': RANGE,
+            'costo_cg': RANGE,
+            'peso': RANGE,
+            'rating': RANGE,
+            'updated_at': ['lt', 'lte', 'gt', 'gte'],
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # El costo es solo para administradores: un vendedor podría deducirlo filtrando por rangos
+        user = getattr(self.request, 'user', None)
+        is_admin = user is not None and (user.is_staff or (hasattr(user, 'profile') and user.profile.role == 'ADMIN'))
+        if not is_admin:
+            for name in [name for name in self.filters if name.startswith('costo_cg')]:
+                del self.filters[name]
+
+
+class ProductHistoryFilter(django_filters.FilterSet):
+    """
+    Feed de auditoría: ?product=<id>, ?user=<id>, ?history_type=+|~|-,
+    ?date_from=2025-01-01&date_to=2025-01-31 (fechas o fecha-hora ISO).
+    """
+    product = django_filters.NumberFilter(field_name='id', label='Producto')
+    user = django_filters.NumberFilter(field_name='history_user', label='Usuario')
+    history_type = django_filters.ChoiceFilter(choices=[('+', 'Creado'), ('~', 'Editado'), ('-', 'Borrado')])
+    date_from = django_filters.IsoDateTimeFilter(field_name='history_date', lookup_expr='gte')
+    date_to = django_filters.IsoDateTimeFilter(field_name='history_date', lookup_expr='lte')
+
+    class Meta:
+        model = Product.history.model
+        fields = ['product', 'user', 'history_type', 'date_from', 'date_to']
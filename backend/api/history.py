@@ -0,0 +1,121 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+
+from .models import Product
+
+HistoricalProduct = Product.history.model
+
+# Campos que se comparan entre revisiones (las FK se muestran por su nombre)
+DIFF_FIELDS = (
+    'nombre_comercial', 'ean', 'sku', 'brand', 'category', 'provider',
+    'peso', 'dimensiones', 'descripcion', 'costo_cg', 'precio_venta',
+    'lugar_bodega', 'edad_uso', 'stock', 'rating', 'is_active',
+)
+RELATED_FIELDS = ('brand', 'category', 'provider')
+
+# Columnas de la foto del catálogo a una fecha (/api/products/as-of/)
+AS_OF_FIELDS = (
+    'id', 'history_id', 'history_date', 'nombre_comercial', 'ean', 'sku',
+    'precio_venta', 'costo_cg', 'stock', 'lugar_bodega', 'is_active',
+)
+AS_OF_RELATED = {'brand_name': F('brand__name'), 'category_name': F('category__name'), 'provider_name': F('provider__name')}
+AS_OF_CHUNK_SIZE = 1000
+
+
+def _value(row, field):
+    if field in RELATED_FIELDS:
+        related = getattr(row, field)
+        return related.name if related else None
+    return getattr(row, field)
+
+
+def with_previous_revision(queryset):
+    """
+    Anota previous_id: la revisión anterior del mismo producto, la más nueva
+    antes de (history_date, history_id) de cada fila. Es una subconsulta
+    correlacionada sobre el índice (id, history_date), así que se evalúa solo
+    para las filas de la página y cuesta lo mismo aunque el historial crezca.
+    """
+    earlier = HistoricalProduct.objects.filter(id=OuterRef('id')).filter(
+        Q(history_date__lt=OuterRef('history_date'))
+        | Q(history_date=OuterRef('history_date'), history_id__lt=OuterRef('history_id'))
+    ).order_by('-history_date', '-history_id').values('history_id')[:1]
+    return queryset.annotate(previous_id=Subquery(earlier))
+
+
+def previous_revisions(rows):
+    """
+    {history_id: revisión anterior del mismo producto} para una página ya
+    anotada con with_previous_revision(): se cargan por clave primaria.
+    """
+    previous = HistoricalProduct.objects.select_related(*RELATED_FIELDS).in_bulk(
+        {row.previous_id for row in rows if row.previous_id}
+    )
+    return {row.history_id: previous[row.previous_id] for row in rows if row.previous_id}
+
+
+def revision_diffs(rows):
+    """
+    Una entrada por revisión con solo los campos que cambiaron respecto de la
+    anterior: [{'field', 'old', 'new'}]. Las creaciones y borrados van sin cambios.
+    `rows` viene de un queryset pasado por with_previous_revision().
+    """
+    previous = previous_revisions(rows)
+    result = []
+    for row in rows:
+        before = previous.get(row.history_id)
+        changes = []
+        if row.history_type == '~' and before is not None:
+            for field in DIFF_FIELDS:
+                old, new = _value(before, field), _value(row, field)
+                if old != new:
+                    changes.append({'field': field, 'old': old, 'new': new})
+        result.append({
+            'history_id': row.history_id,
+            'history_date': row.history_date,
+            'history_type': row.history_type,
+            'history_user': str(row.history_user) if row.history_user else None,
+            'history_change_reason': row.history_change_reason,
+            'product': row.id,
+            'nombre_comercial': row.nombre_comercial,
+            'sku': row.sku,
+            'changes': changes,
+        })
+    return result
+
+
+def catalog_as_of(when, queryset=None):
+    """
+    Estado de cada producto en `when`: su última revisión con fecha <= when,
+    sin los productos que ya estaban borrados. Una sola consulta por conjuntos
+    (NOT EXISTS una revisión posterior del mismo producto), resuelta con el
+    índice (id, history_date) en lugar de una búsqueda por producto.
+    """
+    if queryset is None:
+        queryset = HistoricalProduct.objects.all()
+    later = HistoricalProduct.objects.filter(id=OuterRef('id'), history_date__lte=when).filter(
+        Q(history_date__gt=OuterRef('history_date'))
+        | Q(history_date=OuterRef('history_date'), history_id__gt=OuterRef('history_id'))
+    )
+    return queryset.filter(history_date__lte=when).filter(~Exists(later)).exclude(history_type='-')
+
+
+def as_of_page(queryset, after=0, limit=AS_OF_CHUNK_SIZE):
+    """Una página por clave (id > after), así cada página cuesta lo mismo."""
+    return list(queryset.filter(id__gt=after).order_by('id').values(*AS_OF_FIELDS, **AS_OF_RELATED)[:limit])
+
+
+async def stream_as_of_ndjson(queryset):
+    """
+    Iterador asíncrono NDJSON (un producto por línea) que recorre el catálogo
+    por páginas: cada página se consulta con sync_to_async y se envía antes de
+    pedir la siguiente (bajo ASGI un generador síncrono se acumularía entero).
+    """
+    after = 0
+    fetch = sync_to_async(as_of_page)
+    while rows := await fetch(queryset, after):
+        yield ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+        after = rows[-1]['id']
@@ -0,0 +1,208 @@
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction, connection
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import ProductImage
+from .storage import product_image_storage
+
+logger = logging.getLogger(__name__)
+
+# Anchos (px) de las variantes: tarjeta del grid, modal y pantallas densas
+DERIVATIVE_WIDTHS = (160, 320, 640, 1024)
+DERIVATIVE_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+DERIVATIVES_DIR = 'product_images/derivatives'
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+NORMALIZE_OPTIONS = {
+    'JPEG': {'quality': 88, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 85},
+}
+
+# Subida por lotes (ProductImageViewSet.batch)
+BATCH_MAX_IMAGES = 20
+UPLOAD_WORKERS = 4
+
+# Tope global de Pillow contra bombas de descompresión (también en los hilos de fondo)
+Image.MAX_IMAGE_PIXELS = settings.IMAGE_MAX_PIXELS
+
+# Pillow libera el GIL al decodificar, redimensionar y codificar: unos pocos
+# hilos bastan para no bloquear las peticiones que suben imágenes.
+_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS, thread_name_prefix='derivatives')
+
+
+def inspect_image(file):
+    """
+    Valida una imagen subida leyendo solo su cabecera (Pillow no decodifica
+    píxeles al abrir): formato, dimensiones y cantidad de píxeles. Lanza
+    ValueError con el motivo. La decodificación completa ocurre después,
+    fuera de la petición (normalize_original / build_derivatives).
+    """
+    if file.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+        raise ValueError(f"El archivo pesa {file.size / 1024 / 1024:.1f} MB; el máximo es {settings.IMAGE_MAX_UPLOAD_SIZE / 1024 / 1024:.0f} MB.")
+    try:
+        with Image.open(file) as img:
+            fmt, (width, height) = img.format, img.size
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"No es una imagen válida: {e}")
+    finally:
+        file.seek(0)
+
+    if fmt not in ALLOWED_FORMATS:
+        raise ValueError(f"Formato {fmt} no permitido. Use {', '.join(ALLOWED_FORMATS)}.")
+    if max(width, height) > settings.IMAGE_MAX_DIMENSION:
+        raise ValueError(f"La imagen mide {width}x{height}; el lado máximo es {settings.IMAGE_MAX_DIMENSION} px.")
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValueError(f"La imagen tiene {width * height / 1e6:.1f} MP; el máximo es {settings.IMAGE_MAX_PIXELS / 1e6:.0f} MP.")
+    return fmt, width, height
+
+
+def normalize_original(name, storage=product_image_storage):
+    """
+    Reduce el original a IMAGE_NORMALIZE_MAX_DIMENSION y aplica la orientación
+    EXIF (descartando el resto de metadatos). Devuelve el nombre del archivo
+    normalizado, o `name` si no hacía falta tocarlo.
+    """
+    limit = settings.IMAGE_NORMALIZE_MAX_DIMENSION
+    with storage.open(name, 'rb') as fh:
+        img = Image.open(fh)
+        fmt = img.format
+        orientation = img.getexif().get(0x0112, 1)
+        if fmt not in NORMALIZE_OPTIONS or (max(img.size) <= limit and orientation == 1):
+            return name
+        # JPEG: se decodifica ya reducido, la memoria no depende del tamaño original
+        img.draft(img.mode, (limit, limit))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((limit, limit), Image.LANCZOS)
+    if fmt == 'JPEG' and img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **NORMALIZE_OPTIONS[fmt])
+    upload_to = ProductImage._meta.get_field('image').upload_to
+    return storage.save(f"{upload_to}{os.path.basename(name)}", ContentFile(buffer.getvalue()))
+
+
+def build_derivatives(name, storage=product_image_storage):
+    """
+    Genera las variantes de la imagen `name` (ruta en el storage) y devuelve
+    {'source', 'width', 'height', 'webp': {ancho: ruta}, 'jpeg': {ancho: ruta}}.
+    No toca la base de datos, así se puede usar desde otros procesos.
+    """
+    with storage.open(name, 'rb') as fh:
+        img = Image.open(fh)
+        # JPEG: se decodifica ya reducido (DCT) al tamaño más grande necesario
+        img.draft('RGB', (max(DERIVATIVE_WIDTHS), max(DERIVATIVE_WIDTHS)))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    source_width, source_height = img.size
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+
+    # Nunca se agranda: si la imagen es chica, una sola variante a su ancho real
+    widths = [w for w in DERIVATIVE_WIDTHS if w < source_width] or [source_width]
+    stem = os.path.splitext(os.path.basename(name))[0]
+    result = {'source': name, 'width': source_width, 'height': source_height}
+    for fmt in DERIVATIVE_FORMATS:
+        result[fmt] = {}
+
+    # De mayor a menor: cada variante se reduce desde la anterior, no desde el original
+    current = img
+    for width in sorted(widths, reverse=True):
+        height = max(1, round(source_height * width / source_width))
+        current = current.resize((width, height), Image.LANCZOS, reducing_gap=2.0)
+        for fmt, options in DERIVATIVE_FORMATS.items():
+            frame = current.convert('RGB') if fmt == 'jpeg' and current.mode != 'RGB' else current
+            buffer = io.BytesIO()
+            frame.save(buffer, **options)
+            path = storage.save(f"{DERIVATIVES_DIR}/{stem}_{width}w.{fmt}", ContentFile(buffer.getvalue()))
+            result[fmt][str(width)] = path
+    return result
+
+
+def derivative_paths(derivatives):
+    return {path for fmt in DERIVATIVE_FORMATS for path in (derivatives or {}).get(fmt, {}).values()}
+
+
+def save_derivatives(pk, name, derivatives):
+    """
+    Guarda las variantes solo si la imagen sigue siendo la misma; si fue
+    reemplazada mientras se generaban, se descartan. Los archivos que quedan
+    sin referencia los borra gc_media.
+    """
+    return bool(ProductImage.objects.filter(pk=pk, image=name).update(derivatives=derivatives))
+
+
+def generate_derivatives(pk):
+    """Tarea de fondo tras subir una imagen: normaliza el original y genera las variantes."""
+    try:
+        name = ProductImage.objects.filter(pk=pk).values_list('image', flat=True).first()
+        if not name:
+            return
+        normalized = normalize_original(name)
+        if normalized != name:
+            # Solo si nadie reemplazó la imagen mientras tanto; el archivo que sobre lo borra gc_media
+            if not ProductImage.objects.filter(pk=pk, image=name).update(image=normalized):
+                return
+            name = normalized
+        save_derivatives(pk, name, build_derivatives(name))
+    except Exception:
+        logger.exception("Error generando variantes de la imagen %s", pk)
+    finally:
+        # Hilo del pool: no dejar conexiones abiertas entre tareas
+        connection.close()
+
+
+def srcset(derivatives, fmt, url=lambda path: product_image_storage.url(path)):
+    """'url 160w, url 320w, ...' listo para el atributo srcset del navegador."""
+    variants = (derivatives or {}).get(fmt) or {}
+    return ', '.join(f"{url(path)} {width}w" for width, path in sorted(variants.items(), key=lambda item: int(item[0])))
+
+
+def enqueue_derivatives(pks):
+    """Encola la tarea de fondo de cada imagen al confirmarse la transacción."""
+    pks = list(pks)
+    transaction.on_commit(lambda: [_executor.submit(generate_derivatives, pk) for pk in pks])
+
+
+def validate_uploads(files):
+    """Valida en paralelo (solo cabeceras). Devuelve {nombre de archivo: motivo} con los inválidos."""
+    def check(file):
+        try:
+            inspect_image(file)
+        except ValueError as e:
+            return str(e)
+        return None
+
+    with ThreadPoolExecutor(max_workers=min(len(files), UPLOAD_WORKERS)) as pool:
+        results = list(pool.map(check, files))
+    return {file.name: error for file, error in zip(files, results) if error}
+
+
+def store_uploads(files):
+    """Guarda en paralelo (hash + escritura); devuelve los nombres en el mismo orden."""
+    upload_to = ProductImage._meta.get_field('image').upload_to
+
+    def store(file):
+        return product_image_storage.save(f"{upload_to}{os.path.basename(file.name)}", file)
+
+    with ThreadPoolExecutor(max_workers=min(len(files), UPLOAD_WORKERS)) as pool:
+        return list(pool.map(store, files))
+
+
+@receiver(post_save, sender=ProductImage)
+def schedule_derivatives(sender, instance, **kwargs):
+    # Las variantes recuerdan de qué archivo salieron: solo se regeneran si cambió
+    if instance.image and (instance.derivatives or {}).get('source') != instance.image.name:
+        enqueue_derivatives([instance.pk])
@@ -0,0 +1,110 @@
+import threading
+
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product
+
+# Campos mínimos que necesita un escáner de bodega
+LOOKUP_FIELDS = ('id', 'nombre_comercial', 'ean', 'sku', 'stock', 'lugar_bodega')
+
+
+class CodeIndex:
+    """
+    Índice en memoria EAN/SKU -> id de producto.
+
+    Solo guarda el id: el stock siempre se lee de la base de datos por clave
+    primaria, así que nunca se entrega un stock viejo. Si otro proceso cambió
+    un código, la fila leída no coincide y se cae a la consulta por código.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = {}     # código -> id
+        self._by_pk = {}     # id -> (ean, sku), para borrar códigos antiguos
+        self._warm = False
+
+    def warm(self):
+        with self._lock:
+            if self._warm:
+                return
+            rows = Product.objects.filter(is_active=True).values_list('pk', 'ean', 'sku').iterator(chunk_size=5000)
+            for pk, ean, sku in rows:
+                self._put(pk, ean, sku)
+            self._warm = True
+
+    def _put(self, pk, ean, sku):
+        self._drop(pk)
+        self._codes[ean] = pk
+        self._codes[sku] = pk
+        self._by_pk[pk] = (ean, sku)
+
+    def _drop(self, pk):
+        for code in self._by_pk.pop(pk, ()):
+            if self._codes.get(code) == pk:
+                del self._codes[code]
+
+    def update(self, product):
+        if not self._warm:
+            return
+        with self._lock:
+            if product.is_active:
+                self._put(product.pk, product.ean, product.sku)
+            else:
+                self._drop(product.pk)
+
+    def remove(self, pk):
+        if not self._warm:
+            return
+        with self._lock:
+            self._drop(pk)
+
+    def resolve(self, codes, queryset=None):
+        """
+        Devuelve {código: payload o None}. Máximo dos consultas por lote:
+        una por clave primaria para los aciertos y otra por código para los fallos.
+        `queryset` acota la búsqueda (ej: a la empresa del usuario).
+        """
+        if queryset is None:
+            queryset = Product.objects.all()
+        queryset = queryset.filter(is_active=True)
+        self.warm()
+        codes = list(dict.fromkeys(codes))
+        result = dict.fromkeys(codes)
+
+        pks = {code: self._codes.get(code) for code in codes}
+        found = {row['id']: row for row in queryset.filter(
+            pk__in=[pk for pk in pks.values() if pk]
+        ).values(*LOOKUP_FIELDS)}
+
+        missing = []
+        for code, pk in pks.items():
+            row = found.get(pk)
+            if row and code in (row['ean'], row['sku']):
+                result[code] = row
+            else:
+                missing.append(code)
+
+        if missing:
+            rows = queryset.filter(Q(ean__in=missing) | Q(sku__in=missing)).values(*LOOKUP_FIELDS)
+            for row in rows:
+                with self._lock:
+                    self._put(row['id'], row['ean'], row['sku'])
+                for code in (row['ean'], row['sku']):
+                    if code in result:
+                        result[code] = row
+        return result
+
+
+code_index = CodeIndex()
+
+
+@receiver(post_save, sender=Product)
+def update_code_index(sender, instance, **kwargs):
+    code_index.update(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_code_index(sender, instance, **kwargs):
+    code_index.remove(instance.pk)
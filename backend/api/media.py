@@ -0,0 +1,131 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+# Los archivos guardados por contenido (api/storage.py) llevan el sha256 en el
+# nombre: su URL cambia si cambia el contenido, así que se pueden cachear para siempre.
+HASHED_NAME = re.compile(r'(?:^|/)([0-9a-f]{64})(?:\.[a-z0-9]+)?$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+MUTABLE_CACHE = 'public, max-age=3600'
+RANGE_CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_etag(path, stat):
+    match = HASHED_NAME.search(path)
+    if match:
+        return f'"{match.group(1)}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """Un solo rango 'bytes=a-b' -> (inicio, fin) inclusive; None si no aplica o es inválido."""
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # bytes=-N: los últimos N bytes
+        length = int(end)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        return None
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Entrega archivos de MEDIA_ROOT con validadores (ETag, Last-Modified),
+    304 para If-None-Match y rangos de bytes (206).
+
+    Según settings.MEDIA_DELIVERY el cuerpo lo envía:
+      - 'x-accel':    nginx (X-Accel-Redirect a MEDIA_ACCEL_PREFIX + ruta), default en producción
+      - 'x-sendfile': Apache/lighttpd (X-Sendfile con la ruta absoluta)
+      - 'django':     el cuerpo pasa por Python. Solo para desarrollo: bajo el
+                      servidor ASGI (start.sh) no hay wsgi.file_wrapper ni sendfile()
+                      y la respuesta se lee completa en memoria antes de enviarse
+    En los dos primeros modos Python solo arma las cabeceras.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (ValueError, OSError):
+        raise Http404("Archivo no encontrado")
+    if not os.path.isfile(full_path):
+        raise Http404("Archivo no encontrado")
+
+    etag = media_etag(path, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE_CACHE if HASHED_NAME.search(path) else MUTABLE_CACHE,
+        'Accept-Ranges': 'bytes',
+    }
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    mode = settings.MEDIA_DELIVERY
+
+    if mode in ('x-accel', 'x-sendfile'):
+        # El servidor frontal resuelve rangos y envía el archivo sin pasar por Python
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + path.lstrip('/')
+        else:
+            response['X-Sendfile'] = full_path
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        byte_range = parse_range(range_header, stat.st_size)
+        if byte_range is None and _RANGE.match(range_header.strip()):
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{stat.st_size}"
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_read_range(full_path, start, length), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+        response['Content-Length'] = str(length)
+    else:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for name, value in headers.items():
+        response[name] = value
+    return response
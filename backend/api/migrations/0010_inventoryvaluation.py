@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_brand_is_active_category_is_active_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('brand', 'Marca'), ('category', 'Categoría'), ('provider', 'Proveedor'), ('lugar_bodega', 'Lugar en Bodega')], max_length=20, verbose_name='Dimensión')),
+                ('key', models.CharField(max_length=50, verbose_name='Clave')),
+                ('label', models.CharField(max_length=200, verbose_name='Nombre')),
+                ('productos', models.PositiveIntegerField(default=0, verbose_name='Productos')),
+                ('unidades', models.PositiveBigIntegerField(default=0, verbose_name='Unidades en Stock')),
+                ('valor_costo', models.DecimalField(decimal_places=0, default=0, max_digits=20, verbose_name='Valor a Costo (CLP)')),
+                ('valor_venta', models.DecimalField(decimal_places=0, default=0, max_digits=20, verbose_name='Valor a Precio de Venta (CLP)')),
+                ('computed_at', models.DateTimeField(verbose_name='Calculado en')),
+            ],
+            options={
+                'verbose_name': 'Valorización de Inventario',
+                'verbose_name_plural': 'Valorizaciones de Inventario',
+                'ordering': ['dimension', '-valor_venta'],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='unique_valuation_dimension_key')],
+            },
+        ),
+    ]
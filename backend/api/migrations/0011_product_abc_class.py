@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_inventoryvaluation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='abc_class',
+            field=models.CharField(choices=[('A', 'A (Alta rotación)'), ('B', 'B (Rotación media)'), ('C', 'C (Baja rotación)')], db_index=True, default='C', max_length=1, verbose_name='Clase ABC'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ventas_unidades',
+            field=models.PositiveIntegerField(default=0, verbose_name='Unidades Vendidas (Periodo)'),
+        ),
+    ]
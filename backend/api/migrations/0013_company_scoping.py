@@ -0,0 +1,179 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_single_company(apps, schema_editor):
+    """
+    Si la base tiene una sola empresa, los datos existentes le pertenecen.
+    Con varias (o ninguna) se dejan sin empresa para asignarlos a mano.
+    """
+    Company = apps.get_model('companies', 'Company')
+    companies = list(Company.objects.values_list('pk', flat=True)[:2])
+    if len(companies) != 1:
+        return
+    for model_name in (
+        'Brand', 'Category', 'Provider', 'Product', 'StockMovement',
+        # El historial también: el feed y /products/as-of/ filtran por empresa
+        'HistoricalBrand', 'HistoricalCategory', 'HistoricalProvider', 'HistoricalProduct',
+    ):
+        apps.get_model('api', model_name).objects.filter(company__isnull=True).update(company_id=companies[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_product_range_indexes'),
+        ('companies', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='inventoryvaluation',
+            name='unique_valuation_dimension_key',
+        ),
+        migrations.AddField(
+            model_name='brand',
+            name='company',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='company',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='historicalbrand',
+            name='company',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='historicalcategory',
+            name='company',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='historicalproduct',
+            name='company',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='historicalprovider',
+            name='company',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='inventoryvaluation',
+            name='company',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='company',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='company',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='company',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa'),
+        ),
+        migrations.AlterField(
+            model_name='brand',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Nombre de la Marca'),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Nombre de la Categoría'),
+        ),
+        migrations.AlterField(
+            model_name='historicalbrand',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Nombre de la Marca'),
+        ),
+        migrations.AlterField(
+            model_name='historicalcategory',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Nombre de la Categoría'),
+        ),
+        migrations.AlterField(
+            model_name='historicalprovider',
+            name='name',
+            field=models.CharField(max_length=200, verbose_name='Nombre del Proveedor'),
+        ),
+        migrations.AlterField(
+            model_name='provider',
+            name='name',
+            field=models.CharField(max_length=200, verbose_name='Nombre del Proveedor'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'is_active', 'nombre_comercial'], name='product_co_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'brand'], name='product_co_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'category'], name='product_co_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'provider'], name='product_co_provider_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['company', 'stock'], name='product_co_active_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['company', 'updated_at'], name='product_co_active_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['company', '-created_at'], name='movement_co_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['company', 'product', '-created_at'], name='movement_co_product_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='brand',
+            constraint=models.UniqueConstraint(fields=('company', 'name'), name='unique_brand_company_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='brand',
+            constraint=models.UniqueConstraint(condition=models.Q(('company__isnull', True)), fields=('name',), name='unique_brand_name_no_company'),
+        ),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(fields=('company', 'name'), name='unique_category_company_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(condition=models.Q(('company__isnull', True)), fields=('name',), name='unique_category_name_no_company'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventoryvaluation',
+            constraint=models.UniqueConstraint(fields=('company', 'dimension', 'key'), name='unique_valuation_co_dimension_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='provider',
+            constraint=models.UniqueConstraint(fields=('company', 'name'), name='unique_provider_company_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='provider',
+            constraint=models.UniqueConstraint(condition=models.Q(('company__isnull', True)), fields=('name',), name='unique_provider_name_no_company'),
+        ),
+        migrations.RunPython(assign_single_company, migrations.RunPython.noop),
+    ]
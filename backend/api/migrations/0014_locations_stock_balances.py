@@ -0,0 +1,102 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_locations(apps, schema_editor):
+    """
+    Crea una ubicación por cada lugar_bodega distinto, deja todo el stock
+    actual de cada producto en esa ubicación y le asigna los movimientos previos.
+    """
+    Location = apps.get_model('api', 'Location')
+    StockBalance = apps.get_model('api', 'StockBalance')
+    Product = apps.get_model('api', 'Product')
+    StockMovement = apps.get_model('api', 'StockMovement')
+
+    locations = {}
+    balances = []
+    for product in Product.objects.only('pk', 'company_id', 'lugar_bodega', 'stock').iterator(chunk_size=2000):
+        key = (product.company_id, product.lugar_bodega)
+        if key not in locations:
+            locations[key], _ = Location.objects.get_or_create(
+                company_id=product.company_id, code=product.lugar_bodega,
+                defaults={'name': product.lugar_bodega},
+            )
+        location = locations[key]
+        if product.stock:
+            balances.append(StockBalance(product_id=product.pk, location_id=location.pk, quantity=product.stock))
+        StockMovement.objects.filter(product_id=product.pk, location__isnull=True).update(location_id=location.pk)
+    StockBalance.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_company_scoping'),
+        ('companies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='movement_type',
+            field=models.CharField(choices=[('IN', 'Entrada (Compra/Devolución)'), ('OUT', 'Salida (Venta/Merma)'), ('TRF', 'Traspaso entre Ubicaciones')], max_length=3, verbose_name='Tipo'),
+        ),
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, verbose_name='Código')),
+                ('name', models.CharField(max_length=100, verbose_name='Nombre')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Activa / Visible')),
+                ('company', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Ubicación',
+                'verbose_name_plural': 'Ubicaciones',
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='destination',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='incoming_transfers', to='api.location', verbose_name='Ubicación Destino (Traspasos)'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='api.location', verbose_name='Ubicación'),
+        ),
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Cantidad')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Actualizado en')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='balances', to='api.location', verbose_name='Ubicación')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='api.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Saldo por Ubicación',
+                'verbose_name_plural': 'Saldos por Ubicación',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='location',
+            constraint=models.UniqueConstraint(fields=('company', 'code'), name='unique_location_company_code'),
+        ),
+        migrations.AddConstraint(
+            model_name='location',
+            constraint=models.UniqueConstraint(condition=models.Q(('company__isnull', True)), fields=('code',), name='unique_location_code_no_company'),
+        ),
+        migrations.AddIndex(
+            model_name='stockbalance',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['location', 'product'], name='balance_location_avail_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockbalance',
+            constraint=models.UniqueConstraint(fields=('product', 'location'), name='unique_balance_product_location'),
+        ),
+        migrations.RunPython(backfill_locations, migrations.RunPython.noop),
+    ]
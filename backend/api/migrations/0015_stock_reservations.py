@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:55
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_locations_stock_balances'),
+        ('companies', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, verbose_name='Reservado'),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Cantidad')),
+                ('status', models.CharField(choices=[('ACTIVE', 'Activa'), ('CONVERTED', 'Convertida en Venta'), ('EXPIRED', 'Expirada'), ('CANCELLED', 'Cancelada')], default='ACTIVE', max_length=10, verbose_name='Estado')),
+                ('reason', models.CharField(blank=True, max_length=255, verbose_name='Cliente/Motivo')),
+                ('expires_at', models.DateTimeField(verbose_name='Vence en')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creada en')),
+                ('company', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa')),
+                ('movement', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reservation', to='api.stockmovement', verbose_name='Movimiento de Venta')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='reservations', to='api.product', verbose_name='Producto')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='Usuario Responsable')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Stock',
+                'verbose_name_plural': 'Reservas de Stock',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['expires_at'], name='reservation_active_exp_idx'), models.Index(fields=['company', 'status', '-created_at'], name='reservation_co_status_idx')],
+            },
+        ),
+    ]
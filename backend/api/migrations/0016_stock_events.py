@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_stock_reservations'),
+        ('companies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('product_id', models.PositiveIntegerField()),
+                ('stock', models.IntegerField()),
+                ('reserved', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('company', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company')),
+            ],
+            options={
+                'verbose_name': 'Evento de Stock',
+                'verbose_name_plural': 'Eventos de Stock',
+                'indexes': [models.Index(fields=['company', 'id'], name='stockevent_co_seq_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:00
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_productimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=api.storage.get_product_image_storage, upload_to='product_images/', verbose_name='Imagen'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['image'], name='productimage_image_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_imagen_principal(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    ProductImage = apps.get_model('api', 'ProductImage')
+    first = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_principal', 'id').values('pk')[:1]
+    Product.objects.update(imagen_principal=Subquery(first))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='imagen_principal',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.productimage', verbose_name='Imagen Principal'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['product', '-is_principal', 'id'], name='productimage_product_idx'),
+        ),
+        migrations.RunPython(backfill_imagen_principal, migrations.RunPython.noop),
+    ]
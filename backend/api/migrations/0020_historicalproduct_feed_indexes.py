@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_product_imagen_principal'),
+        ('companies', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicalproduct',
+            index=models.Index(fields=['company', '-history_date', '-history_id'], name='hproduct_co_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalproduct',
+            index=models.Index(fields=['id', '-history_date'], name='hproduct_id_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalproduct',
+            index=models.Index(fields=['history_user', '-history_date'], name='hproduct_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_historicalproduct_feed_indexes'),
+        ('companies', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeactivationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(choices=[('brand', 'Marca'), ('category', 'Categoría'), ('provider', 'Proveedor')], max_length=10, verbose_name='Tipo')),
+                ('target_id', models.PositiveIntegerField(verbose_name='Id')),
+                ('target_name', models.CharField(max_length=200, verbose_name='Nombre')),
+                ('status', models.CharField(choices=[('PENDING', 'Pendiente'), ('RUNNING', 'En Proceso'), ('DONE', 'Terminado'), ('FAILED', 'Fallido')], default='PENDING', max_length=10, verbose_name='Estado')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Productos')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Procesados')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creado en')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Terminado en')),
+                ('company', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company', verbose_name='Empresa')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuario Responsable')),
+            ],
+            options={
+                'verbose_name': 'Descontinuación en Cascada',
+                'verbose_name_plural': 'Descontinuaciones en Cascada',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['company', '-created_at'], name='deactivationjob_co_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Sin backfill: la firma depende del código vivo de api.duplicates, que puede
+# cambiar después de esta migración. Al desplegar, los productos existentes se
+# indexan con `python manage.py find_duplicates --reindex` (ver build.sh).
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_deactivation_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSignature',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='api.product', verbose_name='Producto')),
+                ('minhash', models.BinaryField(verbose_name='Firma MinHash')),
+            ],
+            options={
+                'verbose_name': 'Firma de Producto',
+                'verbose_name_plural': 'Firmas de Productos',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(verbose_name='Llave')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='api.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Banda LSH',
+                'verbose_name_plural': 'Bandas LSH',
+                'indexes': [models.Index(fields=['key', 'product'], name='productband_key_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_history_company(apps, schema_editor):
+    """
+    0013 no asignaba empresa al historial anterior. Cada revisión toma la
+    empresa de su objeto; las de objetos ya borrados siguen la misma regla
+    de 0013 (si hay una sola empresa, es de ella).
+    """
+    Company = apps.get_model('companies', 'Company')
+    companies = list(Company.objects.values_list('pk', flat=True)[:2])
+    for model_name in ('Brand', 'Category', 'Provider', 'Product'):
+        model = apps.get_model('api', model_name)
+        history = apps.get_model('api', f'Historical{model_name}').objects.filter(company__isnull=True)
+        history.update(company_id=Subquery(model.objects.filter(pk=OuterRef('id')).values('company_id')[:1]))
+        if len(companies) == 1:
+            history.exclude(id__in=model.objects.values('pk')).update(company_id=companies[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_product_similarity_index'),
+        ('companies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_history_company, migrations.RunPython.noop),
+    ]
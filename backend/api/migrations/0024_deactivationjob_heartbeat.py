@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_backfill_history_company'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deactivationjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Último avance'),
+        ),
+    ]
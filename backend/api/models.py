@@ -3,13 +3,30 @@ from simple_history.models import HistoricalRecords
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
-from django.db.models.signals import post_delete, pre_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-import os
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from collections import defaultdict
+from .storage import get_product_image_storage
+
+
+class IndexedHistoricalRecords(HistoricalRecords):
+    """HistoricalRecords que acepta índices extra para la tabla de historial."""
+
+    def __init__(self, *args, indexes=(), **kwargs):
+        self.indexes = list(indexes)
+        super().__init__(*args, **kwargs)
+
+    def get_meta_options(self, model):
+        meta_fields = super().get_meta_options(model)
+        meta_fields['indexes'] = [*meta_fields.get('indexes', ()), *self.indexes]
+        return meta_fields
 
 class Brand(models.Model):
-    name = models.CharField(max_length=100, unique=True, verbose_name=_("Nombre de la Marca"))
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
+    name = models.CharField(max_length=100, verbose_name=_("Nombre de la Marca"))
     is_active = models.BooleanField(default=True, verbose_name="Activa / Visible")
     history = HistoricalRecords()
 
@@ -20,9 +37,15 @@ class Brand(models.Model):
         verbose_name = _("Marca")
         verbose_name_plural = _("Marcas")
         ordering = ['name']
+        # El nombre es único por empresa (y entre los registros sin empresa)
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'name'], name='unique_brand_company_name'),
+            models.UniqueConstraint(fields=['name'], condition=models.Q(company__isnull=True), name='unique_brand_name_no_company'),
+        ]
 
 class Category(models.Model):
-    name = models.CharField(max_length=100, unique=True, verbose_name=_("Nombre de la Categoría"))
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
+    name = models.CharField(max_length=100, verbose_name=_("Nombre de la Categoría"))
     is_active = models.BooleanField(default=True, verbose_name="Activa / Visible")
     history = HistoricalRecords()
 
@@ -33,9 +56,15 @@ class Category(models.Model):
         verbose_name = _("Categoría")
         verbose_name_plural = _("Categorías")
         ordering = ['name']
+        # El nombre es único por empresa (y entre los registros sin empresa)
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'name'], name='unique_category_company_name'),
+            models.UniqueConstraint(fields=['name'], condition=models.Q(company__isnull=True), name='unique_category_name_no_company'),
+        ]
 
 class Provider(models.Model):
-    name = models.CharField(max_length=200, unique=True, verbose_name=_("Nombre del Proveedor"))
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
+    name = models.CharField(max_length=200, verbose_name=_("Nombre del Proveedor"))
     is_active = models.BooleanField(default=True, verbose_name="Activa / Visible")
     history = HistoricalRecords()
 
@@ -46,9 +75,21 @@ class Provider(models.Model):
         verbose_name = _("Proveedor")
         verbose_name_plural = _("Proveedores")
         ordering = ['name']
+        # El nombre es único por empresa (y entre los registros sin empresa)
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'name'], name='unique_provider_company_name'),
+            models.UniqueConstraint(fields=['name'], condition=models.Q(company__isnull=True), name='unique_provider_name_no_company'),
+        ]
 
 class Product(models.Model):
+    ABC_CLASSES = (
+        ('A', 'A (Alta rotación)'),
+        ('B', 'B (Rotación media)'),
+        ('C', 'C (Baja rotación)'),
+    )
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
     nombre_comercial = models.CharField(max_length=255, verbose_name=_("Nombre Comercial"))
     brand = models.ForeignKey(Brand, on_delete=models.PROTECT, verbose_name=_("Marca"))
     ean = models.CharField(max_length=13, unique=True, verbose_name=_("EAN"))
@@ -67,15 +108,72 @@ class Product(models.Model):
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0, verbose_name=_("Rating"), validators=[MinValueValidator(0), MaxValueValidator(5)])
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Creado en"))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Actualizado en"))
+    # Calculados por el job classify_abc (api.analytics.classify_abc)
+    abc_class = models.CharField(max_length=1, choices=ABC_CLASSES, default='C', db_index=True, verbose_name=_("Clase ABC"))
+    ventas_unidades = models.PositiveIntegerField(default=0, verbose_name=_("Unidades Vendidas (Periodo)"))
+    # Contador de unidades en reservas activas (lo mantiene StockReservation)
+    reserved = models.PositiveIntegerField(default=0, verbose_name=_("Reservado"))
+    # Imagen a mostrar en listados (la principal o la primera); la mantiene sync_imagen_principal
+    imagen_principal = models.ForeignKey('ProductImage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', editable=False, verbose_name=_("Imagen Principal"))
 
-    history = HistoricalRecords()
+    # Los campos derivados no ensucian el historial
+    # Índices del feed de auditoría (ProductHistoryViewSet): empresa, producto y usuario, por fecha
+    history = IndexedHistoricalRecords(
+        excluded_fields=['abc_class', 'ventas_unidades', 'reserved', 'imagen_principal'],
+        indexes=[
+            models.Index(fields=['company', '-history_date', '-history_id'], name='hproduct_co_date_idx'),
+            models.Index(fields=['id', '-history_date'], name='hproduct_id_date_idx'),
+            models.Index(fields=['history_user', '-history_date'], name='hproduct_user_date_idx'),
+        ],
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lugar con que se cargó: si cambia al guardar, el saldo lo sigue (ver save)
+        instance._lugar_bodega_db = instance.__dict__.get('lugar_bodega')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._lugar_bodega_db = self.__dict__.get('lugar_bodega')
+
+    def save(self, *args, **kwargs):
+        previous = getattr(self, '_lugar_bodega_db', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous is not None and previous != self.lugar_bodega:
+                transfer_default_balances({self.pk: previous}, self.user)
+        self._lugar_bodega_db = self.lugar_bodega
+
+    @property
+    def disponible(self):
+        """Disponible para vender: stock menos reservas activas."""
+        return max(0, self.stock - self.reserved)
 
     def recalcular_stock(self):
         """
         Suma todas las entradas y resta todas las salidas.
+        Reconstruye desde el historial el total y los saldos por ubicación;
+        los movimientos nuevos no lo usan (ver StockMovement.aplicar), solo
+        las correcciones de movimientos existentes.
         """
         entradas = self.movements.filter(movement_type='IN').aggregate(total=models.Sum('quantity'))['total'] or 0
         salidas = self.movements.filter(movement_type='OUT').aggregate(total=models.Sum('quantity'))['total'] or 0
+
+        saldos = defaultdict(int)
+        for location_id, destination_id, movement_type, quantity in self.movements.values_list('location', 'destination', 'movement_type', 'quantity'):
+            if movement_type == 'IN':
+                saldos[location_id] += quantity
+            else:
+                saldos[location_id] -= quantity
+                if movement_type == 'TRF':
+                    saldos[destination_id] += quantity
+        saldos.pop(None, None)
+
+        self.balances.exclude(location_id__in=saldos).update(quantity=0)
+        for location_id, quantity in saldos.items():
+            StockBalance.objects.update_or_create(product=self, location_id=location_id, defaults={'quantity': max(0, quantity)})
         
         # [CORRECCIÓN CRÍTICA] Usamos max(0, ...) para evitar números negativos 
         # que rompen la base de datos si el historial está desincronizado.
@@ -95,14 +193,34 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['ean']),
             models.Index(fields=['sku']),
+            # Listado por defecto: activos ordenados por nombre
+            models.Index(fields=['is_active', 'nombre_comercial'], name='product_active_name_idx'),
+            # Filtros por rango sobre el catálogo visible (índices parciales: solo activos)
+            models.Index(fields=['stock'], condition=models.Q(is_active=True), name='product_active_stock_idx'),
+            models.Index(fields=['precio_venta'], condition=models.Q(is_active=True), name='product_active_precio_idx'),
+            models.Index(fields=['costo_cg'], condition=models.Q(is_active=True), name='product_active_costo_idx'),
+            models.Index(fields=['peso'], condition=models.Q(is_active=True), name='product_active_peso_idx'),
+            models.Index(fields=['rating'], condition=models.Q(is_active=True), name='product_active_rating_idx'),
+            models.Index(fields=['updated_at'], condition=models.Q(is_active=True), name='product_active_updated_idx'),
+            # Multi-empresa: los índices parten por la empresa para que cada consulta
+            # recorra solo las filas de su tenant
+            models.Index(fields=['company', 'is_active', 'nombre_comercial'], name='product_co_active_name_idx'),
+            models.Index(fields=['company', 'brand'], name='product_co_brand_idx'),
+            models.Index(fields=['company', 'category'], name='product_co_category_idx'),
+            models.Index(fields=['company', 'provider'], name='product_co_provider_idx'),
+            models.Index(fields=['company', 'stock'], condition=models.Q(is_active=True), name='product_co_active_stock_idx'),
+            models.Index(fields=['company', 'updated_at'], condition=models.Q(is_active=True), name='product_co_active_updated_idx'),
         ]
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images', verbose_name=_("Producto"))
-    image = models.ImageField(upload_to='product_images/', verbose_name=_("Imagen"))
+    # Guardada por hash de contenido: subir dos veces la misma foto no la duplica
+    image = models.ImageField(upload_to='product_images/', storage=get_product_image_storage, verbose_name=_("Imagen"))
     is_principal = models.BooleanField(default=False, verbose_name=_("Es Principal"))
+    # Variantes redimensionadas (WebP/JPEG por ancho), generadas en segundo plano (ver api/images.py)
+    derivatives = models.JSONField(default=dict, blank=True, editable=False, verbose_name=_("Variantes"))
 
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=['derivatives'])
 
     def __str__(self):
         return f"Imagen de {self.product.nombre_comercial} ({'Principal' if self.is_principal else 'Adicional'})"
@@ -110,27 +228,172 @@ class ProductImage(models.Model):
     class Meta:
         verbose_name = _("Imagen de Producto")
         verbose_name_plural = _("Imágenes de Productos")
+        indexes = [
+            # Para saber si un archivo compartido sigue en uso antes de borrarlo
+            models.Index(fields=['image'], name='productimage_image_idx'),
+            # ?product= en el endpoint de imágenes, principal primero
+            models.Index(fields=['product', '-is_principal', 'id'], name='productimage_product_idx'),
+        ]
+
+class ProductSignature(models.Model):
+    """
+    Firma MinHash de un producto (ver api/duplicates.py). Se mantiene al
+    guardar el producto, así que los candidatos a duplicado se verifican sin
+    volver a firmar el catálogo.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='signature', verbose_name=_("Producto"))
+    minhash = models.BinaryField(verbose_name=_("Firma MinHash"))
+
+    class Meta:
+        verbose_name = _("Firma de Producto")
+        verbose_name_plural = _("Firmas de Productos")
+
+class ProductBand(models.Model):
+    """
+    Llaves de banda LSH de cada producto: dos productos que comparten una
+    llave son candidatos a duplicado.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bands', verbose_name=_("Producto"))
+    key = models.BigIntegerField(verbose_name=_("Llave"))
+
+    class Meta:
+        verbose_name = _("Banda LSH")
+        verbose_name_plural = _("Bandas LSH")
+        indexes = [
+            # Búsqueda de candidatos por llave, sin leer la tabla
+            models.Index(fields=['key', 'product'], name='productband_key_idx'),
+        ]
+
+class Location(models.Model):
+    """
+    Ubicación física de stock (bodega, pasillo, rack...). El código coincide
+    con Product.lugar_bodega para la ubicación por defecto de cada producto.
+    """
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
+    code = models.CharField(max_length=50, verbose_name=_("Código"))
+    name = models.CharField(max_length=100, verbose_name=_("Nombre"))
+    is_active = models.BooleanField(default=True, verbose_name="Activa / Visible")
+
+    @classmethod
+    def for_product(cls, product):
+        location, _ = cls.objects.get_or_create(
+            company_id=product.company_id, code=product.lugar_bodega,
+            defaults={'name': product.lugar_bodega},
+        )
+        return location
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = _("Ubicación")
+        verbose_name_plural = _("Ubicaciones")
+        ordering = ['code']
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'code'], name='unique_location_company_code'),
+            models.UniqueConstraint(fields=['code'], condition=models.Q(company__isnull=True), name='unique_location_code_no_company'),
+        ]
+
+class StockBalance(models.Model):
+    """
+    Saldo de un producto en una ubicación. Lo mantiene StockMovement al
+    guardarse; la suma de saldos de un producto es Product.stock.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='balances', verbose_name=_("Producto"))
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='balances', verbose_name=_("Ubicación"))
+    quantity = models.PositiveIntegerField(default=0, verbose_name=_("Cantidad"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Actualizado en"))
+
+    def __str__(self):
+        return f"{self.product.nombre_comercial} @ {self.location.code}: {self.quantity}"
+
+    class Meta:
+        verbose_name = _("Saldo por Ubicación")
+        verbose_name_plural = _("Saldos por Ubicación")
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'location'], name='unique_balance_product_location'),
+        ]
+        indexes = [
+            # Disponibilidad por ubicación: solo saldos con stock
+            models.Index(fields=['location', 'product'], condition=models.Q(quantity__gt=0), name='balance_location_avail_idx'),
+        ]
+
+class InsufficientStock(Exception):
+    """El saldo no alcanza para la salida o el traspaso."""
 
 class StockMovement(models.Model):
     MOVEMENT_TYPES = (
         ('IN', 'Entrada (Compra/Devolución)'),
         ('OUT', 'Salida (Venta/Merma)'),
+        ('TRF', 'Traspaso entre Ubicaciones'),
     )
 
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
     product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='movements', verbose_name=_("Producto"))
     quantity = models.PositiveIntegerField(verbose_name=_("Cantidad"))
     movement_type = models.CharField(max_length=3, choices=MOVEMENT_TYPES, verbose_name=_("Tipo"))
+    # Origen (salidas y traspasos) o destino (entradas). Por defecto, el lugar_bodega del producto.
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, null=True, blank=True, related_name='movements', verbose_name=_("Ubicación"))
+    destination = models.ForeignKey(Location, on_delete=models.PROTECT, null=True, blank=True, related_name='incoming_transfers', verbose_name=_("Ubicación Destino (Traspasos)"))
     reason = models.CharField(max_length=255, verbose_name=_("Razón/Motivo"), blank=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, verbose_name=_("Usuario Responsable"))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Fecha Movimiento"))
 
     def save(self, *args, **kwargs):
-        # [MEJORA] Atomicidad: Si falla recalcular, se borra el movimiento automáticamente
+        # El movimiento pertenece a la misma empresa que el producto
+        if self.company_id is None:
+            self.company_id = self.product.company_id
+        if self.location_id is None:
+            self.location = Location.for_product(self.product)
+
+        is_new = self._state.adding
+        # [MEJORA] Atomicidad: Si falla el saldo, se borra el movimiento automáticamente
         with transaction.atomic():
             # 1. Guardamos el movimiento
             super().save(*args, **kwargs)
-            # 2. Le ordenamos al producto que se recalcule
-            self.product.recalcular_stock()
+            # 2. Movimiento nuevo: se aplica el delta. Corrección: se recalcula desde el historial
+            if is_new:
+                self.aplicar()
+            else:
+                self.product.recalcular_stock()
+
+    def aplicar(self):
+        """
+        Aplica el movimiento a los saldos con UPDATEs atómicos (F()), sin
+        recorrer el historial. Lanza InsufficientStock si el origen no alcanza.
+        """
+        q = self.quantity
+        if self.movement_type == 'IN':
+            self._sumar(self.location_id, q)
+        else:
+            updated = StockBalance.objects.filter(
+                product_id=self.product_id, location_id=self.location_id, quantity__gte=q
+            ).update(quantity=F('quantity') - q, updated_at=timezone.now())
+            if not updated:
+                raise InsufficientStock(f"Stock insuficiente en {self.location.code} para {self.product.nombre_comercial}")
+            if self.movement_type == 'TRF':
+                self._sumar(self.destination_id, q)
+
+        if self.movement_type == 'TRF':
+            return
+
+        delta = q if self.movement_type == 'IN' else -q
+        # Una salida no puede consumir unidades reservadas por otros
+        guard = {} if delta > 0 else {'stock__gte': F('reserved') + q}
+        updated = Product.objects.filter(pk=self.product_id, **guard).update(
+            stock=F('stock') + delta, updated_at=timezone.now()
+        )
+        if not updated:
+            raise InsufficientStock(f"Stock insuficiente para {self.product.nombre_comercial}")
+
+        # Una revisión de historial por movimiento, con el stock resultante
+        self.product.refresh_from_db()
+        Product.history.bulk_history_create([self.product], update=True, default_user=self.user)
+        publish_stock_events([self.product_id])
+
+    def _sumar(self, location_id, q):
+        balance, _ = StockBalance.objects.get_or_create(product_id=self.product_id, location_id=location_id)
+        StockBalance.objects.filter(pk=balance.pk).update(quantity=F('quantity') + q, updated_at=timezone.now())
 
     def __str__(self):
         return f"{self.get_movement_type_display()} - {self.product.nombre_comercial} ({self.quantity})"
@@ -139,38 +402,282 @@ class StockMovement(models.Model):
         verbose_name = _("Movimiento de Stock")
         verbose_name_plural = _("Movimientos de Stock")
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['company', '-created_at'], name='movement_co_created_idx'),
+            models.Index(fields=['company', 'product', '-created_at'], name='movement_co_product_idx'),
+        ]
+
+def transfer_default_balances(previous_codes, user, reason='Cambio de lugar en bodega'):
+    """
+    Después de cambiar lugar_bodega, traspasa (TRF) a la nueva ubicación por
+    defecto el saldo que cada producto tenía en la anterior. Así las salidas
+    sin ubicación siguen encontrando el stock, y recalcular_stock() llega al
+    mismo saldo porque el traspaso queda en el historial de movimientos.
+    `previous_codes` es {product_id: lugar_bodega anterior}.
+    """
+    balances = StockBalance.objects.filter(
+        product_id__in=previous_codes, quantity__gt=0,
+    ).select_related('product', 'location')
+    moved = 0
+    for balance in balances:
+        product = balance.product
+        if balance.location.code != previous_codes[product.pk] or balance.location.code == product.lugar_bodega:
+            continue
+        StockMovement.objects.create(
+            product=product, quantity=balance.quantity, movement_type='TRF',
+            location=balance.location, destination=Location.for_product(product),
+            reason=reason, user=user,
+        )
+        moved += 1
+    return moved
+
+class StockReservation(models.Model):
+    """
+    Reserva temporal de stock para una venta pendiente. Mientras está activa
+    suma en Product.reserved; al vencer (expire_reservations), cancelarse o
+    convertirse en una salida (StockMovement OUT) se descuenta de nuevo.
+    """
+    STATUS = (
+        ('ACTIVE', 'Activa'),
+        ('CONVERTED', 'Convertida en Venta'),
+        ('EXPIRED', 'Expirada'),
+        ('CANCELLED', 'Cancelada'),
+    )
+
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='reservations', verbose_name=_("Producto"))
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)], verbose_name=_("Cantidad"))
+    status = models.CharField(max_length=10, choices=STATUS, default='ACTIVE', verbose_name=_("Estado"))
+    reason = models.CharField(max_length=255, blank=True, verbose_name=_("Cliente/Motivo"))
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, verbose_name=_("Usuario Responsable"))
+    expires_at = models.DateTimeField(verbose_name=_("Vence en"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Creada en"))
+    movement = models.OneToOneField(StockMovement, on_delete=models.PROTECT, null=True, blank=True, related_name='reservation', verbose_name=_("Movimiento de Venta"))
+
+    @classmethod
+    def reservar(cls, product, quantity, user, ttl, reason=''):
+        """Reserva si hay disponible (UPDATE condicional, sin carreras)."""
+        with transaction.atomic():
+            if not cls._tomar(product.pk, quantity):
+                # Puede haber reservas vencidas que el barrido aún no liberó
+                expire_reservations(product_id=product.pk)
+                if not cls._tomar(product.pk, quantity):
+                    raise InsufficientStock(f"No hay disponible suficiente para {product.nombre_comercial}")
+            publish_stock_events([product.pk])
+            return cls.objects.create(
+                company_id=product.company_id, product=product, quantity=quantity,
+                user=user, reason=reason, expires_at=timezone.now() + ttl,
+            )
+
+    @staticmethod
+    def _tomar(product_id, quantity):
+        return Product.objects.filter(pk=product_id, stock__gte=F('reserved') + quantity).update(reserved=F('reserved') + quantity)
+
+    def _cerrar(self, status, **filters):
+        # Solo una transición sale de ACTIVE: protege contra dobles liberaciones
+        closed = StockReservation.objects.filter(pk=self.pk, status='ACTIVE', **filters).update(status=status)
+        if closed:
+            Product.objects.filter(pk=self.product_id, reserved__gte=self.quantity).update(reserved=F('reserved') - self.quantity)
+            publish_stock_events([self.product_id])
+            self.status = status
+        return bool(closed)
+
+    def cancelar(self):
+        with transaction.atomic():
+            return self._cerrar('CANCELLED')
+
+    def convertir(self, user):
+        """Convierte la reserva vigente en una salida de stock."""
+        with transaction.atomic():
+            if not self._cerrar('CONVERTED', expires_at__gt=timezone.now()):
+                return None
+            self.movement = StockMovement.objects.create(
+                product=self.product, quantity=self.quantity, movement_type='OUT',
+                reason=self.reason or f"Reserva #{self.pk}", user=user,
+            )
+            StockReservation.objects.filter(pk=self.pk).update(movement=self.movement)
+            return self.movement
+
+    def __str__(self):
+        return f"Reserva #{self.pk} - {self.product.nombre_comercial} ({self.quantity}, {self.get_status_display()})"
+
+    class Meta:
+        verbose_name = _("Reserva de Stock")
+        verbose_name_plural = _("Reservas de Stock")
+        ordering = ['-created_at']
+        indexes = [
+            # El barrido solo recorre reservas activas, ordenadas por vencimiento
+            models.Index(fields=['expires_at'], condition=models.Q(status='ACTIVE'), name='reservation_active_exp_idx'),
+            models.Index(fields=['company', 'status', '-created_at'], name='reservation_co_status_idx'),
+        ]
 
+def expire_reservations(product_id=None, batch_size=500):
+    """
+    Marca como expiradas las reservas activas vencidas y descuenta sus
+    unidades de Product.reserved. Devuelve la cantidad de reservas liberadas.
+    """
+    expired = StockReservation.objects.filter(status='ACTIVE', expires_at__lte=timezone.now())
+    if product_id is not None:
+        expired = expired.filter(product_id=product_id)
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(expired.select_for_update().order_by('expires_at').values_list('pk', 'product_id', 'quantity')[:batch_size])
+            if not rows:
+                return total
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(status='EXPIRED')
+            per_product = defaultdict(int)
+            for _, pid, quantity in rows:
+                per_product[pid] += quantity
+            for pid, quantity in per_product.items():
+                Product.objects.filter(pk=pid, reserved__gte=quantity).update(reserved=F('reserved') - quantity)
+            publish_stock_events(per_product)
+            total += len(rows)
+
+class StockEvent(models.Model):
+    """
+    Registro de cambios de stock para el canal en tiempo real (/api/stock-events/).
+    El id es el número de secuencia: un cliente que se reconecta pide los
+    eventos posteriores al último que recibió. Se purga con purge_stock_events.
+    """
+    id = models.BigAutoField(primary_key=True)
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False)
+    # Sin FK: el evento sobrevive al producto y no requiere join al leerlo
+    product_id = models.PositiveIntegerField()
+    stock = models.IntegerField()
+    reserved = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def as_payload(self):
+        return {
+            'seq': self.id, 'product_id': self.product_id, 'stock': self.stock,
+            'disponible': max(0, self.stock - self.reserved),
+        }
+
+    class Meta:
+        verbose_name = _("Evento de Stock")
+        verbose_name_plural = _("Eventos de Stock")
+        indexes = [
+            models.Index(fields=['company', 'id'], name='stockevent_co_seq_idx'),
+        ]
+
+def publish_stock_events(product_ids):
+    """
+    Encola un evento por producto con su stock al confirmarse la transacción
+    en curso (si se revierte, no se publica nada). Lee los valores ya
+    confirmados, así el evento nunca adelanta ni atrasa a la base de datos.
+    """
+    ids = set(product_ids)
+    if not ids:
+        return
+
+    def publish():
+        rows = Product.objects.filter(pk__in=ids).values_list('pk', 'company_id', 'stock', 'reserved')
+        StockEvent.objects.bulk_create([
+            StockEvent(product_id=pk, company_id=company_id, stock=stock, reserved=reserved)
+            for pk, company_id, stock, reserved in rows
+        ])
+
+    transaction.on_commit(publish)
+
+class DeactivationJob(models.Model):
+    """
+    Descontinuación en cascada de los productos de una marca, categoría o
+    proveedor, cuando son demasiados para hacerlo dentro de la petición
+    (api.cascades). `processed` de `total` sirve para mostrar el avance.
+    """
+    TARGETS = (
+        ('brand', 'Marca'),
+        ('category', 'Categoría'),
+        ('provider', 'Proveedor'),
+    )
+    STATUS = (
+        ('PENDING', 'Pendiente'),
+        ('RUNNING', 'En Proceso'),
+        ('DONE', 'Terminado'),
+        ('FAILED', 'Fallido'),
+    )
+
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
+    target = models.CharField(max_length=10, choices=TARGETS, verbose_name=_("Tipo"))
+    target_id = models.PositiveIntegerField(verbose_name=_("Id"))
+    target_name = models.CharField(max_length=200, verbose_name=_("Nombre"))
+    status = models.CharField(max_length=10, choices=STATUS, default='PENDING', verbose_name=_("Estado"))
+    total = models.PositiveIntegerField(default=0, verbose_name=_("Productos"))
+    processed = models.PositiveIntegerField(default=0, verbose_name=_("Procesados"))
+    error = models.TextField(blank=True, verbose_name=_("Error"))
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_("Usuario Responsable"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Creado en"))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Terminado en"))
+    # Lo renueva cada bloque procesado: un RUNNING sin avance reciente quedó huérfano
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Último avance"))
+
+    def __str__(self):
+        return f"{self.get_target_display()} {self.target_name}: {self.processed}/{self.total}"
+
+    class Meta:
+        verbose_name = _("Descontinuación en Cascada")
+        verbose_name_plural = _("Descontinuaciones en Cascada")
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['company', '-created_at'], name='deactivationjob_co_date_idx'),
+        ]
+
+class InventoryValuation(models.Model):
+    """
+    Resumen precalculado de valorización de inventario por dimensión.
+    Se reconstruye completo con api.analytics.rebuild_inventory_valuation().
+    """
+    DIMENSIONS = (
+        ('brand', 'Marca'),
+        ('category', 'Categoría'),
+        ('provider', 'Proveedor'),
+        ('lugar_bodega', 'Lugar en Bodega'),
+    )
+
+    company = models.ForeignKey('companies.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='+', db_index=False, verbose_name=_("Empresa"))
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS, verbose_name=_("Dimensión"))
+    key = models.CharField(max_length=50, verbose_name=_("Clave"))
+    label = models.CharField(max_length=200, verbose_name=_("Nombre"))
+    productos = models.PositiveIntegerField(default=0, verbose_name=_("Productos"))
+    unidades = models.PositiveBigIntegerField(default=0, verbose_name=_("Unidades en Stock"))
+    valor_costo = models.DecimalField(max_digits=20, decimal_places=0, default=0, verbose_name=_("Valor a Costo (CLP)"))
+    valor_venta = models.DecimalField(max_digits=20, decimal_places=0, default=0, verbose_name=_("Valor a Precio de Venta (CLP)"))
+    computed_at = models.DateTimeField(verbose_name=_("Calculado en"))
+
+    @property
+    def margen(self):
+        return self.valor_venta - self.valor_costo
+
+    @property
+    def margen_pct(self):
+        if not self.valor_venta:
+            return 0
+        return round(self.margen * 100 / self.valor_venta, 2)
+
+    def __str__(self):
+        return f"{self.get_dimension_display()}: {self.label}"
+
+    class Meta:
+        verbose_name = _("Valorización de Inventario")
+        verbose_name_plural = _("Valorizaciones de Inventario")
+        ordering = ['dimension', '-valor_venta']
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'dimension', 'key'], name='unique_valuation_co_dimension_key'),
+        ]
+
+def sync_imagen_principal(product_ids):
+    """Recalcula Product.imagen_principal (principal, o la primera subida) en un solo UPDATE."""
+    first = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_principal', 'id').values('pk')[:1]
+    Product.objects.filter(pk__in=set(product_ids)).update(imagen_principal=Subquery(first))
+
+@receiver(post_save, sender=ProductImage)
 @receiver(post_delete, sender=ProductImage)
-def auto_delete_file_on_delete(sender, instance, **kwargs):
-    """
-    Borra el archivo físico cuando se elimina el objeto ProductImage.
-    """
-    if instance.image:
-        if os.path.isfile(instance.image.path):
-            try:
-                os.remove(instance.image.path)
-                print(f"🗑️ Archivo eliminado: {instance.image.path}")
-            except Exception as e:
-                print(f"⚠️ Error borrando archivo: {e}")
-
-@receiver(pre_save, sender=ProductImage)
-def auto_delete_file_on_change(sender, instance, **kwargs):
-    """
-    Borra el archivo antiguo cuando se actualiza la imagen por una nueva.
-    """
-    if not instance.pk:
-        return False
-
-    try:
-        old_file = ProductImage.objects.get(pk=instance.pk).image
-    except ProductImage.DoesNotExist:
-        return False
-
-    new_file = instance.image
-    if not old_file == new_file:
-        if os.path.isfile(old_file.path):
-            try:
-                os.remove(old_file.path)
-                print(f"🔄 Archivo antiguo reemplazado: {old_file.path}")
-            except Exception as e:
-                print(f"⚠️ Error reemplazando archivo: {e}")
\ No newline at end of file
+def update_imagen_principal(sender, instance, **kwargs):
+    sync_imagen_principal([instance.product_id])
+
+@receiver(post_save, sender=Product)
+def publish_product_stock(sender, instance, **kwargs):
+    # Ediciones del producto (y recalcular_stock) también llegan a las pantallas abiertas
+    publish_stock_events([instance.pk])
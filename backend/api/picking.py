@@ -0,0 +1,177 @@
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Geometría de bodega (en "posiciones de rack"): pasillos paralelos con un
+# pasillo transversal al frente (donde está el despacho) y otro al fondo.
+AISLE_WIDTH = 3
+TWO_OPT_TIME_BUDGET = 0.05  # segundos
+
+Coordinate = namedtuple('Coordinate', 'aisle rack level')
+
+_AISLE_WORDS = r'(?:pasillo|pas|p|aisle)'
+_RACK_WORDS = r'(?:rack|estante|modulo|módulo|r|e|m)'
+_LEVEL_WORDS = r'(?:nivel|level|n|l)'
+
+
+def _aisle_index(token):
+    if token.isdigit():
+        return int(token)
+    # A=1, B=2, ..., Z=26, AA=27...
+    index = 0
+    for char in token.upper():
+        index = index * 26 + (ord(char) - ord('A') + 1)
+    return index
+
+
+def parse_location(text):
+    """
+    Convierte lugar_bodega en coordenadas (pasillo, rack, nivel).
+    Acepta "Pasillo A", "Pasillo B-03-2", "A-12-3", "P3 R12 N2",
+    "Pasillo 3 Rack 12 Nivel 2". Devuelve None si no se reconoce.
+    """
+    value = (text or '').strip().lower()
+    if not value:
+        return None
+
+    labeled = re.match(
+        rf'^{_AISLE_WORDS}\.?\s*([a-z]{{1,2}}|\d+)'
+        rf'(?:[\s\-_/,.]*(?:{_RACK_WORDS}\.?\s*)?(\d+))?'
+        rf'(?:[\s\-_/,.]*(?:{_LEVEL_WORDS}\.?\s*)?(\d+))?\s*$',
+        value,
+    )
+    plain = re.match(r'^([a-z]{1,2}|\d+)(?:[\s\-_/.]+(\d+))?(?:[\s\-_/.]+(\d+))?\s*$', value)
+    match = labeled or plain
+    if not match:
+        return None
+    aisle, rack, level = match.groups()
+    return Coordinate(_aisle_index(aisle), int(rack or 0), int(level or 0))
+
+
+def _points(coords):
+    return np.array([(c.aisle * AISLE_WIDTH, c.rack) for c in coords], dtype=float).reshape(-1, 2)
+
+
+def distance_matrix(coords, aisle_length):
+    """
+    Distancia de caminata entre ubicaciones: dentro del mismo pasillo es la
+    diferencia de rack; entre pasillos hay que salir por el frente o el fondo.
+    El índice 0 es el punto de despacho (frente del primer pasillo).
+    """
+    points = np.vstack([[0.0, 0.0], _points(coords)])
+    x, y = points[:, 0], points[:, 1]
+    dx = np.abs(x[:, None] - x[None, :])
+    same_aisle = dx == 0
+    via_front = y[:, None] + y[None, :]
+    via_back = 2 * aisle_length - y[:, None] - y[None, :]
+    return np.where(same_aisle, np.abs(y[:, None] - y[None, :]), dx + np.minimum(via_front, via_back))
+
+
+def route_length(order, matrix):
+    """Largo de la ruta despacho -> paradas (índices 1..n) -> despacho."""
+    path = np.concatenate(([0], np.asarray(order, dtype=int), [0]))
+    return float(matrix[path[:-1], path[1:]].sum())
+
+
+def s_shape_order(coords):
+    """
+    Heurística S (serpentina): se recorren los pasillos con picks en orden,
+    alternando subida y bajada. O(n log n).
+    """
+    aisles = sorted({c.aisle for c in coords})
+    direction = {aisle: (1 if i % 2 == 0 else -1) for i, aisle in enumerate(aisles)}
+    indexed = sorted(
+        range(len(coords)),
+        key=lambda i: (coords[i].aisle, direction[coords[i].aisle] * coords[i].rack, coords[i].level),
+    )
+    return [i + 1 for i in indexed]
+
+
+def nearest_neighbour_order(matrix):
+    n = matrix.shape[0]
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    current, order = 0, []
+    for _ in range(n - 1):
+        distances = np.where(visited, np.inf, matrix[current])
+        current = int(distances.argmin())
+        visited[current] = True
+        order.append(current)
+    return order
+
+
+def two_opt(order, matrix, time_budget=TWO_OPT_TIME_BUDGET):
+    """Mejora 2-opt vectorizada (por cada arista evalúa todas las demás a la vez)."""
+    path = np.concatenate(([0], np.asarray(order, dtype=int), [0]))
+    deadline = time.perf_counter() + time_budget
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, len(path) - 2):
+            a, b = path[i - 1], path[i]
+            c, d = path[i + 1:-1], path[i + 2:]
+            gain = matrix[a, b] + matrix[c, d] - matrix[a, c] - matrix[b, d]
+            j = int(gain.argmax())
+            if gain[j] > 1e-9:
+                path[i:i + j + 2] = path[i:i + j + 2][::-1]
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return [int(stop) for stop in path[1:-1]]
+
+
+def optimize_route(coords):
+    """
+    Ordena las paradas (coordenadas únicas) minimizando la caminata: calcula la
+    serpentina y vecino más cercano + 2-opt, y se queda con la más corta.
+    Devuelve (orden de índices sobre coords, largo, estrategia).
+    """
+    if not coords:
+        return [], 0.0, 's-shape'
+    aisle_length = max(c.rack for c in coords) + 1
+    matrix = distance_matrix(coords, aisle_length)
+
+    candidates = {'s-shape': s_shape_order(coords)}
+    if len(coords) > 2:
+        candidates['nearest-neighbour+2-opt'] = two_opt(nearest_neighbour_order(matrix), matrix)
+
+    strategy, order = min(candidates.items(), key=lambda item: route_length(item[1], matrix))
+    return [stop - 1 for stop in order], route_length(order, matrix), strategy
+
+
+def plan_picking(lines):
+    """
+    `lines`: lista de dicts con al menos 'lugar_bodega'. Agrupa las líneas por
+    ubicación, optimiza el orden de las paradas y devuelve (líneas ordenadas,
+    largo optimizado, largo en orden de llegada, estrategia). Las ubicaciones
+    no reconocidas van al final, en orden de llegada.
+    """
+    # Cada ubicación se interpreta una sola vez
+    coords = [parse_location(line['lugar_bodega']) for line in lines]
+    stops, stop_lines, unparsed = [], {}, []
+    for line, coord in zip(lines, coords):
+        if coord is None:
+            unparsed.append(line)
+            continue
+        if coord not in stop_lines:
+            stop_lines[coord] = []
+            stops.append(coord)
+        stop_lines[coord].append((line, coord))
+
+    order, length, strategy = optimize_route(stops)
+
+    arrival = []
+    for coord in coords:
+        if coord is not None and (not arrival or arrival[-1] != coord):
+            arrival.append(coord)
+    arrival_length = 0.0
+    if arrival:
+        aisle_length = max(c.rack for c in stops) + 1
+        matrix = distance_matrix(arrival, aisle_length)
+        arrival_length = route_length(range(1, len(arrival) + 1), matrix)
+
+    ordered = [item for index in order for item in stop_lines[stops[index]]]
+    ordered += [(line, None) for line in unparsed]
+    return ordered, length, arrival_length, strategy
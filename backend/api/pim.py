@@ -0,0 +1,146 @@
+import io
+import zipfile
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+PIM_FORMATS = ('txt', 'pdf')
+PIM_CACHE_TIMEOUT = 60 * 60 * 24
+PIM_CHUNK_SIZE = 200
+
+
+def build_pim_text(product):
+    return (
+        f"FICHA TECNICA DE PRODUCTO\n"
+        f"========================================\n"
+        f"PRODUCTO: {product.nombre_comercial}\n"
+        f"SKU:      {product.sku}\n"
+        f"MARCA:    {product.brand.name if product.brand else 'N/A'}\n"
+        f"----------------------------------------\n"
+        f"DETALLES TÉCNICOS:\n"
+        f"- Categoría:   {product.category.name if product.category else 'N/A'}\n"
+        f"- Dimensiones: {product.dimensiones or 'N/A'}\n"
+        f"- Peso:        {product.peso or 'N/A'} kg\n"
+        f"- Uso:         {product.edad_uso or 'N/A'}\n"
+        f"----------------------------------------\n"
+        f"PRECIO LISTA: ${product.precio_venta:,.0f} CLP\n"
+        f"----------------------------------------\n"
+        f"DESCRIPCIÓN:\n"
+        f"{product.descripcion or 'N/A'}\n"
+        f"========================================\n"
+        f"Bodegas Salas ERP - {datetime.now().strftime('%d/%m/%Y')}"
+    )
+
+
+def build_pim_pdf(product):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    text = pdf.beginText(40, height - 50)
+    text.setFont("Courier", 10)
+    for line in build_pim_text(product).splitlines():
+        # Las descripciones largas se cortan a lo ancho de la hoja
+        while len(line) > 90:
+            text.textLine(line[:90])
+            line = line[90:]
+        text.textLine(line)
+    pdf.drawText(text)
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'txt': lambda product: build_pim_text(product).encode('utf-8'),
+    'pdf': build_pim_pdf,
+}
+
+
+def pim_cache_key(product, fmt):
+    # updated_at versiona la ficha; la fecha del pie la invalida al cambiar el día
+    return f"pim:{fmt}:{product.pk}:{product.updated_at.timestamp()}:{datetime.now():%Y%m%d}"
+
+
+class _ZipSink:
+    """
+    Destino no posicionable para zipfile: acumula lo escrito y lo entrega
+    por trozos, así el ZIP se transmite mientras se genera.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _zip_blocks(queryset, formats):
+    """
+    Generador síncrono del ZIP: un bloque de bytes por cada PIM_CHUNK_SIZE
+    productos, tomando del caché las fichas que no cambiaron (según updated_at).
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        chunk = []
+        for product in queryset.iterator(chunk_size=PIM_CHUNK_SIZE):
+            chunk.append(product)
+            if len(chunk) == PIM_CHUNK_SIZE:
+                _write_chunk(archive, chunk, formats)
+                yield sink.pop()
+                chunk = []
+        if chunk:
+            _write_chunk(archive, chunk, formats)
+    yield sink.pop()
+
+
+async def stream_pim_zip(queryset, formats=PIM_FORMATS):
+    """
+    ZIP con las fichas de `queryset` como iterador asíncrono: bajo ASGI un
+    iterador síncrono se acumularía entero antes de enviarse. Cada bloque se
+    arma en el hilo de la base de datos y se envía apenas está listo, así la
+    memoria no crece con la cantidad exportada.
+    """
+    blocks = _zip_blocks(queryset, formats)
+    next_block = sync_to_async(next)
+    try:
+        while (block := await next_block(blocks, None)) is not None:
+            yield block
+    finally:
+        # Si el cliente corta, cerrar el cursor en el mismo hilo que lo abrió
+        await sync_to_async(blocks.close)()
+
+
+def _write_chunk(archive, products, formats):
+    keys = {(product.pk, fmt): pim_cache_key(product, fmt) for product in products for fmt in formats}
+    cached = cache.get_many(keys.values())
+    rendered = {}
+
+    for product in products:
+        for fmt in formats:
+            key = keys[(product.pk, fmt)]
+            content = cached.get(key)
+            if content is None:
+                content = rendered[key] = RENDERERS[fmt](product)
+            filename = product.sku.replace('/', '-')
+            archive.writestr(f"{fmt}/{filename}.{fmt}", content)
+
+    if rendered:
+        cache.set_many(rendered, PIM_CACHE_TIMEOUT)
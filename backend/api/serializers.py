@@ -1,61 +1,174 @@
 from rest_framework import serializers
-from .models import Product, Brand, Category, Provider, ProductImage
+from .models import Product, Brand, Category, Provider, ProductImage, InventoryValuation, Location, StockBalance, StockReservation, DeactivationJob
 from simple_history.models import HistoricalRecords
 from .models import StockMovement
+from .images import srcset, inspect_image
+from .storage import product_image_storage
+from companies.models import get_user_company
+from companies.scoping import scope_queryset
+
+class CompanyScopedFieldsMixin:
+    """
+    Limita las relaciones escribibles (`company_scoped_fields`) a los registros
+    de la empresa del usuario, para no referenciar datos de otro tenant.
+    """
+    company_scoped_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        for name in self.company_scoped_fields:
+            field = self.fields.get(name)
+            if field is not None and getattr(field, 'queryset', None) is not None:
+                field.queryset = scope_queryset(field.queryset, request.user)
+
+class CompanyUniqueNameMixin:
+    """El nombre es único dentro de la empresa (reemplaza el unique=True global)."""
+
+    def validate_name(self, value):
+        request = self.context.get('request')
+        company = get_user_company(request.user) if request else None
+        queryset = self.Meta.model.objects.filter(company=company, name=value)
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError(f"Ya existe un registro con el nombre '{value}'.")
+        return value
+
+class StockMovementSerializer(CompanyScopedFieldsMixin, serializers.ModelSerializer):
+    company_scoped_fields = ('product', 'location', 'destination')
 
-class StockMovementSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     product_name = serializers.ReadOnlyField(source='product.nombre_comercial')
 
     class Meta:
         model = StockMovement
-        fields = ['id', 'product', 'product_name', 'quantity', 'movement_type', 'reason', 'user', 'created_at']
+        fields = ['id', 'product', 'product_name', 'quantity', 'movement_type', 'location', 'destination', 'reason', 'user', 'created_at']
         read_only_fields = ['user', 'created_at']
     
     def validate(self, data):
+        if data['movement_type'] == 'TRF':
+            if not data.get('location') or not data.get('destination'):
+                raise serializers.ValidationError({"destination": "Un traspaso requiere ubicación de origen y destino."})
+            if data['location'] == data['destination']:
+                raise serializers.ValidationError({"destination": "El destino debe ser distinto del origen."})
+
         if data['movement_type'] == 'OUT':
             product = data['product']
-            if product.stock < data['quantity']:
+            # Las unidades reservadas no se pueden sacar por fuera de su reserva
+            if product.disponible < data['quantity']:
+                raise serializers.ValidationError({
+                    "quantity": f"No hay suficiente stock. Disponible: {product.disponible}, Intentado sacar: {data['quantity']}"
+                })
+
+        if data['movement_type'] in ('OUT', 'TRF') and data.get('location'):
+            balance = StockBalance.objects.filter(product=data['product'], location=data['location']).values_list('quantity', flat=True).first() or 0
+            if balance < data['quantity']:
                 raise serializers.ValidationError({
-                    "quantity": f"No hay suficiente stock. Disponible: {product.stock}, Intentado sacar: {data['quantity']}"
+                    "quantity": f"No hay suficiente stock en {data['location'].code}. Disponible: {balance}, Intentado sacar: {data['quantity']}"
                 })
         return data
 
-class BrandSerializer(serializers.ModelSerializer):
+class BrandSerializer(CompanyUniqueNameMixin, serializers.ModelSerializer):
     class Meta:
         model = Brand
         fields = ['id', 'name']
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(CompanyUniqueNameMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name']
 
-class ProviderSerializer(serializers.ModelSerializer):
+class ProviderSerializer(CompanyUniqueNameMixin, serializers.ModelSerializer):
     class Meta:
         model = Provider
         fields = ['id', 'name']
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class LocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Location
+        fields = ['id', 'code', 'name', 'is_active']
+
+    def validate_code(self, value):
+        request = self.context.get('request')
+        company = get_user_company(request.user) if request else None
+        queryset = Location.objects.filter(company=company, code=value)
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError(f"Ya existe una ubicación con el código '{value}'.")
+        return value
+
+class StockBalanceSerializer(serializers.ModelSerializer):
+    product_name = serializers.ReadOnlyField(source='product.nombre_comercial')
+    location_code = serializers.ReadOnlyField(source='location.code')
+
+    class Meta:
+        model = StockBalance
+        fields = ['id', 'product', 'product_name', 'location', 'location_code', 'quantity', 'updated_at']
+
+class ProductImageSerializer(CompanyScopedFieldsMixin, serializers.ModelSerializer):
+    company_scoped_fields = ('product',)
+
     def validate_image(self, value):
-        from PIL import Image
+        # Solo cabeceras: tamaño, formato y dimensiones, sin decodificar los píxeles
         try:
-            img = Image.open(value)
-            img.verify()  # Verify image integrity
-        except Exception as e:
+            inspect_image(value)
+        except ValueError as e:
             print(f"Image validation error for file '{value.name}': {str(e)}")  # Log to console
             raise serializers.ValidationError(f"Invalid image: {str(e)}")
         return value
     
+    # FileField y no ImageField: el ImageField de DRF abre y verifica la imagen
+    # completa con Pillow antes de validate_image; aquí basta la cabecera.
+    image = serializers.FileField()
+    # Variantes para <img srcset>; vacías mientras se generan en segundo plano
+    srcset_webp = serializers.SerializerMethodField()
+    srcset_jpeg = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+
+    def _url(self, path):
+        request = self.context.get('request')
+        url = product_image_storage.url(path)
+        return request.build_absolute_uri(url) if request else url
+
+    def get_srcset_webp(self, obj):
+        return srcset(obj.derivatives, 'webp', self._url)
+
+    def get_srcset_jpeg(self, obj):
+        return srcset(obj.derivatives, 'jpeg', self._url)
+
+    def get_thumbnail(self, obj):
+        variants = (obj.derivatives or {}).get('jpeg') or {}
+        if not variants:
+            return None
+        return self._url(variants[min(variants, key=int)])
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_principal', 'product']
+        fields = ['id', 'image', 'is_principal', 'product', 'srcset_webp', 'srcset_jpeg', 'thumbnail']
+
+class ProductImagesFieldMixin:
+    """
+    En los listados (context['omit_images']) no se envían todas las imágenes:
+    basta imagen_principal, que viene por join. El detalle las incluye todas.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.context.get('omit_images'):
+            self.fields.pop('images', None)
+
+class ProductSerializer(ProductImagesFieldMixin, CompanyScopedFieldsMixin, serializers.ModelSerializer):
+    company_scoped_fields = ('brand_id', 'category_id', 'provider_id')
 
-class ProductSerializer(serializers.ModelSerializer):
     brand = BrandSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     provider = ProviderSerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
+    imagen_principal = ProductImageSerializer(read_only=True)
 
     brand_id = serializers.PrimaryKeyRelatedField(
         queryset=Brand.objects.all(), source="brand", write_only=True
@@ -72,17 +185,19 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'nombre_comercial', 'ean', 'sku', 'peso', 'dimensiones', 'descripcion',
             'costo_cg', 'lugar_bodega', 'edad_uso', 'stock', 'precio_venta', 'rating',
-            'brand', 'category', 'provider', 'images',
+            'reserved', 'disponible', 'abc_class', 'ventas_unidades',
+            'brand', 'category', 'provider', 'images', 'imagen_principal',
             'brand_id', 'category_id', 'provider_id',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['stock']
+        read_only_fields = ['stock', 'reserved', 'abc_class', 'ventas_unidades']
 
-class ProductSellerSerializer(serializers.ModelSerializer):
+class ProductSellerSerializer(ProductImagesFieldMixin, serializers.ModelSerializer):
     # Reutilizamos los campos anidados para que se vea bonito (Marca, Categoría)
     brand = BrandSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
+    imagen_principal = ProductImageSerializer(read_only=True)
 
     class Meta:
         model = Product
@@ -92,8 +207,10 @@ class ProductSellerSerializer(serializers.ModelSerializer):
             'peso', 'dimensiones', 'descripcion', 
             'lugar_bodega', 'edad_uso', 
             'stock', 'precio_venta', 'rating', 
-            'brand', 'category', 'images'
+            'reserved', 'disponible', 'abc_class', 'ventas_unidades',
+            'brand', 'category', 'images', 'imagen_principal'
         ]
+        read_only_fields = ['stock', 'reserved', 'abc_class', 'ventas_unidades']
 
 class HistoricalProductSerializer(serializers.ModelSerializer):
     history_user = serializers.StringRelatedField()
@@ -104,4 +221,62 @@ class HistoricalProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product.history.model # Accede al modelo de historial
-        fields = '__all__'
\ No newline at end of file
+        # La empresa es interna: el historial ya viene filtrado por ella
+        exclude = ['company']
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """
+    Cambios uniformes sobre muchos productos: se eligen por lista de ids
+    o por los mismos filtros del listado (brand, category, provider...).
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filters = serializers.DictField(required=False)
+
+    precio_venta_pct = serializers.DecimalField(max_digits=6, decimal_places=2, required=False, min_value=-100)
+    precio_venta = serializers.DecimalField(max_digits=15, decimal_places=0, required=False, min_value=0)
+    costo_cg_pct = serializers.DecimalField(max_digits=6, decimal_places=2, required=False, min_value=-100)
+    costo_cg = serializers.DecimalField(max_digits=15, decimal_places=0, required=False, min_value=0)
+    lugar_bodega = serializers.CharField(max_length=50, required=False)
+    motivo = serializers.CharField(max_length=100, required=False, default="Actualización masiva")
+
+    CAMPOS_CAMBIO = ('precio_venta_pct', 'precio_venta', 'costo_cg_pct', 'costo_cg', 'lugar_bodega')
+
+    def validate(self, data):
+        if bool(data.get('ids')) == bool(data.get('filters')):
+            raise serializers.ValidationError("Indique 'ids' o 'filters' (uno de los dos, no vacío).")
+        if not any(campo in data for campo in self.CAMPOS_CAMBIO):
+            raise serializers.ValidationError("No se indicó ningún cambio.")
+        if 'precio_venta_pct' in data and 'precio_venta' in data:
+            raise serializers.ValidationError("Use 'precio_venta' o 'precio_venta_pct', no ambos.")
+        if 'costo_cg_pct' in data and 'costo_cg' in data:
+            raise serializers.ValidationError("Use 'costo_cg' o 'costo_cg_pct', no ambos.")
+        return data
+
+class InventoryValuationSerializer(serializers.ModelSerializer):
+    margen = serializers.DecimalField(max_digits=20, decimal_places=0, read_only=True)
+    margen_pct = serializers.DecimalField(max_digits=7, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = InventoryValuation
+        fields = ['dimension', 'key', 'label', 'productos', 'unidades', 'valor_costo', 'valor_venta', 'margen', 'margen_pct']
+
+class StockReservationSerializer(CompanyScopedFieldsMixin, serializers.ModelSerializer):
+    company_scoped_fields = ('product',)
+
+    user = serializers.StringRelatedField(read_only=True)
+    product_name = serializers.ReadOnlyField(source='product.nombre_comercial')
+    # Minutos de vigencia; por defecto settings.RESERVATION_DEFAULT_TTL_MINUTES
+    ttl_minutes = serializers.IntegerField(write_only=True, required=False, min_value=1, max_value=24 * 60)
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'product', 'product_name', 'quantity', 'status', 'reason', 'user', 'ttl_minutes', 'expires_at', 'movement', 'created_at']
+        read_only_fields = ['status', 'user', 'expires_at', 'movement', 'created_at']
+
+class DeactivationJobSerializer(serializers.ModelSerializer):
+    user = serializers.StringRelatedField(read_only=True)
+
+    class Meta:
+        model = DeactivationJob
+        fields = ['id', 'target', 'target_id', 'target_name', 'status', 'total', 'processed', 'error', 'user', 'created_at', 'heartbeat_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,52 @@
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Guarda cada archivo con el nombre de su hash (sha256) dentro de la carpeta
+    pedida: product_images/ab/abcdef....jpg. Dos subidas con el mismo contenido
+    terminan en el mismo archivo, así que un duplicado no ocupa espacio.
+
+    Como un archivo puede estar compartido, nunca se borra al borrar o
+    reemplazar una imagen: los huérfanos los recoge el comando gc_media.
+    """
+
+    def content_hash(self, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def hashed_name(self, name, digest):
+        directory = posixpath.dirname(name.replace('\\', '/'))
+        ext = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, digest[:2], f"{digest}{ext}")
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.hashed_name(name, self.content_hash(content))
+        if self.exists(name):
+            return name
+
+        # Se escribe a un temporal y se renombra: nunca queda un archivo a medias
+        # con el nombre definitivo, y dos subidas simultáneas escriben lo mismo.
+        temporary = self._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+product_image_storage = ContentAddressedStorage()
+
+
+def get_product_image_storage():
+    return product_image_storage
@@ -1,3 +1,1236 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.asgi import application
+from companies.models import Company
+
+from .analytics import classify_abc, rebuild_inventory_valuation
+from .cascades import deactivate_products, run_deactivation_job
+from .duplicates import find_duplicates, find_similar
+from .events import StockEventFeed
+from .filters import ProductFilter
+from .history import as_of_page
+from .images import build_derivatives, generate_derivatives, inspect_image, srcset
+from .lookup import CodeIndex
+from .models import (
+    Brand, Category, Provider, Product, DeactivationJob, InventoryValuation, Location, ProductBand, ProductImage, ProductSignature,
+    StockBalance, StockEvent, StockMovement, StockReservation, expire_reservations,
+)
+from .pim import build_pim_text
+from .storage import product_image_storage
+
+
+class CatalogTestCase(APITestCase):
+    """Catálogo mínimo: un admin, un vendedor y una marca/categoría/proveedor."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.admin.profile.role = 'ADMIN'
+        self.admin.profile.save()
+        self.seller = User.objects.create_user('vendedor', password='x')
+        self.brand = Brand.objects.create(name='Bosch')
+        self.category = Category.objects.create(name='Herramientas')
+        self.provider = Provider.objects.create(name='Sodimac')
+        self.client.force_authenticate(self.admin)
+
+    def make_product(self, i, **kwargs):
+        data = dict(
+            user=self.admin, nombre_comercial=f'Taladro {i}', brand=self.brand, category=self.category,
+            provider=self.provider, ean=f'780{i:010d}', sku=f'SKU-{i}', dimensiones='10x20x30',
+            descripcion='Taladro percutor', costo_cg=1000, lugar_bodega='Pasillo A', stock=10, precio_venta=2000,
+        )
+        data.update(kwargs)
+        return Product.objects.create(**data)
+
+
+class BulkUpdateTests(CatalogTestCase):
+    def test_percentage_by_filters_with_history(self):
+        other_brand = Brand.objects.create(name='Makita')
+        products = [self.make_product(i, precio_venta=1999) for i in range(3)]
+        untouched = self.make_product(9, brand=other_brand)
+        response = self.client.post('/api/products/bulk-update/', {
+            'filters': {'brand': self.brand.pk}, 'precio_venta_pct': '10', 'motivo': 'Alza proveedor',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 3)
+
+        # La aritmética y el redondeo los hace la base de datos
+        self.assertEqual(set(Product.objects.filter(brand=self.brand).values_list('precio_venta', flat=True)), {2199})
+        untouched.refresh_from_db()
+        self.assertEqual(untouched.precio_venta, 2000)
+        self.assertEqual(
+            set(Product.history.filter(history_change_reason='Alza proveedor').values_list('id', 'precio_venta', 'history_user')),
+            {(product.pk, 2199, self.admin.pk) for product in products},
+        )
+
+    def test_ids_and_fixed_value(self):
+        first, second = self.make_product(1), self.make_product(2)
+        response = self.client.post('/api/products/bulk-update/', {'ids': [first.pk], 'costo_cg': 1500}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(Product.objects.values_list('pk', 'costo_cg')), {first.pk: 1500, second.pk: 1000})
+
+    def test_invalid_requests(self):
+        product = self.make_product(1)
+        for data in (
+            {'ids': [product.pk], 'filters': {'brand': self.brand.pk}, 'costo_cg': 1},
+            {'ids': [product.pk]},
+            {'ids': [product.pk], 'precio_venta': 1, 'precio_venta_pct': 5},
+            {'filters': {'brand': 'x'}, 'costo_cg': 1},
+        ):
+            response = self.client.post('/api/products/bulk-update/', data, format='json')
+            self.assertEqual(response.status_code, 400, data)
+        self.client.force_authenticate(self.seller)
+        response = self.client.post('/api/products/bulk-update/', {'ids': [product.pk], 'costo_cg': 1}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+@mock.patch('api.views.code_index', new_callable=CodeIndex)
+class CodeLookupTests(CatalogTestCase):
+    def test_by_ean_or_sku_with_fresh_stock(self, index):
+        product = self.make_product(1)
+        for code in (product.ean, product.sku):
+            response = self.client.get('/api/products/lookup/', {'code': code})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['id'], product.pk)
+
+        # El índice guarda solo el id: el stock se lee siempre de la base
+        Product.objects.filter(pk=product.pk).update(stock=3)
+        self.assertEqual(self.client.get('/api/products/lookup/', {'code': product.sku}).data['stock'], 3)
+
+    def test_codes_changed_elsewhere_fall_back_to_the_database(self, index):
+        first, second = self.make_product(1), self.make_product(2)
+        index.warm()
+        # Otro proceso intercambia los SKU sin pasar por las señales de este
+        Product.objects.filter(pk=first.pk).update(sku='TMP')
+        Product.objects.filter(pk=second.pk).update(sku='SKU-1')
+        Product.objects.filter(pk=first.pk).update(sku='SKU-2')
+        self.assertEqual(self.client.get('/api/products/lookup/', {'code': 'SKU-1'}).data['id'], second.pk)
+
+        Product.objects.filter(pk=second.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/products/lookup/', {'code': 'SKU-1'}).status_code, 404)
+
+    def test_batch(self, index):
+        product = self.make_product(1)
+        index.warm()
+        # Una consulta por clave primaria para los aciertos y otra por código para los fallos
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/products/lookup-batch/', {'codes': [product.ean, 'NOPE']}, format='json')
+        self.assertEqual(response.data['results'][product.ean]['id'], product.pk)
+        self.assertIsNone(response.data['results']['NOPE'])
+
+        self.assertEqual(self.client.get('/api/products/lookup/').status_code, 400)
+        for codes in ([], 'SKU-1', ['x'] * 501):
+            response = self.client.post('/api/products/lookup-batch/', {'codes': codes}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+class TenantIsolationTests(CatalogTestCase):
+    """Un usuario de la empresa A no ve ni toca nada de la empresa B."""
+
+    def setUp(self):
+        super().setUp()
+        self.company, other = Company.objects.create(name='A'), Company.objects.create(name='B')
+        self.admin.profile.company = self.company
+        self.admin.profile.save()
+        for model in (Brand, Category, Provider):
+            model.objects.filter(pk__in=[self.brand.pk, self.category.pk, self.provider.pk]).update(company=self.company)
+        self.own = self.make_product(1, company=self.company)
+        self.other_brand = Brand.objects.create(name='Makita', company=other)
+        self.other_location = Location.objects.create(code='B-1', name='Bodega B', company=other)
+        self.other = self.make_product(2, company=other, brand=self.other_brand)
+
+    def test_reads_are_scoped(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual([product['id'] for product in response.data['results']], [self.own.pk])
+        self.assertEqual(self.client.get(f'/api/products/{self.other.pk}/').status_code, 404)
+        self.assertEqual([brand['id'] for brand in self.client.get('/api/brands/').data], [self.brand.pk])
+
+        with mock.patch('api.views.code_index', new_callable=CodeIndex):
+            self.assertEqual(self.client.get('/api/products/lookup/', {'code': self.other.sku}).status_code, 404)
+            response = self.client.post('/api/products/lookup-batch/', {'codes': [self.own.sku, self.other.sku]}, format='json')
+        self.assertEqual(response.data['results'][self.own.sku]['id'], self.own.pk)
+        self.assertIsNone(response.data['results'][self.other.sku])
+
+        response = self.client.get('/api/product-history/')
+        self.assertEqual({row['id'] for row in response.data['results']}, {self.own.pk})
+        self.assertNotIn('company', response.data['results'][0])
+
+    def test_bulk_update_ignores_other_company(self):
+        response = self.client.post('/api/products/bulk-update/', {
+            'ids': [self.own.pk, self.other.pk], 'costo_cg': 1500,
+        }, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        response = self.client.post('/api/products/bulk-update/', {
+            'filters': {'stock__gte': 0}, 'costo_cg': 1700,
+        }, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.costo_cg, 1000)
+        self.assertFalse(Product.history.filter(id=self.other.pk, history_type='~').exists())
+
+    def test_writes_cannot_reference_other_company(self):
+        response = self.client.post('/api/products/', {
+            'nombre_comercial': 'Sierra', 'sku': 'SKU-9', 'costo_cg': 1, 'precio_venta': 2, 'lugar_bodega': 'A',
+            'brand_id': self.other_brand.pk, 'category_id': self.category.pk, 'provider_id': self.provider.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('brand_id', response.data)
+
+        response = self.client.post('/api/stock-movements/', {
+            'product': self.other.pk, 'quantity': 1, 'movement_type': 'IN',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product', response.data)
+
+        response = self.client.post('/api/stock-movements/', {
+            'product': self.own.pk, 'quantity': 1, 'movement_type': 'IN', 'location': self.other_location.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('location', response.data)
+
+        response = self.client.post('/api/stock-reservations/', {'product': self.other.pk, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.other.movements.count(), 0)
+
+    @override_settings(STOCK_EVENTS_MAX_STREAM_SECONDS=1, STOCK_EVENTS_POLL_SECONDS=0.05)
+    @mock.patch('api.views.stock_event_feed', new_callable=StockEventFeed)
+    async def test_stock_events_are_scoped(self, feed):
+        await StockEvent.objects.acreate(product_id=self.own.pk, company=self.company, stock=7)
+        await StockEvent.objects.acreate(product_id=self.other.pk, company_id=self.other.company_id, stock=7)
+        token = await sync_to_async(AccessToken.for_user)(self.admin)
+        response = await self.async_client.get('/api/stock-events/', {'token': str(token), 'since': 0})
+        chunks = (chunk.decode() async for chunk in response.streaming_content)
+
+        # Al retomar desde 0 se lee de la base
+        self.assertEqual(await anext(chunks), 'retry: 3000\n\n')
+        self.assertEqual(json.loads((await anext(chunks)).split('data: ')[1])['product_id'], self.own.pk)
+
+        # Lo nuevo llega por el búfer compartido, filtrado en memoria
+        await StockEvent.objects.acreate(product_id=self.other.pk, company_id=self.other.company_id, stock=1)
+        await StockEvent.objects.acreate(product_id=self.own.pk, company=self.company, stock=2)
+        payloads = [json.loads(chunk.split('data: ')[1]) async for chunk in chunks if 'data: ' in chunk]
+        self.assertEqual([(payload['product_id'], payload['stock']) for payload in payloads], [(self.own.pk, 2)])
+
+
+class PimExportTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+        self.products = [self.make_product(i) for i in range(3)]
+        self.rendered = []
+        renderers = {
+            'txt': lambda product: self.rendered.append(product.pk) or build_pim_text(product).encode('utf-8'),
+            'pdf': lambda product: self.rendered.append(product.pk) or b'%PDF-',
+        }
+        patcher = mock.patch.dict('api.pim.RENDERERS', renderers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def export(self, **params):
+        response = await self.async_client.get('/api/products/pim-sheets/', params, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        # Iterador asíncrono: bajo ASGI se envía por partes, no acumulado
+        self.assertTrue(response.is_async)
+        return response
+
+    async def zip_archive(self, **params):
+        response = await self.export(**params)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        return zipfile.ZipFile(io.BytesIO(body))
+
+    async def test_zip_contents_and_formats(self):
+        archive = await self.zip_archive()
+        self.assertEqual(sorted(archive.namelist()), [
+            'pdf/SKU-0.pdf', 'pdf/SKU-1.pdf', 'pdf/SKU-2.pdf', 'txt/SKU-0.txt', 'txt/SKU-1.txt', 'txt/SKU-2.txt',
+        ])
+        self.assertIn('SKU:      SKU-1', archive.read('txt/SKU-1.txt').decode())
+
+        archive = await self.zip_archive(formats='txt,', brand=self.brand.pk)
+        self.assertEqual(len(archive.namelist()), 3)
+        for formats in ('', 'doc', 'txt,doc'):
+            response = await self.async_client.get('/api/products/pim-sheets/', {'formats': formats}, headers=self.headers)
+            self.assertEqual(response.status_code, 400, formats)
+
+    async def test_unchanged_sheets_come_from_the_cache(self):
+        await self.zip_archive(formats='txt')
+        self.assertEqual(len(self.rendered), 3)
+        product = self.products[0]
+        product.precio_venta = 9990
+        await product.asave()
+        await self.zip_archive(formats='txt')
+        # Solo se vuelve a generar la ficha del producto editado (updated_at)
+        self.assertEqual(self.rendered[3:], [product.pk])
+
+    @mock.patch('api.pim.PIM_CHUNK_SIZE', 1)
+    async def test_first_block_before_the_rest_is_rendered(self):
+        response = await self.export(formats='txt')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue(await anext(chunks))
+        self.assertEqual(len(self.rendered), 1)
+        rest = [chunk async for chunk in chunks]
+        self.assertEqual(len(self.rendered), 3)
+        self.assertGreater(len(rest), 2)
+
+
+class AbcClassificationTests(CatalogTestCase):
+    def sell(self, product, quantity, days_ago=0):
+        # Solo el registro de la salida: el saldo por ubicación no interesa aquí
+        [movement] = StockMovement.objects.bulk_create([
+            StockMovement(product=product, quantity=quantity, movement_type='OUT', user=self.admin),
+        ])
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+
+    def test_boundaries_and_units_without_history(self):
+        # Ingresos 50/30/15/5 de un total de 100 (precio 1000)
+        products = [self.make_product(i, precio_venta=1000) for i in range(4)]
+        for product, quantity in zip(products, (10, 6, 3, 1)):
+            self.sell(product, quantity)
+        self.sell(products[3], 5, days_ago=120)
+        inactive = self.make_product(8, precio_venta=1000)
+        self.sell(inactive, 9)
+        Product.objects.filter(pk=inactive.pk).update(is_active=False, abc_class='A', ventas_unidades=7)
+        unsold = self.make_product(9)
+        history = Product.history.count()
+
+        self.assertEqual(classify_abc(days=90, threshold_a=80, threshold_b=95), {'A': 2, 'B': 1})
+        # A: el acumulado previo (0, 50) está bajo 80; B: 80 < 95; C: 95 no está bajo 95
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'abc_class')),
+            {products[0].pk: 'A', products[1].pk: 'A', products[2].pk: 'B', products[3].pk: 'C', inactive.pk: 'C', unsold.pk: 'C'},
+        )
+        # Solo cuentan las salidas de la ventana, y los inactivos vuelven a 0
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'ventas_unidades')),
+            {products[0].pk: 10, products[1].pk: 6, products[2].pk: 3, products[3].pk: 1, inactive.pk: 0, unsold.pk: 0},
+        )
+        self.assertEqual(Product.history.count(), history)
+
+    def test_each_company_is_ranked_separately(self):
+        other = Company.objects.create(name='B')
+        own, foreign = self.make_product(1, precio_venta=1000), self.make_product(2, precio_venta=1, company=other)
+        self.sell(own, 10)
+        self.sell(foreign, 1)
+        self.assertEqual(classify_abc(), {'A': 2, 'B': 0})
+
+
+class InventoryValuationTests(CatalogTestCase):
+    def test_rebuild_is_an_upsert(self):
+        self.make_product(1)
+        self.make_product(2, lugar_bodega='Pasillo B')
+        rebuild_inventory_valuation()
+        Product.objects.filter(lugar_bodega='Pasillo B').update(is_active=False)
+        rebuild_inventory_valuation()
+
+        # Sin duplicados ni grupos que ya no existen
+        rows = InventoryValuation.objects.filter(dimension='lugar_bodega')
+        self.assertEqual(list(rows.values_list('key', 'unidades')), [('Pasillo A', 10)])
+        self.assertEqual(InventoryValuation.objects.count(), 4)
+
+    @mock.patch('api.views.schedule_valuation_rebuild')
+    def test_stale_snapshot_is_served_without_rebuilding(self, schedule):
+        self.make_product(1)
+        rebuild_inventory_valuation()
+        InventoryValuation.objects.update(computed_at='2020-01-01T00:00:00Z')
+
+        response = self.client.get('/api/analytics/valuation/?dimension=brand')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['stale'])
+        self.assertTrue(response.data['refreshing'])
+        self.assertEqual(response.data['computed_at'].year, 2020)
+        self.assertEqual(len(response.data['results']), 1)
+        schedule.assert_called_once()
+
+    @mock.patch('api.views.schedule_valuation_rebuild')
+    def test_fresh_snapshot_does_not_schedule(self, schedule):
+        self.make_product(1)
+        rebuild_inventory_valuation()
+        response = self.client.get('/api/analytics/valuation/')
+        self.assertFalse(response.data['stale'])
+        schedule.assert_not_called()
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.client.get('/api/analytics/valuation/').status_code, 403)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Los planes esperados son los de SQLite')
+class ProductRangeIndexTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(50):
+            self.make_product(i, stock=i, precio_venta=1000 * i, is_active=i % 5 != 0)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def plan(self, params):
+        # Mismo queryset base que ProductViewSet.get_queryset
+        return ProductFilter(params, queryset=Product.objects.filter(is_active=True)).qs.explain()
+
+    def test_stock_lt_uses_partial_index(self):
+        self.assertIn('USING INDEX product_active_stock_idx', self.plan({'stock__lt': '5'}))
+
+    def test_price_range_uses_partial_index(self):
+        plan = self.plan({'precio_venta__gte': '1000', 'precio_venta__lte': '3000'})
+        self.assertIn('USING INDEX product_active_precio_idx (precio_venta>? AND precio_venta<?)', plan)
+
+
+class DuplicateDetectionTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.drill = self.make_product(1, nombre_comercial='Taladro Percutor Pro 750W')
+        self.drill_typo = self.make_product(2, nombre_comercial='Taladro percutor PRO 750 W')
+        self.tv = self.make_product(3, nombre_comercial='Smart TV 4K 55 pulgadas')
+
+    def test_index_is_maintained_on_save(self):
+        self.assertEqual(ProductSignature.objects.count(), 3)
+        self.assertEqual(ProductBand.objects.filter(product=self.tv).count(), 16)
+        keys = set(ProductBand.objects.filter(product=self.tv).values_list('key', flat=True))
+
+        # Guardar sin cambiar la firma no reescribe las bandas
+        self.tv.stock = 3
+        self.tv.save()
+        self.assertEqual(set(ProductBand.objects.filter(product=self.tv).values_list('key', flat=True)), keys)
+
+        self.tv.nombre_comercial = 'Refrigerador No Frost'
+        self.tv.save()
+        self.assertNotEqual(set(ProductBand.objects.filter(product=self.tv).values_list('key', flat=True)), keys)
+
+    def test_find_duplicates_uses_stored_bands(self):
+        pairs = find_duplicates(Product.objects.all())
+        self.assertEqual([(min(a, b), max(a, b)) for a, b, _ in pairs], [(self.drill.pk, self.drill_typo.pk)])
+
+    @mock.patch('api.duplicates.MAX_BUCKET_PAIRS', 2)
+    def test_oversize_buckets_are_reported(self):
+        copy = self.make_product(4, nombre_comercial='Taladro Percutor Pro 750W')
+        with self.assertLogs('api.duplicates', 'WARNING') as logs:
+            pairs = find_duplicates(Product.objects.all())
+        self.assertIn('se compararon solo contra su primer miembro', logs.output[0])
+        # Solo contra el primero del balde: el par typo/copia no se llega a comparar
+        self.assertEqual({(min(a, b), max(a, b)) for a, b, _ in pairs}, {(self.drill.pk, self.drill_typo.pk), (self.drill.pk, copy.pk)})
+
+    def test_find_similar_ignores_inactive_and_self(self):
+        self.assertEqual([pk for pk, _ in find_similar(self.drill)], [self.drill_typo.pk])
+        self.drill_typo.is_active = False
+        self.drill_typo.save()
+        self.assertEqual(find_similar(self.drill), [])
+
+    def test_create_reports_possible_duplicates(self):
+        response = self.client.post('/api/products/', {
+            'nombre_comercial': 'Taladro Percutor PRO 750w', 'ean': '7809999999999', 'sku': 'SKU-NEW',
+            'dimensiones': '10x20x30', 'descripcion': 'd', 'costo_cg': 1000, 'lugar_bodega': 'Pasillo A',
+            'precio_venta': 2000, 'brand_id': self.brand.pk, 'category_id': self.category.pk, 'provider_id': self.provider.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({match['id'] for match in response.data['posibles_duplicados']}, {self.drill.pk, self.drill_typo.pk})
+
+
+class DefaultLocationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(1, stock=0)
+        StockMovement.objects.create(product=self.product, quantity=10, movement_type='IN', user=self.admin)
+
+    def balances(self):
+        return dict(StockBalance.objects.filter(product=self.product, quantity__gt=0).values_list('location__code', 'quantity'))
+
+    def test_edit_moves_balance_to_new_location(self):
+        response = self.client.patch(f'/api/products/{self.product.pk}/', {'lugar_bodega': 'Pasillo B'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balances(), {'Pasillo B': 10})
+        self.assertTrue(StockMovement.objects.filter(product=self.product, movement_type='TRF', quantity=10).exists())
+
+        # Una salida sin ubicación usa el nuevo lugar y encuentra el stock
+        self.product.refresh_from_db()
+        StockMovement.objects.create(product=self.product, quantity=4, movement_type='OUT', user=self.admin)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+        self.assertEqual(self.balances(), {'Pasillo B': 6})
+
+    def test_bulk_update_moves_balances(self):
+        other = self.make_product(2, stock=0)
+        StockMovement.objects.create(product=other, quantity=3, movement_type='IN', user=self.admin)
+        response = self.client.post('/api/products/bulk-update/', {
+            'ids': [self.product.pk, other.pk], 'lugar_bodega': 'Bodega 2',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balances(), {'Bodega 2': 10})
+
+        # recalcular_stock llega al mismo saldo: el traspaso quedó como movimiento
+        self.product.recalcular_stock()
+        self.assertEqual(self.balances(), {'Bodega 2': 10})
+
+    def test_stock_elsewhere_stays(self):
+        rack = Location.objects.create(code='R-1', name='Rack 1')
+        StockMovement.objects.create(
+            product=self.product, quantity=4, movement_type='TRF',
+            location=Location.for_product(self.product), destination=rack, user=self.admin,
+        )
+        self.product.lugar_bodega = 'Pasillo C'
+        self.product.save()
+        self.assertEqual(self.balances(), {'Pasillo C': 6, 'R-1': 4})
+
+
+class PickingListTests(CatalogTestCase):
+    def test_route_order_and_validation(self):
+        far = self.make_product(1, lugar_bodega='P3-R10-N1')
+        near = self.make_product(2, lugar_bodega='P1-R02-N1')
+        response = self.client.post('/api/products/picking-list/', {'lines': [
+            {'product': far.pk, 'quantity': 1}, {'product': near.pk, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([line['product'] for line in response.data['lines']], [near.pk, far.pk])
+
+        for quantity in (0, -3):
+            response = self.client.post('/api/products/picking-list/', {'lines': [
+                {'product': far.pk, 'quantity': quantity},
+            ]}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+class StockReservationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(1, stock=0)
+        StockMovement.objects.create(product=self.product, quantity=10, movement_type='IN', user=self.admin)
+
+    def reserve(self, quantity, **data):
+        return self.client.post('/api/stock-reservations/', {'product': self.product.pk, 'quantity': quantity, **data}, format='json')
+
+    def reserved(self):
+        self.product.refresh_from_db()
+        return self.product.reserved
+
+    @override_settings(RESERVATION_DEFAULT_TTL_MINUTES=7)
+    def test_ttl(self):
+        before = timezone.now()
+        response = self.reserve(2, ttl_minutes=5)
+        self.assertEqual(response.status_code, 201)
+        expires_at = StockReservation.objects.get(pk=response.data['id']).expires_at
+        self.assertAlmostEqual((expires_at - before).total_seconds(), 300, delta=5)
+
+        response = self.reserve(2)
+        expires_at = StockReservation.objects.get(pk=response.data['id']).expires_at
+        self.assertAlmostEqual((expires_at - before).total_seconds(), 420, delta=5)
+
+        self.assertEqual(self.reserve(1, ttl_minutes=0).status_code, 400)
+        self.assertEqual(self.reserved(), 4)
+
+    def test_expired_reservations_release_stock(self):
+        self.assertEqual(self.reserve(8).status_code, 201)
+        self.assertEqual(self.reserve(3).status_code, 400)
+        reservation = StockReservation.objects.get()
+        StockReservation.objects.filter(pk=reservation.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        # Reservar libera las vencidas del producto aunque el barrido no haya pasado
+        self.assertEqual(self.reserve(3).status_code, 201)
+        reservation.refresh_from_db()
+        self.assertEqual((reservation.status, self.reserved()), ('EXPIRED', 3))
+        response = self.client.post(f'/api/stock-reservations/{reservation.pk}/convert/')
+        self.assertEqual(response.status_code, 400)
+
+        # El barrido es idempotente: una reserva se libera una sola vez
+        StockReservation.objects.filter(status='ACTIVE').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(expire_reservations(), 1)
+        self.assertEqual(expire_reservations(), 0)
+        self.assertEqual(self.reserved(), 0)
+
+    def test_convert_and_cancel(self):
+        sale = self.reserve(4).data['id']
+        other = self.reserve(2).data['id']
+        response = self.client.post(f'/api/stock-reservations/{sale}/convert/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'CONVERTED')
+        self.assertEqual(self.client.post(f'/api/stock-reservations/{other}/cancel/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/stock-reservations/{other}/cancel/').status_code, 400)
+
+        self.assertEqual(self.reserved(), 0)
+        self.assertEqual(self.product.stock, 6)
+        self.assertEqual(StockReservation.objects.get(pk=sale).movement.quantity, 4)
+
+
+class MediaDeliveryTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.root, MEDIA_DELIVERY='django')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.body = bytes(range(256)) * 4
+        self.sha = hashlib.sha256(self.body).hexdigest()
+        self.hashed = f'products/{self.sha}.jpg'
+        for name in (self.hashed, 'legacy/foto.jpg'):
+            os.makedirs(os.path.join(self.root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.root, name), 'wb') as fh:
+                fh.write(self.body)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', headers=headers)
+
+    def test_validators_and_cache_control(self):
+        response = self.get(self.hashed)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        self.assertEqual(response['ETag'], f'"{self.sha}"')
+        # Nombre por contenido: la URL cambia si cambia el archivo
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.get('legacy/foto.jpg')['Cache-Control'], 'public, max-age=3600')
+
+        response = self.get(self.hashed, if_none_match=f'"{self.sha}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], f'"{self.sha}"')
+        self.assertEqual(self.get(self.hashed, if_none_match='"otro"').status_code, 200)
+        self.assertEqual(self.get('products/no-existe.jpg').status_code, 404)
+
+    def test_single_byte_range(self):
+        response = self.get(self.hashed, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), self.body[10:20])
+
+        response = self.get(self.hashed, range='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-5:])
+        # If-Range con otro validador: se entrega el archivo completo
+        response = self.get(self.hashed, range='bytes=10-19', if_range='"otro"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=2000-', 'bytes=20-10', 'bytes=-0'):
+            response = self.get(self.hashed, range=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_front_server_modes(self):
+        with override_settings(MEDIA_DELIVERY='x-accel', MEDIA_ACCEL_PREFIX='/protected-media/'):
+            response = self.get(self.hashed)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.hashed}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with override_settings(MEDIA_DELIVERY='x-sendfile'):
+            response = self.get(self.hashed)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.root, self.hashed))
+
+
+class ProductImageTestCase(CatalogTestCase):
+    """Catálogo con un MEDIA_ROOT temporal para las imágenes."""
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = self.make_product(1)
+
+    def image_file(self, name, size=(40, 30), color=(200, 30, 30), fmt='JPEG'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, format=fmt)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.root)
+            for directory, _, names in os.walk(self.root) for name in names
+        )
+
+
+class ProductImageBatchTests(ProductImageTestCase):
+    def upload(self, *files, **data):
+        return self.client.post('/api/product-images/batch/', {'product': self.product.pk, 'images': list(files), **data}, format='multipart')
+
+    def test_first_image_becomes_principal(self):
+        response = self.upload(self.image_file('a.jpg'), self.image_file('b.jpg', color=(0, 0, 255)))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([image['is_principal'] for image in response.data], [True, False])
+        # bulk_create no dispara post_save: la vista sincroniza imagen_principal
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.imagen_principal_id, response.data[0]['id'])
+        self.assertEqual(ProductImage.history.filter(history_type='+', history_user=self.admin).count(), 2)
+
+        # Ya tiene principal: un lote sin `principal` no la cambia
+        response = self.upload(self.image_file('c.jpg', color=(0, 255, 0)))
+        self.assertFalse(response.data[0]['is_principal'])
+        self.product.refresh_from_db()
+        self.assertEqual(ProductImage.objects.get(is_principal=True).pk, self.product.imagen_principal_id)
+
+    def test_principal_index_demotes_the_old_one(self):
+        old = self.upload(self.image_file('a.jpg')).data[0]['id']
+        response = self.upload(self.image_file('b.jpg', color=(0, 0, 255)), self.image_file('c.jpg', color=(0, 255, 0)), principal=1)
+        self.assertEqual(response.status_code, 201)
+        new = response.data[1]['id']
+        self.assertEqual(list(ProductImage.objects.filter(is_principal=True).values_list('pk', flat=True)), [new])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.imagen_principal_id, new)
+        # La degradación de la anterior queda en su historial
+        demoted = ProductImage.history.filter(id=old).latest('history_id')
+        self.assertEqual((demoted.history_type, demoted.is_principal, demoted.history_user), ('~', False, self.admin))
+
+        for principal in ('2', '-1', 'x'):
+            response = self.upload(self.image_file('d.jpg'), principal=principal)
+            self.assertEqual(response.status_code, 400, principal)
+
+    def test_one_invalid_file_rejects_the_batch(self):
+        response = self.upload(
+            self.image_file('a.jpg'),
+            SimpleUploadedFile('notas.txt', b'no soy una imagen'),
+            self.image_file('b.bmp', fmt='BMP'),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['images']), {'notas.txt', 'b.bmp'})
+        self.assertIn('no permitido', str(response.data['images']['b.bmp']))
+        self.assertFalse(ProductImage.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+
+class ContentAddressedStorageTests(ProductImageTestCase):
+    def test_name_comes_from_the_content(self):
+        upload = self.image_file('Foto.JPG')
+        sha = hashlib.sha256(upload.read()).hexdigest()
+        upload.seek(0)
+        self.assertEqual(product_image_storage.save('product_images/Foto.JPG', upload), f'product_images/{sha[:2]}/{sha}.jpg')
+
+    def test_products_share_one_file(self):
+        other = self.make_product(2)
+        first = ProductImage.objects.create(product=self.product, image=self.image_file('a.jpg'))
+        second = ProductImage.objects.create(product=other, image=self.image_file('otra.jpg'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self.stored_files(), [first.image.name])
+
+        # Borrar una de las imágenes no borra el archivo compartido
+        first.delete()
+        self.assertTrue(product_image_storage.exists(second.image.name))
+
+    def test_writes_a_temporary_file_and_renames_it(self):
+        renames = []
+
+        def replace(source, target):
+            # Al renombrar, el nombre definitivo todavía no existe
+            self.assertFalse(os.path.exists(target))
+            renames.append((os.path.relpath(source, self.root), os.path.relpath(target, self.root)))
+            os.rename(source, target)
+
+        with mock.patch('api.storage.os.replace', side_effect=replace):
+            name = product_image_storage.save('product_images/a.jpg', self.image_file('a.jpg'))
+            # Mismo contenido: ya existe, no se vuelve a escribir
+            product_image_storage.save('product_images/b.jpg', self.image_file('b.jpg'))
+        [(source, target)] = renames
+        self.assertEqual(target, name)
+        self.assertTrue(source.startswith(f'{name}.') and source.endswith('.tmp'))
+        self.assertEqual(self.stored_files(), [name])
+
+
+class DedupeProductImagesTests(ProductImageTestCase):
+    def legacy(self, name, content):
+        path = os.path.join(self.root, 'product_images', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        return f'product_images/{name}'
+
+    def test_moves_legacy_files_and_rewrites_history(self):
+        content = self.image_file('a.jpg').read()
+        sha = hashlib.sha256(content).hexdigest()
+        hashed = f'product_images/{sha[:2]}/{sha}.jpg'
+        first = ProductImage.objects.create(product=self.product, image=self.legacy('foto.jpg', content))
+        second = ProductImage.objects.create(product=self.make_product(2), image=self.legacy('foto_copia.JPG', content))
+        # Una versión anterior de la imagen apunta a otro archivo antiguo
+        old = self.legacy('vieja.jpg', content)
+        ProductImage.history.filter(id=first.pk).update(image=old)
+
+        call_command('dedupe_product_images', '--dry-run', stdout=StringIO())
+        self.assertEqual(self.stored_files(), ['product_images/foto.jpg', 'product_images/foto_copia.JPG', 'product_images/vieja.jpg'])
+        self.assertEqual(ProductImage.objects.get(pk=first.pk).image.name, 'product_images/foto.jpg')
+
+        out = StringIO()
+        call_command('dedupe_product_images', stdout=out)
+        self.assertIn('3 archivos migrados a 1 archivos únicos', out.getvalue())
+        self.assertEqual(self.stored_files(), [hashed])
+        self.assertEqual(set(ProductImage.objects.values_list('image', flat=True)), {hashed})
+        self.assertEqual(set(ProductImage.history.filter(id__in=[first.pk, second.pk]).values_list('image', flat=True)), {hashed})
+
+
+class ImageDerivativeTests(ProductImageTestCase):
+    def build(self, **kwargs):
+        name = product_image_storage.save('product_images/a.png', self.image_file('a.png', fmt='PNG', **kwargs))
+        return build_derivatives(name)
+
+    def test_widths_and_formats(self):
+        result = self.build(size=(800, 400))
+        self.assertEqual((result['width'], result['height']), (800, 400))
+        for fmt, pil_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            # 1024 es más ancho que el original: no se genera
+            self.assertEqual(sorted(result[fmt], key=int), ['160', '320', '640'])
+            for width, path in result[fmt].items():
+                with product_image_storage.open(path) as fh, Image.open(fh) as img:
+                    self.assertEqual((img.format, img.size), (pil_format, (int(width), int(width) // 2)))
+
+    def test_small_images_are_never_upscaled(self):
+        result = self.build(size=(100, 50))
+        self.assertEqual(list(result['webp']), ['100'])
+        with product_image_storage.open(result['jpeg']['100']) as fh, Image.open(fh) as img:
+            self.assertEqual(img.size, (100, 50))
+
+    def test_background_task_stores_them(self):
+        image = ProductImage.objects.create(product=self.product, image=self.image_file('a.jpg', size=(400, 300)))
+        with mock.patch('api.images.connection'):
+            generate_derivatives(image.pk)
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives['source'], image.image.name)
+        self.assertEqual(srcset(image.derivatives, 'webp', url=str).split(', ')[0], f"{image.derivatives['webp']['160']} 160w")
+
+
+@override_settings(IMAGE_MAX_DIMENSION=100, IMAGE_MAX_PIXELS=6000, IMAGE_MAX_UPLOAD_SIZE=50_000)
+class InspectImageTests(ProductImageTestCase):
+    def assertRejected(self, upload, reason):
+        with self.assertRaisesMessage(ValueError, reason):
+            inspect_image(upload)
+
+    def test_accepts_from_the_header_alone(self):
+        upload = self.image_file('a.png', size=(80, 60), fmt='PNG')
+        # Sin los datos de píxeles: basta la cabecera
+        truncated = SimpleUploadedFile('a.png', upload.read()[:64])
+        self.assertEqual(inspect_image(truncated), ('PNG', 80, 60))
+        self.assertEqual(truncated.tell(), 0)
+
+    def test_rejections(self):
+        self.assertRejected(self.image_file('a.bmp', fmt='BMP'), 'Formato BMP no permitido')
+        self.assertRejected(self.image_file('a.png', size=(101, 10), fmt='PNG'), 'el lado máximo es 100 px')
+        self.assertRejected(self.image_file('a.png', size=(90, 90), fmt='PNG'), 'La imagen tiene 0.0 MP')
+        self.assertRejected(SimpleUploadedFile('a.jpg', b'x' * 50_001), 'El archivo pesa 0.0 MB')
+        self.assertRejected(SimpleUploadedFile('a.jpg', b'texto'), 'No es una imagen válida')
+
+
+class GcMediaTests(ProductImageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = ProductImage.objects.create(product=self.product, image=self.image_file('a.jpg'))
+        # La versión anterior sigue en el historial
+        self.previous = self.image.image.name
+        self.image.image = self.image_file('b.jpg', color=(0, 0, 255))
+        self.image.save()
+        self.derivative = product_image_storage.save('product_images/derivatives/b_160w.webp', self.image_file('c.jpg', color=(0, 255, 0)))
+        ProductImage.objects.filter(pk=self.image.pk).update(derivatives={'webp': {'160': self.derivative}})
+        self.orphan = product_image_storage.save('product_images/x.jpg', self.image_file('x.jpg', color=(9, 9, 9)))
+        self.fresh = product_image_storage.save('product_images/y.jpg', self.image_file('y.jpg', color=(8, 8, 8)))
+
+        # Todo es antiguo salvo la subida en curso
+        old = time.time() - 2 * 3600
+        for name in self.stored_files():
+            if name != self.fresh:
+                os.utime(os.path.join(self.root, name), (old, old))
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        files = self.stored_files()
+        self.assertIn('1 huérfanos', self.gc('--dry-run'))
+        self.assertEqual(self.stored_files(), files)
+
+    def test_only_old_orphans_are_deleted(self):
+        out = self.gc('--min-age', '60')
+        self.assertIn('1 huérfanos recientes', out)
+        self.assertEqual(self.stored_files(), sorted([self.image.image.name, self.previous, self.derivative, self.fresh]))
+
+        # Sin edad mínima también cae la subida reciente, pero nada referenciado
+        self.gc('--min-age', '0')
+        self.assertEqual(self.stored_files(), sorted([self.image.image.name, self.previous, self.derivative]))
+
+
+class ImagenPrincipalTests(ProductImageTestCase):
+    def principal(self):
+        return Product.objects.values_list('imagen_principal', flat=True).get(pk=self.product.pk)
+
+    def add(self, color, **kwargs):
+        return ProductImage.objects.create(product=self.product, image=self.image_file('a.jpg', color=color), **kwargs)
+
+    def test_recomputed_on_save_and_delete(self):
+        first = self.add((1, 1, 1))
+        self.assertEqual(self.principal(), first.pk)
+        second = self.add((2, 2, 2), is_principal=True)
+        self.assertEqual(self.principal(), second.pk)
+
+        # Sin principal marcada queda la primera subida
+        second.is_principal = False
+        second.save()
+        self.assertEqual(self.principal(), first.pk)
+        first.delete()
+        self.assertEqual(self.principal(), second.pk)
+        second.delete()
+        self.assertIsNone(self.principal())
+
+    def test_list_queries_do_not_grow_with_the_page(self):
+        def list_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/products/')
+            self.assertNotIn('images', response.data['results'][0])
+            return len(queries)
+
+        self.add((1, 1, 1))
+        few = list_queries()
+        for i in range(2, 7):
+            product = self.make_product(i)
+            ProductImage.objects.create(product=product, image=self.image_file('a.jpg', color=(i, i, i)))
+        self.assertEqual(list_queries(), few)
+
+
+class ProductHistoryFeedTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.drill, self.saw = self.make_product(1), self.make_product(2)
+        self.drill.precio_venta = 2500
+        self.drill.save()
+        history = Product.history.order_by('history_id')
+        created_drill, created_saw, edited_drill = history
+        history.filter(pk=created_drill.pk).update(history_date=datetime(2025, 1, 5, tzinfo=dt_timezone.utc))
+        history.filter(pk=created_saw.pk).update(history_date=datetime(2025, 2, 5, tzinfo=dt_timezone.utc), history_user=self.seller)
+        history.filter(pk=edited_drill.pk).update(history_date=datetime(2025, 3, 5, tzinfo=dt_timezone.utc), history_user=self.admin)
+        self.rows = [edited_drill.pk, created_saw.pk, created_drill.pk]
+
+    def feed(self, **params):
+        response = self.client.get('/api/product-history/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['history_id'] for row in response.data['results']]
+
+    def test_filters(self):
+        edited_drill, created_saw, created_drill = self.rows
+        self.assertEqual(self.feed(), self.rows)
+        self.assertEqual(self.feed(product=self.drill.pk), [edited_drill, created_drill])
+        self.assertEqual(self.feed(user=self.seller.pk), [created_saw])
+        self.assertEqual(self.feed(history_type='~'), [edited_drill])
+        self.assertEqual(self.feed(date_from='2025-02-01', date_to='2025-02-28'), [created_saw])
+        self.assertEqual(self.feed(date_from='2025-02-05T00:00:00Z'), [edited_drill, created_saw])
+        self.assertEqual(self.client.get('/api/product-history/', {'history_type': 'x'}).status_code, 400)
+
+    def test_cursor_pages_in_order(self):
+        for i in range(3, 6):
+            self.make_product(i)
+        # Misma fecha para todas: el desempate es history_id descendente
+        Product.history.update(history_date=datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        expected = list(Product.history.order_by('-history_id').values_list('history_id', flat=True))
+
+        seen, url = [], '/api/product-history/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [row['history_id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 6)
+
+
+class HistoryDiffTests(CatalogTestCase):
+    def diffs(self, **params):
+        response = self.client.get('/api/product-history/diffs/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_each_revision_against_the_previous_one(self):
+        product = self.make_product(1)
+        other_brand = Brand.objects.create(name='Makita')
+        product.precio_venta = 2500
+        product.save()
+        product.brand = other_brand
+        product.save()
+        self.make_product(2).save()
+
+        rows = self.diffs(product=product.pk)
+        self.assertEqual([row['history_type'] for row in rows], ['~', '~', '+'])
+        self.assertEqual(rows[0]['changes'], [{'field': 'brand', 'old': 'Bosch', 'new': 'Makita'}])
+        self.assertEqual(rows[1]['changes'], [{'field': 'precio_venta', 'old': 2000, 'new': 2500}])
+        self.assertEqual(rows[2]['changes'], [])
+
+        # La anterior se encuentra aunque quede fuera de la página o del filtro
+        rows = self.diffs(product=product.pk, history_type='~', page_size=1)
+        self.assertEqual(rows[0]['changes'], [{'field': 'brand', 'old': 'Bosch', 'new': 'Makita'}])
+
+    def test_queries_do_not_grow_with_the_page(self):
+        for i in range(3):
+            product = self.make_product(i)
+            product.precio_venta = 3000
+            product.save()
+        # La página (con previous_id en subconsulta) y las anteriores por clave primaria
+        for page_size in (2, 6):
+            with self.assertNumQueries(2):
+                self.assertEqual(len(self.diffs(page_size=page_size)), page_size)
+
+
+class CatalogAsOfTests(CatalogTestCase):
+    def dated(self, product, *days):
+        """Fecha las revisiones del producto, de la más antigua a la más nueva."""
+        revisions = Product.history.filter(id=product.pk).order_by('history_id')
+        for revision, day in zip(list(revisions), days):
+            Product.history.filter(history_id=revision.history_id).update(
+                history_date=datetime(2024, *day, 12, tzinfo=dt_timezone.utc),
+            )
+
+    def as_of(self, date, **params):
+        return self.client.get('/api/products/as-of/', {'date': date, **params})
+
+    def test_state_at_each_date(self):
+        drill = self.make_product(1)
+        drill.precio_venta = 2500
+        drill.save()
+        self.dated(drill, (1, 10), (2, 10))
+        saw = self.make_product(2)
+        pk = saw.pk
+        saw.delete()
+        self.dated(Product(pk=pk), (1, 20), (1, 25))
+        self.dated(self.make_product(3), (3, 1))
+
+        def prices(date):
+            response = self.as_of(date)
+            self.assertEqual(response.status_code, 200)
+            return {row['id']: row['precio_venta'] for row in response.data['results']}
+
+        self.assertEqual(prices('2024-01-05'), {})
+        self.assertEqual(prices('2024-01-22'), {drill.pk: 2000, pk: 2000})
+        self.assertEqual(prices('2024-01-31'), {drill.pk: 2000})
+        self.assertEqual(len(prices('2024-03-01')), 2)
+        # Una fecha-hora corta el día: el cambio de las 12:00 todavía no está
+        self.assertEqual(prices('2024-02-10T11:00:00Z'), {drill.pk: 2000})
+        self.assertEqual(prices('2024-02-10'), {drill.pk: 2500})
+
+    async def test_stream_sends_each_page_before_fetching_the_next(self):
+        for i in range(3):
+            await sync_to_async(self.make_product)(i)
+        pages = []
+
+        def one_row_pages(queryset, after):
+            pages.append(after)
+            return as_of_page(queryset, after, limit=1)
+
+        headers = {'Authorization': f'Bearer {await sync_to_async(AccessToken.for_user)(self.admin)}'}
+        with mock.patch('api.history.as_of_page', one_row_pages):
+            response = await self.async_client.get('/api/products/as-of/', {'date': '2099-01-01', 'stream': '1'}, headers=headers)
+            self.assertTrue(response.is_async)
+            chunks = aiter(response.streaming_content)
+            first = await anext(chunks)
+            self.assertEqual(len(pages), 1)
+            lines = [first] + [chunk async for chunk in chunks]
+        self.assertEqual([json.loads(line)['sku'] for line in lines], ['SKU-0', 'SKU-1', 'SKU-2'])
+        self.assertEqual(len(pages), 4)
+
+    def test_invalid_dates_are_400(self):
+        for date in ('', 'ayer', '2024-02-30', '2024-13-01T00:00', '2024-01-01T25:00'):
+            self.assertEqual(self.as_of(date).status_code, 400, date)
+
+
+class CascadeDeactivationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [self.make_product(i) for i in range(3)]
+
+    def reasons(self):
+        return list(
+            Product.history.filter(history_change_reason="Descontinuado por Marca 'Bosch'")
+            .order_by('id').values_list('id', 'is_active', 'history_user')
+        )
+
+    def test_small_cascade_in_the_request(self):
+        response = self.client.delete(f'/api/brands/{self.brand.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Product.objects.filter(is_active=True).exists())
+        # Una revisión por producto, con el motivo y el usuario
+        self.assertEqual(self.reasons(), [(product.pk, False, self.admin.pk) for product in self.products])
+
+    def crashed_job(self, status, heartbeat_minutes_ago):
+        """Trabajo que alcanzó a apagar el primer producto antes de detenerse."""
+        self.brand.is_active = False
+        self.brand.save()
+        list(deactivate_products([self.products[0].pk], self.admin, "Descontinuado por Marca 'Bosch'"))
+        return DeactivationJob.objects.create(
+            target='brand', target_id=self.brand.pk, target_name='Bosch', total=3, processed=1, user=self.admin,
+            status=status, heartbeat_at=timezone.now() - timedelta(minutes=heartbeat_minutes_ago),
+        )
+
+    def resume(self, job):
+        with mock.patch('api.cascades._executor') as executor, mock.patch('api.cascades.connection'):
+            executor.submit.side_effect = lambda function, *args: function(*args)
+            return self.client.post(f'/api/deactivation-jobs/{job.pk}/resume/')
+
+    @override_settings(CASCADE_SYNC_MAX_PRODUCTS=1)
+    def test_large_cascade_becomes_a_job(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.delete(f'/api/brands/{self.brand.pk}/')
+        self.assertEqual(response.status_code, 202)
+        job = DeactivationJob.objects.get(pk=response.data['id'])
+        self.assertEqual((job.status, job.total), ('PENDING', 3))
+
+        with mock.patch('api.cascades._executor') as executor, mock.patch('api.cascades.connection'):
+            executor.submit.side_effect = lambda function, *args: function(*args)
+            callbacks[0]()
+            # Una segunda corrida no puede reclamar el trabajo
+            run_deactivation_job(job.pk, [product.pk for product in self.products], 'otra corrida')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('DONE', 3))
+        self.assertEqual(len(self.reasons()), 3)
+
+    def test_api_resumes_failed_job_without_repeating(self):
+        job = self.crashed_job('FAILED', 1)
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.resume(job).status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.resume(job).status_code, 202)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.error), ('DONE', 3, ''))
+        self.assertEqual(self.reasons(), [(product.pk, False, self.admin.pk) for product in self.products])
+        self.assertEqual(self.resume(job).status_code, 400)
+
+    def test_running_job_is_left_to_its_worker(self):
+        job = self.crashed_job('RUNNING', 1)
+        self.assertEqual(self.resume(job).status_code, 409)
+        with mock.patch('api.cascades.connection'):
+            call_command('resume_deactivation_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('RUNNING', 1))
+        self.assertEqual(Product.objects.filter(is_active=True).count(), 2)
+
+    @override_settings(DEACTIVATION_JOB_STALE_MINUTES=10)
+    def test_command_resumes_stale_running_jobs(self):
+        job = self.crashed_job('RUNNING', 11)
+        # Por la API un RUNNING nunca se reanuda: puede seguir vivo en otro worker
+        self.assertEqual(self.resume(job).status_code, 409)
+        with mock.patch('api.cascades.connection'):
+            call_command('resume_deactivation_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('DONE', 3))
+        self.assertEqual(len(self.reasons()), 3)
+
+
+class AsgiStreamingTests(CatalogTestCase):
+    """
+    Las exportaciones pasan por la aplicación ASGI de producción (backend.asgi)
+    y llegan por partes: un cuerpo síncrono se acumularía entero en memoria.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for i in range(3):
+            self.make_product(i)
+        self.token = str(AccessToken.for_user(self.admin))
+        self.progress = []
+
+    async def call(self, path, query):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {self.token}'.encode())],
+        }
+        requested = False
+        bodies = []
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Cliente que no se desconecta
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                self.assertEqual(message['status'], 200)
+            elif message.get('body'):
+                bodies.append((message['body'], len(self.progress)))
+
+        # Como el cliente de pruebas: sin cerrar la conexión de la transacción del test
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            with warnings.catch_warnings():
+                warnings.filterwarnings('error', message='StreamingHttpResponse must consume')
+                await application(scope, receive, send)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        return bodies
+
+    async def test_pim_export_streams(self):
+        def render(product):
+            self.progress.append(product.pk)
+            return build_pim_text(product).encode('utf-8')
+
+        with mock.patch('api.pim.PIM_CHUNK_SIZE', 1), mock.patch.dict('api.pim.RENDERERS', {'txt': render}):
+            bodies = await self.call('/api/products/pim-sheets/', 'formats=txt')
+        # El primer trozo sale cuando solo se generó la primera ficha
+        self.assertEqual(bodies[0][1], 1)
+        self.assertEqual(len(self.progress), 3)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(body for body, _ in bodies)))
+        self.assertEqual(len(archive.namelist()), 3)
+
+    async def test_as_of_export_streams(self):
+        def one_row_pages(queryset, after):
+            self.progress.append(after)
+            return as_of_page(queryset, after, limit=1)
+
+        with mock.patch('api.history.as_of_page', one_row_pages):
+            bodies = await self.call('/api/products/as-of/', 'date=2099-01-01&stream=1')
+        self.assertEqual([pages for _, pages in bodies], [1, 2, 3])
+        self.assertEqual(len(b''.join(body for body, _ in bodies).splitlines()), 3)
+
+
+@override_settings(STOCK_EVENTS_POLL_SECONDS=0.01)
+class StockEventFeedTests(TestCase):
+    async def test_one_poll_feeds_every_listener(self):
+        await StockEvent.objects.acreate(product_id=1, stock=1)
+        feed = StockEventFeed(size=2)
+        await feed.subscribe()
+        await feed.subscribe()
+        start = feed.last
+
+        await StockEvent.objects.acreate(product_id=2, stock=5)
+        self.assertTrue(await feed.wait(start, 2))
+        self.assertEqual([event.product_id for event in feed.since(start, lambda event: True)], [2])
+        # El filtro de empresa se aplica en memoria
+        self.assertEqual(feed.since(start, lambda event: event.company_id is not None), [])
+
+        for product_id in (3, 4):
+            await StockEvent.objects.acreate(product_id=product_id, stock=0)
+        while feed.last < start + 3:
+            await feed.wait(feed.last, 2)
+        # Lo que ya salió del búfer se lee de la base
+        self.assertIsNone(feed.since(start, lambda event: True))
+        self.assertEqual([event.product_id for event in feed.since(start + 1, lambda event: True)], [3, 4])
+
+        feed.unsubscribe()
+        feed.unsubscribe()
+        await asyncio.wait_for(feed._task, 2)
+
+    async def test_wait_times_out_without_events(self):
+        feed = StockEventFeed()
+        await feed.subscribe()
+        self.assertFalse(await feed.wait(feed.last, 0.05))
+        feed.unsubscribe()
+        await asyncio.wait_for(feed._task, 2)
@@ -1,6 +1,6 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path
-from .views import ProductViewSet, BrandViewSet, CategoryViewSet, ProviderViewSet, ProductImageViewSet, ProductHistoryViewSet, StockMovementViewSet, ContactEmailView
+from .views import ProductViewSet, BrandViewSet, CategoryViewSet, ProviderViewSet, ProductImageViewSet, ProductHistoryViewSet, StockMovementViewSet, ContactEmailView, InventoryValuationView, LocationViewSet, StockBalanceViewSet, StockReservationViewSet, DeactivationJobViewSet, stock_events
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
@@ -10,7 +10,13 @@ router.register(r'providers', ProviderViewSet)
 router.register(r'product-images', ProductImageViewSet)
 router.register(r'product-history', ProductHistoryViewSet, basename='product-history')
 router.register(r'stock-movements', StockMovementViewSet)
+router.register(r'stock-reservations', StockReservationViewSet)
+router.register(r'locations', LocationViewSet)
+router.register(r'stock-balances', StockBalanceViewSet)
+router.register(r'deactivation-jobs', DeactivationJobViewSet)
 
 urlpatterns = router.urls + [
     path('mensajeria-general/', ContactEmailView.as_view(), name='mensajeria-general'),
+    path('analytics/valuation/', InventoryValuationView.as_view(), name='inventory-valuation'),
+    path('stock-events/', stock_events, name='stock-events'),
 ]
\ No newline at end of file
@@ -1,26 +1,50 @@
 from rest_framework import viewsets, filters
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from django_filters.rest_framework import DjangoFilterBackend # type: ignore
-from .models import Product, Brand, Category, Provider, ProductImage, StockMovement
-from .serializers import ProductSerializer, ProductSellerSerializer, BrandSerializer, CategorySerializer, ProviderSerializer, ProductImageSerializer, HistoricalProductSerializer, StockMovementSerializer
+from .models import Product, Brand, Category, Provider, ProductImage, StockMovement, InventoryValuation, Location, StockBalance, StockReservation, StockEvent, DeactivationJob, InsufficientStock, sync_imagen_principal, transfer_default_balances
+from .lookup import code_index
+from .filters import ProductFilter, ProductHistoryFilter
+from .pim import build_pim_text, stream_pim_zip, PIM_FORMATS
+from .duplicates import find_duplicates, find_similar, DEFAULT_THRESHOLD
+from .picking import plan_picking
+from .events import event_filter, stock_event_feed
+from .analytics import schedule_valuation_rebuild, valuation_computed_at
+from .cascades import cascade_deactivate, resume_deactivation_job
+from .history import revision_diffs, with_previous_revision, catalog_as_of, as_of_page, stream_as_of_ndjson, AS_OF_CHUNK_SIZE
+from .images import validate_uploads, store_uploads, enqueue_derivatives, BATCH_MAX_IMAGES
+from .serializers import ProductSerializer, ProductSellerSerializer, BrandSerializer, CategorySerializer, ProviderSerializer, ProductImageSerializer, HistoricalProductSerializer, StockMovementSerializer, ProductBulkUpdateSerializer, InventoryValuationSerializer, LocationSerializer, StockBalanceSerializer, StockReservationSerializer, DeactivationJobSerializer
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
-from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.core.mail import send_mail
+from django.http import StreamingHttpResponse, JsonResponse
+from django.conf import settings
 from rest_framework.throttling import AnonRateThrottle
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+from asgiref.sync import sync_to_async
+from simple_history.utils import bulk_create_with_history
+from rest_framework.utils.urls import replace_query_param
+from django.utils.dateparse import parse_date, parse_datetime
 from companies.permissions import IsAdminOrReadOnly, IsSellerUser, IsSellerUserOrAdmin
+from companies.scoping import CompanyScopedMixin, scope_queryset
 from datetime import datetime, timedelta, date
-from django.db.models.functions import TruncDate
-from django.db.models import Sum
+from django.db.models.functions import TruncDate, Round
+from django.db.models import Sum, F
+from django.db import transaction
+from django.utils import timezone
 from sklearn.linear_model import LinearRegression
 import pandas as pd
 import numpy as np
 import os
+import json
+import asyncio
 import google.generativeai as genai
 
-class StockMovementViewSet(viewsets.ModelViewSet):
+class StockMovementViewSet(CompanyScopedMixin, viewsets.ModelViewSet):
     queryset = StockMovement.objects.all()
     serializer_class = StockMovementSerializer
 
@@ -28,28 +52,111 @@ class StockMovementViewSet(viewsets.ModelViewSet):
 
     filterset_fields = ['product', 'movement_type']
 
-    # Guardar automáticamente quién hizo el movimiento
+    # Guardar automáticamente quién hizo el movimiento (la empresa la toma del producto)
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        try:
+            serializer.save(user=self.request.user)
+        except InsufficientStock as e:
+            # Otro movimiento concurrente consumió el saldo entre la validación y el guardado
+            raise ValidationError({"quantity": str(e)})
 
     def destroy(self, request, *args, **kwargs):
         raise MethodNotAllowed("DELETE", detail="Por seguridad auditora, los movimientos de stock no pueden eliminarse. Realice un contra-movimiento de ajuste.")
 
+class StockReservationViewSet(CompanyScopedMixin, viewsets.ModelViewSet):
+    """
+    Reservas temporales para ventas pendientes. No se editan ni se borran:
+    se convierten en venta (convert) o se cancelan (cancel); si no, vencen.
+    """
+    queryset = StockReservation.objects.select_related('product', 'user')
+    serializer_class = StockReservationSerializer
+    permission_classes = [IsSellerUserOrAdmin]
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    filterset_fields = ['product', 'status']
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        ttl = timedelta(minutes=data.get('ttl_minutes') or settings.RESERVATION_DEFAULT_TTL_MINUTES)
+        try:
+            serializer.instance = StockReservation.reservar(
+                data['product'], data['quantity'], self.request.user, ttl, reason=data.get('reason', '')
+            )
+        except InsufficientStock as e:
+            raise ValidationError({"quantity": str(e)})
+
+    @action(detail=True, methods=['post'])
+    def convert(self, request, pk=None):
+        reservation = self.get_object()
+        try:
+            movement = reservation.convertir(request.user)
+        except InsufficientStock as e:
+            raise ValidationError({"quantity": str(e)})
+        if movement is None:
+            raise ValidationError({"status": "La reserva ya no está activa o está vencida."})
+        reservation.refresh_from_db()
+        return Response(self.get_serializer(reservation).data)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        reservation = self.get_object()
+        if not reservation.cancelar():
+            raise ValidationError({"status": "La reserva ya no está activa."})
+        return Response(self.get_serializer(reservation).data)
+
+class LocationViewSet(CompanyScopedMixin, viewsets.ModelViewSet):
+    queryset = Location.objects.all()
+    serializer_class = LocationSerializer
+    permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+
+    def perform_create(self, serializer):
+        serializer.save(company=self.get_company())
+
+class StockBalanceViewSet(CompanyScopedMixin, viewsets.ReadOnlyModelViewSet):
+    # Solo lectura: los saldos los mueve exclusivamente StockMovement
+    queryset = StockBalance.objects.filter(quantity__gt=0).select_related('product', 'location').order_by('location__code', 'product__nombre_comercial')
+    serializer_class = StockBalanceSerializer
+    permission_classes = [IsAuthenticated]
+    company_field = 'location__company'
+    filterset_fields = ['product', 'location']
+
 class StandardResultSetPagination(PageNumberPagination):
     page_size = 1000
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all().select_related("brand", "category", "provider").prefetch_related("images")
+class ProductViewSet(CompanyScopedMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.all().select_related("brand", "category", "provider", "imagen_principal")
 
     def perform_create(self, serializer):
-        # Asigna el usuario autenticado como dueño del producto
-        serializer.save(user=self.request.user)
+        # Asigna el usuario autenticado como dueño del producto, dentro de su empresa
+        serializer.save(user=self.request.user, company=self.get_company())
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        data = serializer.data
+        # Chequeo incremental de duplicados contra el índice: se avisa, no se bloquea la creación
+        data['posibles_duplicados'] = self._duplicate_payload(find_similar(serializer.instance))
+        return Response(data, status=201, headers=self.get_success_headers(data))
+
+    def _duplicate_payload(self, matches):
+        names = dict(Product.objects.filter(pk__in=[pk for pk, _ in matches]).values_list('pk', 'nombre_comercial'))
+        return [{"id": pk, "nombre_comercial": names.get(pk), "similitud": round(score, 2)} for pk, score in matches]
+
+    def _threshold(self, request):
+        try:
+            threshold = float(request.query_params.get('threshold', DEFAULT_THRESHOLD))
+        except ValueError:
+            raise ValidationError({"threshold": "Debe ser un número entre 0 y 1"})
+        if not 0 < threshold <= 1:
+            raise ValidationError({"threshold": "Debe ser un número entre 0 y 1"})
+        return threshold
 
     def perform_update(self, serializer):
-        # 1. Obtenemos el producto antes del cambio
-        instance = self.get_object()
+        # 1. El producto antes del cambio (ya lo cargó update(), no repetimos la consulta)
+        instance = serializer.instance
         
         # 2. Detectamos si hubo cambios reales
         has_changes = False
@@ -80,39 +187,236 @@ class ProductViewSet(viewsets.ModelViewSet):
         filters.SearchFilter,
         filters.OrderingFilter
     ]
-    filterset_fields = ['brand', 'category', 'provider']
+    filterset_class = ProductFilter
     seatch_fields = ['nombre_comercial', 'ean', 'sku', 'descripcion']
-    ordering_fields = ['nombre_comercial', 'precio_venta', 'stock', 'rating', 'marca', 'categoria']
+    ordering_fields = ['nombre_comercial', 'precio_venta', 'stock', 'rating', 'marca', 'categoria', 'abc_class', 'ventas_unidades']
     pagination_class = StandardResultSetPagination
 
+    BULK_CHUNK_SIZE = 500
+
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        serializer = ProductBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        # 1. Selección: ids explícitos o los mismos filtros del listado (?brand=, ?category=...)
+        queryset = self.scope_queryset(Product.objects.filter(is_active=True))
+        if data.get('ids'):
+            queryset = queryset.filter(pk__in=data['ids'])
+        else:
+            filterset_class = DjangoFilterBackend().get_filterset_class(self, queryset)
+            filterset = filterset_class(data=data['filters'], queryset=queryset, request=request)
+            if not filterset.is_valid():
+                raise ValidationError({'filters': filterset.errors})
+            queryset = filterset.qs
+
+        # 2. Cambios como expresiones SQL (la aritmética la hace la base de datos)
+        cambios = {'updated_at': timezone.now()}
+        for campo in ('precio_venta', 'costo_cg'):
+            if f'{campo}_pct' in data:
+                factor = 1 + data[f'{campo}_pct'] / 100
+                cambios[campo] = Round(F(campo) * factor)
+            elif campo in data:
+                cambios[campo] = data[campo]
+        if 'lugar_bodega' in data:
+            cambios['lugar_bodega'] = data['lugar_bodega']
+
+        # Fijamos los ids antes de actualizar: el cambio puede sacar productos del filtro
+        ids = list(queryset.order_by().values_list('pk', flat=True))
+
+        # 3. UPDATE + historial en bloques, todo o nada
+        with transaction.atomic():
+            for i in range(0, len(ids), self.BULK_CHUNK_SIZE):
+                chunk = ids[i:i + self.BULK_CHUNK_SIZE]
+                # El saldo en el lugar anterior se traspasa al nuevo (el UPDATE no pasa por save())
+                previous_codes = {}
+                if 'lugar_bodega' in cambios:
+                    previous_codes = dict(Product.objects.filter(pk__in=chunk).exclude(
+                        lugar_bodega=cambios['lugar_bodega']
+                    ).values_list('pk', 'lugar_bodega'))
+                Product.objects.filter(pk__in=chunk).update(**cambios)
+                Product.history.bulk_history_create(
+                    Product.objects.filter(pk__in=chunk),
+                    update=True,
+                    default_user=request.user,
+                    default_change_reason=data['motivo'],
+                )
+                if previous_codes:
+                    transfer_default_balances(previous_codes, request.user, data['motivo'])
+
+        return Response({"status": "success", "updated": len(ids)})
+
+    LOOKUP_BATCH_MAX = 500
+
+    @action(detail=False, methods=['get'], url_path='lookup', permission_classes=[IsAuthenticated])
+    def lookup(self, request):
+        # Camino rápido para escáneres: sin paginación ni serializadores anidados
+        code = request.query_params.get('code', '').strip()
+        if not code:
+            return Response({"error": "Falta el parámetro 'code' (EAN o SKU)"}, status=400)
+
+        product = code_index.resolve([code], self.scope_queryset(Product.objects.all()))[code]
+        if product is None:
+            return Response({"error": f"Código no encontrado: {code}"}, status=404)
+        return Response(product)
+
+    @action(detail=False, methods=['post'], url_path='lookup-batch', permission_classes=[IsAuthenticated])
+    def lookup_batch(self, request):
+        codes = request.data.get('codes')
+        if not isinstance(codes, list) or not codes:
+            return Response({"error": "Envíe 'codes' como lista de EAN/SKU"}, status=400)
+        if len(codes) > self.LOOKUP_BATCH_MAX:
+            return Response({"error": f"Máximo {self.LOOKUP_BATCH_MAX} códigos por consulta"}, status=400)
+
+        codes = [str(code).strip() for code in codes]
+        return Response({"results": code_index.resolve(codes, self.scope_queryset(Product.objects.all()))})
+
+    DUPLICATES_LIMIT = 500
+
+    @action(detail=False, methods=['get'], url_path='duplicates')
+    def duplicates(self, request):
+        # Acepta los filtros del listado para acotar (?brand=, ?category=...)
+        queryset = self.filter_queryset(self.scope_queryset(Product.objects.filter(is_active=True)))
+        pairs = find_duplicates(queryset, threshold=self._threshold(request))[:self.DUPLICATES_LIMIT]
+
+        ids = {pk for a, b, _ in pairs for pk in (a, b)}
+        names = dict(Product.objects.filter(pk__in=ids).values_list('pk', 'nombre_comercial'))
+        return Response({"results": [
+            {
+                "a": {"id": a, "nombre_comercial": names.get(a)},
+                "b": {"id": b, "nombre_comercial": names.get(b)},
+                "similitud": round(score, 2),
+            }
+            for a, b, score in pairs
+        ]})
+
+    @action(detail=True, methods=['get'], url_path='duplicates')
+    def product_duplicates(self, request, pk=None):
+        product = self.get_object()
+        return Response({"results": self._duplicate_payload(find_similar(product, threshold=self._threshold(request)))})
+
+    PICKING_MAX_LINES = 1000
+
+    @action(detail=False, methods=['post'], url_path='picking-list', permission_classes=[IsAuthenticated])
+    def picking_list(self, request):
+        # Recibe [{"product": id, "quantity": n}, ...] y devuelve las líneas en orden de recorrido
+        lines = request.data.get('lines')
+        if not isinstance(lines, list) or not lines:
+            return Response({"error": "Envíe 'lines' como lista de {product, quantity}"}, status=400)
+        if len(lines) > self.PICKING_MAX_LINES:
+            return Response({"error": f"Máximo {self.PICKING_MAX_LINES} líneas por lista"}, status=400)
+        try:
+            requested = [(int(line['product']), int(line.get('quantity', 1))) for line in lines]
+        except (KeyError, TypeError, ValueError):
+            return Response({"error": "Cada línea requiere 'product' y 'quantity' numéricos"}, status=400)
+        invalid = [pk for pk, quantity in requested if quantity <= 0]
+        if invalid:
+            return Response({"error": f"La cantidad debe ser mayor que 0 (productos: {invalid})"}, status=400)
+
+        products = {
+            row['id']: row for row in self.scope_queryset(Product.objects.filter(
+                is_active=True, pk__in=[pk for pk, _ in requested]
+            )).values('id', 'nombre_comercial', 'sku', 'lugar_bodega', 'stock')
+        }
+        missing = sorted({pk for pk, _ in requested if pk not in products})
+        if missing:
+            return Response({"error": f"Productos no encontrados: {missing}"}, status=400)
+
+        ordered, distance, arrival_distance, strategy = plan_picking(
+            [{**products[pk], 'quantity': quantity} for pk, quantity in requested]
+        )
+        return Response({
+            "strategy": strategy,
+            "distance": distance,
+            "arrival_distance": arrival_distance,
+            "lines": [
+                {
+                    "order": position,
+                    "product": line['id'],
+                    "nombre_comercial": line['nombre_comercial'],
+                    "sku": line['sku'],
+                    "quantity": line['quantity'],
+                    "stock": line['stock'],
+                    "lugar_bodega": line['lugar_bodega'],
+                    "aisle": coord.aisle if coord else None,
+                    "rack": coord.rack if coord else None,
+                    "level": coord.level if coord else None,
+                }
+                for position, (line, coord) in enumerate(ordered, start=1)
+            ],
+        })
+
     @action(detail=True, methods=['get'], url_path='pim-sheet')
     def pim_sheet(self, request, pk=None):
         product = self.get_object()
-
-        ficha = (
-            f"FICHA TECNICA DE PRODUCTO\n"
-            f"========================================\n"
-            f"PRODUCTO: {product.nombre_comercial}\n"
-            f"SKU:      {product.sku}\n"
-            f"MARCA:    {product.brand.name if product.brand else 'N/A'}\n"
-            f"----------------------------------------\n"
-            f"DETALLES TÉCNICOS:\n"
-            f"- Categoría:   {product.category.name if product.category else 'N/A'}\n"
-            f"- Dimensiones: {product.dimensiones or 'N/A'}\n"
-            f"- Peso:        {product.peso or 'N/A'} kg\n"
-            f"- Uso:         {product.edad_uso or 'N/A'}\n"
-            f"----------------------------------------\n"
-            f"PRECIO LISTA: ${product.precio_venta:,.0f} CLP\n"
-            f"----------------------------------------\n"
-            f"DESCRIPCIÓN:\n"
-            f"{product.descripcion or 'N/A'}\n"
-            f"========================================\n"
-            f"Bodegas Salas ERP - {datetime.now().strftime('%d/%m/%Y')}"
+        return Response({'text': build_pim_text(product)})
+
+    @action(detail=False, methods=['get'], url_path='pim-sheets')
+    def pim_sheets(self, request):
+        # Exportación masiva: acepta los mismos filtros del listado (?brand=, ?category=...)
+        formats = [fmt for fmt in request.query_params.get('formats', 'txt,pdf').split(',') if fmt]
+        invalid = [fmt for fmt in formats if fmt not in PIM_FORMATS]
+        if not formats or invalid:
+            return Response({"error": f"Formatos válidos: {', '.join(PIM_FORMATS)}"}, status=400)
+
+        queryset = self.filter_queryset(
+            self.scope_queryset(Product.objects.filter(is_active=True)).select_related("brand", "category")
         )
-        return Response({'text': ficha})
+        response = StreamingHttpResponse(stream_pim_zip(queryset, formats), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="fichas_pim_{datetime.now():%Y%m%d}.zip"'
+        return response
+
+    def _as_of_date(self, value):
+        # Fecha sola = el catálogo al cierre de ese día (se prueba antes porque
+        # parse_datetime también acepta una fecha sola, como medianoche). Los
+        # parsers devuelven None si el formato no calza y ValueError si calza
+        # pero la fecha no existe (2024-02-30)
+        try:
+            day = parse_date(value or '')
+            when = datetime.combine(day, datetime.max.time()) if day else parse_datetime(value or '')
+        except ValueError:
+            when = None
+        if when is None:
+            raise ValidationError({"date": "Use una fecha (AAAA-MM-DD) o fecha-hora ISO 8601"})
+        return timezone.make_aware(when) if timezone.is_naive(when) else when
+
+    @action(detail=False, methods=['get'], url_path='as-of', permission_classes=[IsAdminUser])
+    def as_of(self, request):
+        """
+        El catálogo (precios, costo y stock) tal como estaba en ?date=. Paginado
+        por clave (?after=<id>&limit=) o completo en NDJSON con ?stream=1.
+        """
+        when = self._as_of_date(request.query_params.get('date'))
+        queryset = catalog_as_of(when, self.scope_queryset(Product.history.all()))
+
+        if request.query_params.get('stream') == '1':
+            response = StreamingHttpResponse(stream_as_of_ndjson(queryset), content_type='application/x-ndjson')
+            response['Content-Disposition'] = f'attachment; filename="catalogo_{when:%Y%m%d}.ndjson"'
+            return response
+
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = max(1, min(int(request.query_params.get('limit', AS_OF_CHUNK_SIZE)), AS_OF_CHUNK_SIZE))
+        except ValueError:
+            raise ValidationError({"after": "after y limit deben ser enteros"})
+        results = as_of_page(queryset, after, limit)
+        next_url = None
+        if len(results) == limit:
+            next_url = replace_query_param(request.build_absolute_uri(), 'after', results[-1]['id'])
+        return Response({"date": when, "next": next_url, "results": results})
     
     def get_queryset(self):
-        return Product.objects.filter(is_active=True).select_related("brand", "category", "provider").prefetch_related("images")
+        queryset = self.scope_queryset(Product.objects.filter(is_active=True)).select_related("brand", "category", "provider", "imagen_principal")
+        # El listado solo muestra la imagen principal (join); el detalle trae todas
+        if self.action in ('retrieve', 'update', 'partial_update'):
+            queryset = queryset.prefetch_related("images")
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['omit_images'] = self.action == 'list'
+        return context
 
     def perform_destroy(self, instance):
         instance.is_active = False
@@ -195,65 +499,264 @@ class ProductViewSet(viewsets.ModelViewSet):
             }
         })
 
-class BrandViewSet(viewsets.ModelViewSet):
+class CascadeDeactivateMixin:
+    """
+    DELETE de marca, categoría o proveedor: se apaga junto con sus productos
+    (borrado lógico) dejando historial. Si son muchos productos responde 202
+    con el DeactivationJob que sigue en segundo plano.
+    """
+    cascade_target = None
+
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        job = cascade_deactivate(instance, self.cascade_target, request.user)
+        if job is None:
+            return Response(status=204)
+        return Response(DeactivationJobSerializer(job).data, status=202)
+
+class BrandViewSet(CascadeDeactivateMixin, CompanyScopedMixin, viewsets.ModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
+    cascade_target = 'brand'
 
-    def perform_destroy(self, instance):
-        # LÓGICA DE CASCADA SEGURA:
-        # A. Apagar la Marca
-        instance.is_active = False
-        instance.save()
-        
-        # B. Apagar automáticamente todos sus productos (Bulk Update)
-        # Esto es mucho más rápido que borrarlos uno por uno
-        products_count = instance.product_set.update(is_active=False)
-        
-        print(f"📉 Marca '{instance.name}' descontinuada. {products_count} productos ocultados.")
+    def perform_create(self, serializer):
+        serializer.save(company=self.get_company())
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CascadeDeactivateMixin, CompanyScopedMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cascade_target = 'category'
 
-    def perform_destroy(self, instance):
-        # LÓGICA DE CASCADA SEGURA:
-        # A. Apagar la Marca
-        instance.is_active = False
-        instance.save()
-        
-        # B. Apagar automáticamente todos sus productos (Bulk Update)
-        # Esto es mucho más rápido que borrarlos uno por uno
-        products_count = instance.product_set.update(is_active=False)
-        
-        print(f"📉 Categoría '{instance.name}' descontinuada. {products_count} productos ocultados.")
+    def perform_create(self, serializer):
+        serializer.save(company=self.get_company())
 
-class ProviderViewSet(viewsets.ModelViewSet):
+class ProviderViewSet(CascadeDeactivateMixin, CompanyScopedMixin, viewsets.ModelViewSet):
     queryset = Provider.objects.all()
     serializer_class = ProviderSerializer
+    cascade_target = 'provider'
 
-    def perform_destroy(self, instance):
-        # LÓGICA DE CASCADA SEGURA:
-        # A. Apagar la Marca
-        instance.is_active = False
-        instance.save()
-        
-        # B. Apagar automáticamente todos sus productos (Bulk Update)
-        # Esto es mucho más rápido que borrarlos uno por uno
-        products_count = instance.product_set.update(is_active=False)
-        
-        print(f"📉 Proveedor '{instance.name}' descontinuado. {products_count} productos ocultados.")
+    def perform_create(self, serializer):
+        serializer.save(company=self.get_company())
+
+class DeactivationJobViewSet(CompanyScopedMixin, viewsets.ReadOnlyModelViewSet):
+    # Avance de las descontinuaciones en segundo plano (processed / total)
+    queryset = DeactivationJob.objects.select_related('user')
+    serializer_class = DeactivationJobSerializer
+    permission_classes = [IsAuthenticated]
 
-class ProductImageViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
+    def resume(self, request, pk=None):
+        """
+        Reanuda un trabajo pendiente o fallido desde los productos que siguen
+        activos (lo ya apagado no se repite). Uno en proceso responde 409.
+        """
+        job = self.get_object()
+        if not resume_deactivation_job(job):
+            job.refresh_from_db()
+            if job.status == 'RUNNING':
+                return Response({"status": "El trabajo está en proceso."}, status=409)
+            raise ValidationError({"status": "El trabajo ya terminó."})
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=202)
+
+class ProductImageViewSet(CompanyScopedMixin, viewsets.ModelViewSet):
     queryset = ProductImage.objects.all()
+    company_field = 'product__company'
     serializer_class = ProductImageSerializer
     permission_classes = [IsSellerUserOrAdmin]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['product__id']
+    filter_backends = [DjangoFilterBackend]
+    # ?product=<id>: filtro por FK (indexado), la principal primero
+    filterset_fields = ['product']
 
-class ProductHistoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.history.all().order_by('-history_date')
+    def get_queryset(self):
+        return super().get_queryset().order_by('-is_principal', 'id')
+
+    @action(detail=False, methods=['post'], url_path='batch', parser_classes=[MultiPartParser])
+    def batch(self, request):
+        """
+        Sube varias imágenes de un producto en una sola petición multipart:
+        `product`, `images` (uno o más archivos) y opcional `principal`
+        (índice dentro de `images`). Si el producto aún no tiene imagen
+        principal, la primera del lote lo será.
+        """
+        files = request.FILES.getlist('images')
+        if not files:
+            raise ValidationError({"images": "Adjunte al menos una imagen."})
+        if len(files) > BATCH_MAX_IMAGES:
+            raise ValidationError({"images": f"Máximo {BATCH_MAX_IMAGES} imágenes por lote."})
+        try:
+            product_id = int(request.data.get('product'))
+            principal = request.data.get('principal')
+            principal = int(principal) if principal not in (None, '') else None
+        except (TypeError, ValueError):
+            raise ValidationError({"product": "Debe indicar el producto (id) y un índice principal numérico."})
+        if principal is not None and not 0 <= principal < len(files):
+            raise ValidationError({"principal": "El índice principal no corresponde a ninguna imagen del lote."})
+        product = scope_queryset(Product.objects.filter(is_active=True), request.user).filter(pk=product_id).first()
+        if product is None:
+            raise ValidationError({"product": "Producto no encontrado."})
+
+        errors = validate_uploads(files)
+        if errors:
+            raise ValidationError({"images": errors})
+        names = store_uploads(files)
+
+        with transaction.atomic():
+            # Bloquea el producto: dos lotes simultáneos no dejan dos principales
+            Product.objects.select_for_update().filter(pk=product.pk).exists()
+            current = ProductImage.objects.filter(product=product, is_principal=True)
+            if principal is None and not current.exists():
+                principal = 0
+            if principal is not None:
+                demoted = list(current)
+                current.update(is_principal=False)
+                for image in demoted:
+                    image.is_principal = False
+                ProductImage.history.bulk_history_create(demoted, update=True, default_user=request.user)
+
+            created = bulk_create_with_history(
+                [ProductImage(product=product, image=name, is_principal=(index == principal)) for index, name in enumerate(names)],
+                ProductImage, default_user=request.user,
+            )
+            enqueue_derivatives(image.pk for image in created)
+            sync_imagen_principal([product.pk])
+
+        return Response(self.get_serializer(created, many=True).data, status=201)
+
+class HistoryCursorPagination(CursorPagination):
+    # Cursor y no número de página: cada página cuesta lo mismo aunque el historial crezca
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-history_date', '-history_id')
+
+class ProductHistoryViewSet(CompanyScopedMixin, viewsets.ReadOnlyModelViewSet):
+    # Marca, categoría, proveedor y editor en el mismo JOIN: consultas constantes por página
+    queryset = Product.history.select_related('brand', 'category', 'provider', 'history_user')
     serializer_class = HistoricalProductSerializer
     permission_classes = [IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductHistoryFilter
+    pagination_class = HistoryCursorPagination
+
+    @action(detail=False, methods=['get'])
+    def diffs(self, request):
+        """
+        Igual que el listado (filtros y cursor), pero cada revisión trae solo
+        los campos que cambiaron: {'field', 'old', 'new'}.
+        """
+        page = self.paginate_queryset(with_previous_revision(self.filter_queryset(self.get_queryset())))
+        return self.get_paginated_response(revision_diffs(page))
+
+class InventoryValuationView(APIView):
+    """
+    Valorización de inventario (costo, venta y margen) por marca, categoría,
+    proveedor y lugar en bodega, leída de la tabla precalculada.
+
+    Nunca se recalcula dentro de la petición: si el resumen está vencido (o se
+    pide ?refresh=1) se devuelve el que hay, con su computed_at, y se encola
+    una reconstrucción en segundo plano. El cron de rebuild_valuation lo
+    mantiene al día.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        computed_at = valuation_computed_at()
+        stale = computed_at is None or timezone.now() - computed_at > settings.INVENTORY_VALUATION_MAX_AGE
+        refreshing = stale or request.query_params.get('refresh') == '1'
+        if refreshing:
+            schedule_valuation_rebuild()
+
+        queryset = scope_queryset(InventoryValuation.objects.all(), request.user)
+        dimension = request.query_params.get('dimension')
+        if dimension:
+            if dimension not in dict(InventoryValuation.DIMENSIONS):
+                return Response({"error": f"Dimensión inválida: {dimension}"}, status=400)
+            queryset = queryset.filter(dimension=dimension)
+
+        return Response({
+            "computed_at": computed_at,
+            "stale": stale,
+            "refreshing": refreshing,
+            "results": InventoryValuationSerializer(queryset, many=True).data,
+        })
+
+STOCK_EVENT_BATCH = 500
+STOCK_EVENT_HEARTBEAT = 15  # segundos sin eventos antes de enviar un comentario keep-alive
+
+def _user_from_token(token):
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+async def stock_events(request):
+    """
+    Canal Server-Sent Events con los cambios de stock de la empresa del usuario,
+    para no volver a descargar el catálogo completo después de cada movimiento.
+
+    EventSource no permite cabeceras, así que el JWT va en ?token=. Al
+    reconectarse el navegador envía Last-Event-ID y se retoma desde esa
+    secuencia; si ya fue purgada llega un evento 'reset' para recargar todo.
+    Requiere servirse por ASGI (backend.asgi, ver start.sh): bajo WSGI la
+    respuesta se acumula y no llega nada hasta que se cierra. Todas las
+    conexiones de un proceso comparten un solo sondeo (api/events.py).
+    """
+    user = await sync_to_async(_user_from_token)(request.GET.get('token', ''))
+    if user is None:
+        return JsonResponse({"detail": "Token inválido o expirado."}, status=401)
+    events = await sync_to_async(scope_queryset)(StockEvent.objects.all(), user)
+    visible = await sync_to_async(event_filter)(user)
+
+    try:
+        last = int(request.headers.get('Last-Event-ID') or request.GET.get('since'))
+    except (TypeError, ValueError):
+        last = None
+
+    async def stream():
+        nonlocal last
+        yield "retry: 3000\n\n"
+        feed = stock_event_feed
+        await feed.subscribe()
+        try:
+            if last is None:
+                # Conexión nueva: solo interesan los cambios de aquí en adelante
+                last = feed.last
+            else:
+                oldest = await StockEvent.objects.order_by('id').values_list('id', flat=True).afirst()
+                if oldest is not None and last < oldest - 1:
+                    yield "event: reset\ndata: {}\n\n"
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.STOCK_EVENTS_MAX_STREAM_SECONDS
+            quiet_since = loop.time()
+            while loop.time() < deadline:
+                position = feed.last
+                batch = feed.since(last, visible)
+                if batch is None:
+                    # Fuera del búfer (reconexión tras mucho rato): se pone al día en la base
+                    batch = [event async for event in events.filter(id__gt=last).order_by('id')[:STOCK_EVENT_BATCH]]
+                    if len(batch) == STOCK_EVENT_BATCH:
+                        position = batch[-1].id
+                for event in batch:
+                    yield f"id: {event.id}\ndata: {json.dumps(event.as_payload())}\n\n"
+                if batch:
+                    quiet_since = loop.time()
+                last = max(last, position)
+                if loop.time() - quiet_since >= STOCK_EVENT_HEARTBEAT:
+                    yield ": ping\n\n"
+                    quiet_since = loop.time()
+                timeout = min(STOCK_EVENT_HEARTBEAT, deadline - loop.time())
+                await feed.wait(last, max(timeout, 0))
+        finally:
+            feed.unsubscribe()
+        # Al cerrar, EventSource se reconecta solo enviando Last-Event-ID
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 class ContactEmailView(APIView):
     permission_classes = []
@@ -80,6 +80,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'  # Actualizado nombre
+# El servidor de producción es ASGI (start.sh): el canal /api/stock-events/ necesita streaming real
+ASGI_APPLICATION = 'backend.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -88,6 +90,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # WAL: las lecturas (y el respaldo de backup_s3) no bloquean a los escritores
+        'OPTIONS': {
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
     }
 }
 
@@ -144,8 +150,24 @@ CORS_ALLOW_HEADERS = ['content-type', 'authorization']
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
-DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024
-FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024
+# Entrega de /media/ (api/media.py): 'x-accel' (nginx: location /protected-media/
+# { internal; alias <MEDIA_ROOT>/; }), 'x-sendfile' (Apache/lighttpd) o 'django'.
+# En producción (DEBUG=False) el default es x-accel: bajo el servidor ASGI no hay
+# wsgi.file_wrapper y en modo 'django' cada archivo se lee y acumula en Python
+MEDIA_DELIVERY = os.environ.get('MEDIA_DELIVERY', 'django' if DEBUG else 'x-accel')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# Cuerpos no-archivo (JSON, campos de formulario). Los archivos sobre 2.5 MB
+# se escriben a un temporal en disco en vez de quedar en la RAM del worker.
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(2.5 * 1024 * 1024)
+
+# Límites de imágenes subidas (se validan leyendo solo la cabecera, ver api/images.py)
+IMAGE_MAX_UPLOAD_SIZE = int(os.environ.get('IMAGE_MAX_UPLOAD_SIZE_MB', '25')) * 1024 * 1024
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '10000'))
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', str(40_000_000)))
+# Los originales más grandes se reducen a este lado máximo en segundo plano
+IMAGE_NORMALIZE_MAX_DIMENSION = int(os.environ.get('IMAGE_NORMALIZE_MAX_DIMENSION', '2560'))
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -171,6 +193,41 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Antigüedad máxima del resumen de valorización: pasado ese tiempo, el GET
+# entrega el resumen vencido (stale=true) y encola su reconstrucción en segundo plano
+INVENTORY_VALUATION_MAX_AGE = timedelta(minutes=int(os.environ.get('INVENTORY_VALUATION_MAX_AGE_MINUTES', '15')))
+
+# Vigencia por defecto de una reserva de stock (minutos); las vencidas las libera expire_reservations
+RESERVATION_DEFAULT_TTL_MINUTES = int(os.environ.get('RESERVATION_DEFAULT_TTL_MINUTES', '30'))
+
+# Canal de eventos de stock (/api/stock-events/): frecuencia de consulta, duración
+# máxima de cada conexión (el navegador se reconecta solo) y retención de eventos
+STOCK_EVENTS_POLL_SECONDS = float(os.environ.get('STOCK_EVENTS_POLL_SECONDS', '1'))
+STOCK_EVENTS_MAX_STREAM_SECONDS = int(os.environ.get('STOCK_EVENTS_MAX_STREAM_SECONDS', '300'))
+STOCK_EVENTS_RETENTION_HOURS = int(os.environ.get('STOCK_EVENTS_RETENTION_HOURS', '24'))
+
+# Retención del historial (compact_history): detalle completo los últimos
+# HISTORY_DETAIL_DAYS días; antes, los cambios solo de stock quedan en una
+# revisión por día, y lo anterior a HISTORY_RETENTION_DAYS se purga
+HISTORY_DETAIL_DAYS = int(os.environ.get('HISTORY_DETAIL_DAYS', '90'))
+HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', '730'))
+
+# Carpeta temporal de backup_s3 (default: junto al código). La copia de la base
+# se hace sin comprimir antes de comprimirla, así que necesita espacio libre al
+# menos igual al tamaño de db.sqlite3 (más el .zip de media, y con S3 también el
+# comprimido antes de subirlo). Apuntarla a un disco con espacio si la base es grande
+BACKUP_TEMP_DIR = os.environ.get('BACKUP_TEMP_DIR') or str(BASE_DIR)
+
+# Descontinuar una marca/categoría/proveedor: hasta esta cantidad de productos se
+# hace dentro de la petición; sobre eso, en segundo plano (DeactivationJob)
+CASCADE_SYNC_MAX_PRODUCTS = int(os.environ.get('CASCADE_SYNC_MAX_PRODUCTS', '1000'))
+# Un DeactivationJob en RUNNING sin avance en estos minutos se considera
+# huérfano (su proceso murió) y resume_deactivation_jobs lo retoma
+DEACTIVATION_JOB_STALE_MINUTES = int(os.environ.get('DEACTIVATION_JOB_STALE_MINUTES', '10'))
+
+# Hilos que generan las variantes (miniaturas WebP/JPEG) de las imágenes subidas
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get('IMAGE_DERIVATIVE_WORKERS', '2'))
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
@@ -1,12 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
-from django.views.static import serve
+from api.media import serve_media
 from companies.views import MyTokenObtainPairView
 
 urlpatterns = [
@@ -20,8 +18,6 @@ urlpatterns = [
     path('api/token/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
-    re_path(r'^media/(?P<path>.*)$', serve, {
-        'document_root': settings.MEDIA_ROOT,
-    }),
-
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # 4. Archivos subidos (imágenes): validadores, rangos y caché inmutable
+    re_path(r'^media/(?P<path>.*)$', serve_media),
+]
\ No newline at end of file
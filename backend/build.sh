@@ -5,6 +5,8 @@ set -o errexit
 pip install -r requirements.txt
 python manage.py collectstatic --no-input
 python manage.py migrate
+# Índice de duplicados (MinHash/LSH): solo escribe las firmas que cambiaron
+python manage.py find_duplicates --reindex --limit 0
 
 if [[ "$EJECUTAR_SEED" == "DEMO" ]]; then
     # Solo resetea la fábrica (Datos limpios, sin historia)
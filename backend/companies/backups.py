@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+
+# 1024 páginas (4 MB con páginas de 4 KB) por paso: cada paso es corto y los
+# escritores entran entre pasos
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_MAX_RESTARTS = 5
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+COMPRESSIONS = ('gzip', 'zstd')
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def snapshot_sqlite(source_path, target_path, pages=BACKUP_PAGES_PER_STEP, max_restarts=BACKUP_MAX_RESTARTS):
+    """
+    Copia consistente de una base SQLite en uso con la API de backup de SQLite,
+    por pasos de `pages` páginas. Devuelve {'pages', 'steps', 'restarts', 'journal_mode', 'locked'}.
+
+    En modo WAL se fija una transacción de lectura durante toda la copia: la
+    instantánea no cambia y los escritores siguen sin bloquearse. Con el
+    journal clásico se copia sin fijarla (los escritores entran entre pasos) y
+    SQLite reinicia la copia si alguien escribe; después de `max_restarts`
+    reinicios se hace una última pasada fijando la lectura, que sí los bloquea.
+    """
+    source = sqlite3.connect(source_path, isolation_level=None, timeout=30)
+    try:
+        journal_mode = source.execute('PRAGMA journal_mode').fetchone()[0].lower()
+        hold = journal_mode == 'wal'
+        stats = {'pages': 0, 'steps': 0, 'restarts': 0, 'journal_mode': journal_mode, 'locked': False}
+        while True:
+            target = sqlite3.connect(target_path)
+            remaining_before = None
+
+            def progress(status, remaining, total):
+                nonlocal remaining_before
+                stats['steps'] += 1
+                stats['pages'] = total
+                # Si quedan más páginas que en el paso anterior, SQLite empezó de nuevo
+                if remaining_before is not None and remaining > remaining_before:
+                    stats['restarts'] += 1
+                    if not hold and stats['restarts'] > max_restarts:
+                        raise _TooManyRestarts
+                remaining_before = remaining
+
+            try:
+                if hold:
+                    source.execute('BEGIN')
+                    source.execute('SELECT count(*) FROM sqlite_master').fetchone()
+                source.backup(target, pages=pages, progress=progress)
+                return stats
+            except _TooManyRestarts:
+                hold = stats['locked'] = True
+            finally:
+                if source.in_transaction:
+                    source.execute('COMMIT')
+                target.close()
+    finally:
+        source.close()
+
+
+def sqlite_size(path):
+    """Bytes de la base más su WAL: lo que puede llegar a ocupar la copia."""
+    wal = f"{path}-wal"
+    return os.path.getsize(path) + (os.path.getsize(wal) if os.path.exists(wal) else 0)
+
+
+def check_free_space(directory, needed):
+    """RuntimeError antes de empezar si `directory` no tiene `needed` bytes libres."""
+    free = shutil.disk_usage(directory).free
+    if free < needed:
+        raise RuntimeError(
+            f"Espacio insuficiente en {directory}: se necesitan {needed / 1024 / 1024:.0f} MB "
+            f"y hay {free / 1024 / 1024:.0f} MB libres (use --temp-dir o BACKUP_TEMP_DIR)"
+        )
+
+
+class _HashingWriter:
+    """Archivo de salida que calcula el sha256 y cuenta los bytes que pasan."""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fh.write(data)
+
+    def flush(self):
+        self.fh.flush()
+
+
+def _compressor(method, sink):
+    if method == 'gzip':
+        # mtime=0: el mismo snapshot produce siempre el mismo archivo (y el mismo hash)
+        return gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=6, mtime=0)
+    if method == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("La compresión zstd requiere el paquete 'zstandard' (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(sink, closefd=False)
+    raise ValueError(f"Compresión no soportada: {method}")
+
+
+def compress_file(source_path, target_path, method='gzip'):
+    """
+    Comprime `source_path` en `target_path` por bloques (memoria constante) y
+    devuelve (sha256 del archivo comprimido, bytes leídos, bytes escritos).
+    """
+    read = 0
+    with open(source_path, 'rb') as src, open(target_path, 'wb') as out:
+        sink = _HashingWriter(out)
+        with _compressor(method, sink) as compressor:
+            while chunk := src.read(COMPRESS_CHUNK_SIZE):
+                compressor.write(chunk)
+                read += len(chunk)
+    return sink.sha256.hexdigest(), read, sink.size
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
@@ -1,77 +1,124 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from companies.backups import snapshot_sqlite, compress_file, check_free_space, sqlite_size, timed, BACKUP_PAGES_PER_STEP, COMPRESSIONS, EXTENSIONS
+import json
 import os
 import shutil
-import time
+import sqlite3
+import tempfile
 from datetime import datetime
 
 class Command(BaseCommand):
-    help = 'Respalda BD y Media (Detecta automáticamente si usar S3 Real o Simulación Local)'
+    help = (
+        'Respalda BD y Media (Detecta automáticamente si usar S3 Real o Simulación Local). La copia de la '
+        'base se escribe sin comprimir en la carpeta temporal (--temp-dir o BACKUP_TEMP_DIR), que necesita '
+        'al menos el tamaño de db.sqlite3 libre.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compression', choices=COMPRESSIONS, default='gzip', help='Compresión de la base (default: gzip; zstd requiere el paquete zstandard)')
+        parser.add_argument('--pages', type=int, default=BACKUP_PAGES_PER_STEP, help=f'Páginas por paso de la copia (default: {BACKUP_PAGES_PER_STEP})')
+        parser.add_argument('--verify', action='store_true', help='Ejecuta PRAGMA quick_check sobre la copia antes de comprimirla')
+        parser.add_argument('--skip-media', action='store_true', help='Solo respalda la base de datos')
+        parser.add_argument('--temp-dir', default=settings.BACKUP_TEMP_DIR, help=f'Dónde crear la carpeta temporal (default: BACKUP_TEMP_DIR = {settings.BACKUP_TEMP_DIR})')
 
     def handle(self, *args, **options):
         # 1. Configuración
         timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        
+
         # Intentamos obtener credenciales
         AWS_ACCESS_KEY = os.environ.get('AWS_ACCESS_KEY_ID')
         AWS_SECRET_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
         AWS_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME')
-        
+
         # 2. Decisión de Modo
         USE_S3 = all([AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_BUCKET_NAME])
-        
+
         mode_msg = "☁️  MODO CLOUD (AWS S3)" if USE_S3 else "💻 MODO SIMULACIÓN (Local Storage)"
         self.stdout.write(f"Iniciando Protocolo de Contingencia... [{mode_msg}]")
-        time.sleep(1) # Efecto dramático para la demo
 
-        # Directorios temporales
-        temp_dir = os.path.join(settings.BASE_DIR, 'temp_backup')
-        os.makedirs(temp_dir, exist_ok=True)
-        
+        # Carpeta temporal propia dentro de --temp-dir (al final se borra solo ella)
+        os.makedirs(options['temp_dir'], exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix='temp_backup_', dir=options['temp_dir'])
+
         # Directorio de simulación (Donde quedarán los archivos si no hay S3)
         sim_s3_dir = os.path.join(settings.BASE_DIR, 'simulated_s3_bucket')
         if not USE_S3:
             os.makedirs(sim_s3_dir, exist_ok=True)
+        # Sin S3 el comprimido se escribe directo en la carpeta final (sin copia extra)
+        output_dir = temp_dir if USE_S3 else sim_s3_dir
 
         try:
             # --- A. PREPARAR BASE DE DATOS ---
+            # Copia consistente con la API de backup de SQLite (no copiar el archivo
+            # en uso: podría quedar a medio escribir), luego compresión por bloques
             db_path = settings.DATABASES['default']['NAME']
-            db_filename = f"db_{timestamp}.sqlite3"
+            # La copia sin comprimir ocupa hasta lo que ocupa la base: fallar antes de empezar
+            check_free_space(temp_dir, sqlite_size(db_path))
+            snapshot_path = os.path.join(temp_dir, f"db_{timestamp}.sqlite3")
+            db_filename = f"db_{timestamp}.sqlite3{EXTENSIONS[options['compression']]}"
             self.stdout.write(f'📦 Empaquetando Base de Datos: {db_filename}...')
-            
+
+            elapsed, stats = timed(snapshot_sqlite, str(db_path), snapshot_path, pages=options['pages'])
+            self.stdout.write(
+                f"   📸 Snapshot de {stats['pages']} páginas en {elapsed:.1f}s "
+                f"({stats['steps']} pasos, {stats['restarts']} reinicios, journal {stats['journal_mode']}"
+                f"{', última pasada con bloqueo' if stats['locked'] else ''})"
+            )
+
+            if options['verify']:
+                with sqlite3.connect(snapshot_path) as check:
+                    result = check.execute('PRAGMA quick_check').fetchone()[0]
+                if result != 'ok':
+                    raise RuntimeError(f"La copia no pasó quick_check: {result}")
+                self.stdout.write('   🔎 quick_check: ok')
+
+            db_output = os.path.join(output_dir, db_filename)
+            elapsed, (sha256, raw_size, compressed_size) = timed(compress_file, snapshot_path, db_output, options['compression'])
+            os.remove(snapshot_path)
+            self.stdout.write(
+                f"   🗜️  {options['compression']}: {raw_size / 1024 / 1024:.1f} MB -> {compressed_size / 1024 / 1024:.1f} MB "
+                f"en {elapsed:.1f}s (sha256 {sha256[:12]}...)"
+            )
+
+            # Manifiesto junto al respaldo: permite verificar la descarga antes de restaurar
+            manifest_filename = f"{db_filename}.json"
+            manifest_output = os.path.join(output_dir, manifest_filename)
+            with open(manifest_output, 'w') as fh:
+                json.dump({
+                    'file': db_filename, 'sha256': sha256, 'bytes': compressed_size,
+                    'source_bytes': raw_size, 'compression': options['compression'],
+                    'pages': stats['pages'], 'created_at': timestamp,
+                }, fh, indent=2)
+
             # --- B. PREPARAR MEDIA ---
             media_root = settings.MEDIA_ROOT
             zip_filename = f"media_{timestamp}.zip"
             archive_path = os.path.join(temp_dir, f"media_{timestamp}")
-            
-            if os.path.exists(media_root):
+            backup_media = not options['skip_media'] and os.path.exists(media_root)
+
+            if backup_media:
                 self.stdout.write(f'📸 Comprimiendo archivos multimedia...')
                 shutil.make_archive(archive_path, 'zip', media_root)
-            
-            time.sleep(1) 
 
             # --- C. TRANSMISIÓN (REAL O SIMULADA) ---
             if USE_S3:
                 import boto3
                 s3 = boto3.client('s3', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_KEY)
-                
+
                 self.stdout.write(f'🚀 Transmitiendo a AWS S3 ({AWS_BUCKET_NAME})...')
-                s3.upload_file(str(db_path), AWS_BUCKET_NAME, f"backups/db/{db_filename}")
-                if os.path.exists(media_root):
+                s3.upload_file(db_output, AWS_BUCKET_NAME, f"backups/db/{db_filename}", ExtraArgs={'Metadata': {'sha256': sha256}})
+                s3.upload_file(manifest_output, AWS_BUCKET_NAME, f"backups/db/{manifest_filename}")
+                if backup_media:
                     s3.upload_file(f"{archive_path}.zip", AWS_BUCKET_NAME, f"backups/media/{zip_filename}")
-                    
+
                 self.stdout.write(self.style.SUCCESS(f'✅ RESPALDO CLOUD COMPLETADO EXITOSAMENTE'))
-            
+
             else:
-                # SIMULACIÓN
-                self.stdout.write(f'📡 Simulando conexión encriptada a S3...')
-                time.sleep(2) # Simula tiempo de red
-                
-                # "Subir" a la carpeta simulada
-                shutil.copy2(db_path, os.path.join(sim_s3_dir, db_filename))
-                if os.path.exists(media_root):
-                    shutil.copy2(f"{archive_path}.zip", os.path.join(sim_s3_dir, zip_filename))
-                
+                # SIMULACIÓN: la base ya quedó en la carpeta simulada
+                if backup_media:
+                    shutil.move(f"{archive_path}.zip", os.path.join(sim_s3_dir, zip_filename))
+
                 self.stdout.write(self.style.SUCCESS(f'✅ RESPALDO EXITOSO (Guardado en {sim_s3_dir})'))
                 self.stdout.write(self.style.WARNING(f'ℹ️  Nota: Configure variables de entorno para activar subida real.'))
 
@@ -79,4 +126,4 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f'❌ Error en protocolo: {str(e)}'))
         finally:
             if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
\ No newline at end of file
+                shutil.rmtree(temp_dir)
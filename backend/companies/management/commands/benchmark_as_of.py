@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import timedelta
+from api.history import catalog_as_of, as_of_page, AS_OF_CHUNK_SIZE
+from api.models import HistoricalProduct
+import random
+import statistics
+import time
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de /api/products/as-of/ sobre un historial sintético (ej: --products 200000 --revisions 100 '
+        '= 20 millones de filas). Las filas se insertan en una transacción que se revierte al terminar; '
+        'usar sobre una copia de la base.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000, help='Productos sintéticos (default: 20000)')
+        parser.add_argument('--revisions', type=int, default=50, help='Revisiones por producto (default: 50)')
+        parser.add_argument('--days', type=int, default=365, help='Días que abarca el historial (default: 365)')
+        parser.add_argument('--runs', type=int, default=5, help='Fechas consultadas (default: 5)')
+        parser.add_argument('--naive-sample', type=int, default=200, help='Productos para estimar la búsqueda uno a uno (default: 200)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def _fill(self, rng, products, revisions, days):
+        table = HistoricalProduct._meta.db_table
+        columns = [
+            'id', 'nombre_comercial', 'ean', 'sku', 'peso', 'dimensiones', 'descripcion', 'costo_cg',
+            'lugar_bodega', 'edad_uso', 'stock', 'is_active', 'precio_venta', 'rating',
+            'created_at', 'updated_at', 'history_date', 'history_type',
+        ]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        start = timezone.now() - timedelta(days=days)
+        step = timedelta(days=days) / revisions
+        # Ids por encima de los reales para no mezclarse con el catálogo
+        first_id = (HistoricalProduct.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        with connection.cursor() as cursor:
+            rows = []
+            for pk in range(first_id, first_id + products):
+                for revision in range(revisions):
+                    when = start + step * revision + timedelta(seconds=rng.randint(0, 3600))
+                    rows.append((
+                        pk, f'Producto {pk}', f'{pk:013d}', f'BENCH-{pk}', 1, '10x10x10', '', 1000,
+                        'Pasillo A', 'Adulto', rng.randint(0, 500), True, rng.randint(1000, 90000), 0,
+                        start, when, when, '+' if revision == 0 else '~',
+                    ))
+                if len(rows) >= 10000:
+                    cursor.executemany(sql, rows)
+                    rows = []
+            cursor.executemany(sql, rows)
+        return first_id
+
+    def _time(self, function):
+        start = time.perf_counter()
+        result = function()
+        return (time.perf_counter() - start) * 1000, result
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        products, revisions, days = options['products'], options['revisions'], options['days']
+        try:
+            with transaction.atomic():
+                fill_ms, first_id = self._time(lambda: self._fill(rng, products, revisions, days))
+                total = HistoricalProduct.objects.count()
+                self.stdout.write(f"   📦 {products * revisions:,} revisiones sintéticas en {fill_ms / 1000:.1f}s ({total:,} en la tabla)")
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+                now = timezone.now()
+                dates = [now - timedelta(days=rng.uniform(0, days)) for _ in range(options['runs'])]
+                first_page, full, naive = [], [], []
+                for when in dates:
+                    queryset = catalog_as_of(when)
+                    first_page.append(self._time(lambda: as_of_page(queryset))[0])
+                    # Catálogo completo por páginas, como el NDJSON
+                    def scan():
+                        after, count = 0, 0
+                        while rows := as_of_page(queryset, after):
+                            after, count = rows[-1]['id'], count + len(rows)
+                        return count
+                    elapsed, count = self._time(scan)
+                    full.append(elapsed)
+
+                    # Referencia: "última revisión antes de T" producto por producto
+                    sample = rng.sample(range(first_id, first_id + products), min(options['naive_sample'], products))
+                    elapsed, _ = self._time(lambda: [
+                        HistoricalProduct.objects.filter(id=pk, history_date__lte=when).order_by('-history_date', '-history_id').first()
+                        for pk in sample
+                    ])
+                    naive.append(elapsed / len(sample) * count)
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {options['runs']} fechas sobre {products:,} productos x {revisions} revisiones"))
+        self.stdout.write(f"   ⏱️  Primera página ({AS_OF_CHUNK_SIZE}): mediana {statistics.median(first_page):.1f} ms")
+        self.stdout.write(f"   ⏱️  Catálogo completo: mediana {statistics.median(full):.0f} ms")
+        self.stdout.write(f"   🐢 Consulta por producto (estimado): mediana {statistics.median(naive):.0f} ms")
@@ -0,0 +1,103 @@
+from django.core.management.base import BaseCommand
+from companies.backups import snapshot_sqlite, compress_file, timed, BACKUP_PAGES_PER_STEP
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de respaldo SQLite sobre una base sintética (ej: --size-mb 4096): duración de la copia y '
+        'latencia de un escritor concurrente con shutil.copy2 (anterior), backup en un paso y backup por pasos; '
+        'luego tiempo y tamaño de la compresión.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=512, help='Tamaño de la base de prueba (default: 512 MB)')
+        parser.add_argument('--journal-mode', choices=('wal', 'delete'), default='wal', help='Modo de journal de la base (default: wal)')
+        parser.add_argument('--pages', type=int, default=BACKUP_PAGES_PER_STEP, help=f'Páginas por paso (default: {BACKUP_PAGES_PER_STEP})')
+        parser.add_argument('--write-interval', type=float, default=0.01, help='Pausa del escritor entre transacciones (default: 0.01 s)')
+        parser.add_argument('--dir', default=None, help='Carpeta para los archivos de prueba (default: temporal del sistema)')
+
+    def _create(self, path, size_mb, journal_mode):
+        # Filas de ~4 KB mitad texto repetido, mitad aleatorio: se comprime como una base real, no como ceros
+        with sqlite3.connect(path) as db:
+            db.execute(f'PRAGMA journal_mode={journal_mode}')
+            db.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, payload BLOB)')
+            row = lambda: (b'producto-bodega-salas;' * 93)[:2048] + os.urandom(2048)
+            for _ in range(size_mb // 4):
+                db.executemany('INSERT INTO items (payload) VALUES (?)', (((row(),) for _ in range(1024))))
+                db.commit()
+
+    def _with_writer(self, path, interval, function):
+        """Corre `function` mientras otro hilo escribe; devuelve (segundos, resultado, latencias en ms)."""
+        latencies, stop = [], threading.Event()
+
+        def writer():
+            db = sqlite3.connect(path, timeout=60, isolation_level=None)
+            while not stop.is_set():
+                start = time.perf_counter()
+                db.execute('BEGIN IMMEDIATE')
+                db.execute('INSERT INTO items (payload) VALUES (?)', (os.urandom(256),))
+                db.execute('COMMIT')
+                latencies.append((time.perf_counter() - start) * 1000)
+                time.sleep(interval)
+            db.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            elapsed, result = timed(function)
+        finally:
+            stop.set()
+            thread.join()
+        return elapsed, result, latencies
+
+    def _report(self, name, elapsed, latencies, extra=''):
+        latencies = sorted(latencies) or [0]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"   {name:<28} {elapsed:7.2f}s | escritor: {len(latencies):5d} commits, "
+            f"p50 {statistics.median(latencies):6.2f} ms, p99 {p99:7.2f} ms, máx {latencies[-1]:8.1f} ms{extra}"
+        )
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='benchmark_backup_', dir=options['dir'])
+        source = os.path.join(workdir, 'source.sqlite3')
+        target = os.path.join(workdir, 'snapshot.sqlite3')
+        interval = options['write_interval']
+        try:
+            elapsed, _ = timed(self._create, source, options['size_mb'], options['journal_mode'])
+            self.stdout.write(f"   📦 Base de {os.path.getsize(source) / 1024 / 1024:.0f} MB ({options['journal_mode']}) creada en {elapsed:.1f}s")
+
+            def idle():
+                time.sleep(3)
+            elapsed, _, latencies = self._with_writer(source, interval, idle)
+            self._report("Sin respaldo (referencia)", elapsed, latencies)
+
+            elapsed, _, latencies = self._with_writer(source, interval, lambda: shutil.copy2(source, target))
+            self._report("shutil.copy2 (anterior)", elapsed, latencies, ' | copia no consistente')
+
+            for name, pages in (("backup en un paso", -1), (f"backup por pasos ({options['pages']})", options['pages'])):
+                os.remove(target)
+                elapsed, stats, latencies = self._with_writer(source, interval, lambda: snapshot_sqlite(source, target, pages=pages))
+                extra = f" | {stats['steps']} pasos, {stats['restarts']} reinicios{', última pasada con bloqueo' if stats['locked'] else ''}"
+                self._report(name, elapsed, latencies, extra)
+
+            for method in ('gzip', 'zstd'):
+                try:
+                    elapsed, (_, raw, compressed) = timed(compress_file, target, f"{target}.{method}", method)
+                except RuntimeError as e:
+                    self.stdout.write(f"   {method}: {e}")
+                    continue
+                self.stdout.write(
+                    f"   🗜️  {method:<5} {elapsed:6.1f}s, {raw / 1024 / 1024:.0f} MB -> {compressed / 1024 / 1024:.0f} MB "
+                    f"({raw / elapsed / 1024 / 1024:.0f} MB/s)"
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark de respaldo terminado"))
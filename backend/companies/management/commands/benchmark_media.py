@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.test import RequestFactory, override_settings
+from django.views.static import serve
+from api.media import serve_media
+import os
+import time
+import uuid
+
+class Command(BaseCommand):
+    help = 'Benchmark de entrega de /media/: django.views.static.serve vs api.media.serve_media (archivo sintético)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-kb', type=int, default=250, help='Tamaño del archivo de prueba (default: 250 KB)')
+        parser.add_argument('--requests', type=int, default=500, help='Peticiones por escenario (default: 500)')
+
+    def _run(self, view, requests, **headers):
+        factory = RequestFactory()
+        sent = 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = view(factory.get('/media/x', **headers))
+            # Se consume el cuerpo como lo haría el servidor
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    sent += len(chunk)
+            else:
+                sent += len(response.content)
+            response.close()
+        return time.perf_counter() - start, sent, response
+
+    def handle(self, *args, **options):
+        name = f"benchmark/{uuid.uuid4().hex}.bin"
+        full_path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as fh:
+            fh.write(os.urandom(options['size_kb'] * 1024))
+
+        n = options['requests']
+        try:
+            with override_settings(MEDIA_DELIVERY='django'):
+                _, _, first = self._run(lambda r: serve_media(r, name), 1)
+            etag = first['ETag']
+            scenarios = [
+                ("static.serve (actual)", lambda r: serve(r, name, document_root=settings.MEDIA_ROOT), 'django', {}),
+                ("serve_media FileResponse", lambda r: serve_media(r, name), 'django', {}),
+                ("serve_media 304 (If-None-Match)", lambda r: serve_media(r, name), 'django', {'HTTP_IF_NONE_MATCH': etag}),
+                ("serve_media rango 64 KB", lambda r: serve_media(r, name), 'django', {'HTTP_RANGE': 'bytes=0-65535'}),
+                ("serve_media X-Accel-Redirect", lambda r: serve_media(r, name), 'x-accel', {}),
+            ]
+
+            self.stdout.write(self.style.SUCCESS(f"✅ {n} peticiones por escenario, archivo de {options['size_kb']} KB"))
+            for label, view, mode, headers in scenarios:
+                with override_settings(MEDIA_DELIVERY=mode):
+                    elapsed, sent, response = self._run(view, n, **headers)
+                self.stdout.write(
+                    f"   {label:<34} {n / elapsed:8.0f} req/s  {sent / elapsed / 1024 / 1024:8.1f} MB/s por Python"
+                    f"  (HTTP {response.status_code}, Cache-Control: {response.get('Cache-Control', '-')})"
+                )
+            self.stdout.write("   Con X-Accel-Redirect/X-Sendfile el cuerpo lo envía el servidor frontal (0 bytes por Python).")
+        finally:
+            os.remove(full_path)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from api.analytics import classify_abc
+from api.models import Product
+import time
+
+class Command(BaseCommand):
+    help = 'Clasifica el catálogo en A/B/C según ingresos de venta del periodo (programar en cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Ventana móvil de ventas en días (default: 90)')
+        parser.add_argument('--a', type=int, default=80, help='Porcentaje acumulado de ingresos para clase A (default: 80)')
+        parser.add_argument('--b', type=int, default=95, help='Porcentaje acumulado de ingresos para clase B (default: 95)')
+
+    def handle(self, *args, **options):
+        if not 0 < options['a'] < options['b'] <= 100:
+            self.stdout.write(self.style.ERROR("❌ Los umbrales deben cumplir 0 < a < b <= 100"))
+            return
+
+        start_time = time.time()
+        counts = classify_abc(days=options['days'], threshold_a=options['a'], threshold_b=options['b'])
+        elapsed = time.time() - start_time
+
+        total = Product.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Clasificación ABC ({options['days']} días) en {elapsed:.2f}s: "
+            f"A={counts['A']} B={counts['B']} C={total - counts['A'] - counts['B']}"
+        ))
@@ -0,0 +1,113 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+from api.models import HistoricalBrand, HistoricalCategory, HistoricalProvider, HistoricalProduct, HistoricalProductImage
+import time
+
+# Campos que no cuentan como "cambio de datos": una revisión que solo difiere
+# de la anterior en estos es un movimiento de stock (recalcular_stock)
+STOCK_ONLY_FIELDS = {'stock', 'updated_at'}
+COMPARED_FIELDS = [
+    f.attname for f in HistoricalProduct._meta.fields
+    if not f.name.startswith('history_') and f.attname not in STOCK_ONLY_FIELDS
+]
+HISTORY_MODELS = (HistoricalBrand, HistoricalCategory, HistoricalProvider, HistoricalProduct, HistoricalProductImage)
+
+class Command(BaseCommand):
+    help = (
+        'Aplica la retención del historial (programar en cron): compacta a una revisión diaria '
+        'los cambios solo de stock anteriores al período de detalle y purga lo anterior al horizonte. '
+        'Trabaja por lotes de objetos, cada uno en su propia transacción; si se interrumpe, basta volver a ejecutarlo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--detail-days', type=int, default=settings.HISTORY_DETAIL_DAYS, help='Días con detalle completo')
+        parser.add_argument('--retention-days', type=int, default=settings.HISTORY_RETENTION_DAYS, help='Días de historial a conservar')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Objetos por transacción (default: 200)')
+        parser.add_argument('--dry-run', action='store_true', help='Solo cuenta lo que se borraría')
+
+    def _object_chunks(self, queryset, size):
+        # Recorre los ids de objeto en orden, por rangos: cada consulta usa el índice (id, fecha)
+        last = None
+        while True:
+            page = queryset if last is None else queryset.filter(id__gt=last)
+            ids = list(page.order_by('id').values_list('id', flat=True).distinct()[:size])
+            if not ids:
+                return
+            yield ids
+            last = ids[-1]
+
+    def _delete(self, model, history_ids, dry_run):
+        if history_ids and not dry_run:
+            with transaction.atomic():
+                model.objects.filter(history_id__in=history_ids).delete()
+        return len(history_ids)
+
+    def collapse_stock_revisions(self, horizon, cutoff, size, dry_run):
+        """
+        Dentro de cada día, de una racha de revisiones que solo cambian el stock
+        se conserva la última (el stock al cierre de ese tramo). Las revisiones
+        con cambios de datos no se tocan.
+        """
+        old = HistoricalProduct.objects.filter(history_date__gte=horizon, history_date__lt=cutoff)
+        removed = 0
+        for ids in self._object_chunks(old, size):
+            rows = old.filter(id__in=ids).order_by('id', 'history_date', 'history_id').values_list(
+                'history_id', 'id', 'history_type', 'history_date', *COMPARED_FIELDS
+            )
+            doomed, previous, candidate = [], None, None
+            for history_id, pk, history_type, history_date, *values in rows.iterator(chunk_size=2000):
+                day = timezone.localtime(history_date).date()
+                if previous is not None and previous[0] != pk:
+                    previous, candidate = None, None
+                stock_only = history_type == '~' and previous is not None and previous[1] == values
+                # La revisión anterior de la racha, del mismo día, queda cubierta por esta
+                if stock_only and candidate is not None and candidate[1] == day:
+                    doomed.append(candidate[0])
+                candidate = (history_id, day) if stock_only else None
+                previous = (pk, values)
+            removed += self._delete(HistoricalProduct, doomed, dry_run)
+        return removed
+
+    def purge(self, model, horizon, size, dry_run):
+        """
+        Borra lo anterior al horizonte, salvo la última revisión de cada objeto
+        (su estado en esa fecha, base para comparar y para consultas "a la fecha").
+        Si esa revisión es un borrado, el objeto ya no existe y no se conserva nada.
+        """
+        old = model.objects.filter(history_date__lt=horizon)
+        removed = 0
+        for ids in self._object_chunks(old, size):
+            rows = old.filter(id__in=ids).order_by('id', '-history_date', '-history_id').values_list('history_id', 'id', 'history_type')
+            doomed, seen = [], set()
+            for history_id, pk, history_type in rows.iterator(chunk_size=2000):
+                if pk in seen or history_type == '-':
+                    doomed.append(history_id)
+                seen.add(pk)
+            removed += self._delete(model, doomed, dry_run)
+        return removed
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        now = timezone.now()
+        detail_cutoff = now - timedelta(days=options['detail_days'])
+        horizon = now - timedelta(days=options['retention_days'])
+        if horizon > detail_cutoff:
+            self.stdout.write(self.style.ERROR("❌ --retention-days no puede ser menor que --detail-days"))
+            return
+        size, dry_run = options['chunk_size'], options['dry_run']
+        verb = "a borrar" if dry_run else "borradas"
+
+        purged = {model._meta.verbose_name: self.purge(model, horizon, size, dry_run) for model in HISTORY_MODELS}
+        for name, count in purged.items():
+            self.stdout.write(f"   {name}: {count} revisiones anteriores a {horizon:%Y-%m-%d} {verb}")
+
+        collapsed = self.collapse_stock_revisions(horizon, detail_cutoff, size, dry_run)
+        self.stdout.write(f"   {HistoricalProduct._meta.verbose_name}: {collapsed} revisiones solo de stock {verb} (antes de {detail_cutoff:%Y-%m-%d})")
+
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Historial compactado: {sum(purged.values()) + collapsed} revisiones {verb} en {elapsed:.1f}s"
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import ProductImage, HistoricalProductImage
+from api.storage import product_image_storage
+import re
+
+HASHED = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$')
+
+class Command(BaseCommand):
+    help = 'Mueve las imágenes antiguas al almacenamiento por contenido (sha256), unificando duplicados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo informa, no mueve ni borra archivos')
+
+    def handle(self, *args, **options):
+        storage = product_image_storage
+        names = set(ProductImage.objects.exclude(image='').values_list('image', flat=True))
+        names |= set(HistoricalProductImage.objects.exclude(image='').values_list('image', flat=True))
+        pending = sorted(name for name in names if not HASHED.search(name) and storage.exists(name))
+
+        moved = freed = 0
+        targets = set()
+        for name in pending:
+            with storage.open(name, 'rb') as fh:
+                target = storage.hashed_name(name, storage.content_hash(fh))
+                # Si el contenido ya existe (o ya se migró un gemelo), este archivo sobra
+                if target in targets or storage.exists(target):
+                    freed += storage.size(name)
+                if not options['dry_run']:
+                    storage.save(name, fh)
+            if not options['dry_run']:
+                with transaction.atomic():
+                    ProductImage.objects.filter(image=name).update(image=target)
+                    HistoricalProductImage.objects.filter(image=name).update(image=target)
+                storage.delete(name)
+            targets.add(target)
+            moved += 1
+
+        prefix = "[Simulación] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {prefix}{moved} archivos migrados a {len(targets)} archivos únicos ({freed / 1024 / 1024:.1f} MB ahorrados)"
+        ))
+        if moved and not options['dry_run']:
+            self.stdout.write("Ejecute regenerate_image_derivatives --missing para regenerar las variantes.")
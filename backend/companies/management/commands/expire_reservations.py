@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from api.models import expire_reservations
+import time
+
+class Command(BaseCommand):
+    help = 'Libera las reservas de stock vencidas (programar en cron cada minuto)'
+
+    def handle(self, *args, **kwargs):
+        start_time = time.time()
+        total = expire_reservations()
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"✅ Reservas expiradas: {total} en {elapsed:.2f}s"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from api.duplicates import find_duplicates, group_pairs, reindex_products, DEFAULT_THRESHOLD
+from api.models import Product
+import time
+
+class Command(BaseCommand):
+    help = 'Detecta productos probablemente duplicados (MinHash + LSH sobre nombre, marca y dimensiones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help=f'Similitud mínima 0-1 (default: {DEFAULT_THRESHOLD})')
+        parser.add_argument('--brand', type=int, help='Limitar a una marca (id)')
+        parser.add_argument('--limit', type=int, default=50, help='Grupos a mostrar (default: 50)')
+        parser.add_argument('--reindex', action='store_true', help='Recalcula antes las firmas (productos cargados sin pasar por save())')
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.filter(is_active=True)
+        if options['brand']:
+            queryset = queryset.filter(brand_id=options['brand'])
+
+        start_time = time.time()
+        if options['reindex']:
+            self.stdout.write(f"   🔄 {reindex_products(queryset)} firmas actualizadas")
+        pairs = find_duplicates(queryset, threshold=options['threshold'])
+        groups = group_pairs(pairs)
+        elapsed = time.time() - start_time
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {queryset.count()} productos analizados en {elapsed:.2f}s: {len(pairs)} pares, {len(groups)} grupos"
+        ))
+
+        shown = groups[:options['limit']]
+        names = dict(Product.objects.filter(pk__in=[pk for group in shown for pk in group]).values_list('pk', 'nombre_comercial'))
+        for group in shown:
+            self.stdout.write("🔁 " + " | ".join(f"#{pk} {names.get(pk)}" for pk in group))
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from api.images import derivative_paths
+from api.models import ProductImage, HistoricalProductImage
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+class Command(BaseCommand):
+    help = 'Borra los archivos de product_images/ que ninguna imagen (actual o del historial) referencia (programar en cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo informa qué se borraría')
+        parser.add_argument('--min-age', type=int, default=60, help='Minutos de antigüedad mínima (protege subidas en curso; default: 60)')
+        parser.add_argument('--workers', type=int, default=8, help='Hilos de borrado (default: 8)')
+        parser.add_argument('--verbose-list', action='store_true', help='Lista cada archivo huérfano')
+
+    def _scan(self, root):
+        # os.scandir entrega tamaño/fecha sin un stat() extra por archivo en la mayoría de los sistemas
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        yield os.path.relpath(entry.path, settings.MEDIA_ROOT).replace(os.sep, '/'), stat.st_size, stat.st_mtime
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        upload_to = ProductImage._meta.get_field('image').upload_to
+        root = os.path.join(settings.MEDIA_ROOT, upload_to)
+        if not os.path.isdir(root):
+            self.stdout.write(self.style.WARNING(f"No existe {root}"))
+            return
+
+        on_disk = {path: (size, mtime) for path, size, mtime in self._scan(root)}
+
+        referenced = set(ProductImage.objects.values_list('image', flat=True).iterator(chunk_size=5000))
+        referenced |= set(HistoricalProductImage.objects.values_list('image', flat=True).iterator(chunk_size=5000))
+        for derivatives in ProductImage.objects.exclude(derivatives={}).values_list('derivatives', flat=True).iterator(chunk_size=5000):
+            referenced |= derivative_paths(derivatives)
+
+        cutoff = time.time() - options['min_age'] * 60
+        orphans = on_disk.keys() - referenced
+        recent = {path for path in orphans if on_disk[path][1] > cutoff}
+        orphans -= recent
+        freed = sum(on_disk[path][0] for path in orphans)
+        missing = {path for path in referenced if path and path.startswith(upload_to)} - on_disk.keys()
+
+        if options['verbose_list']:
+            for path in sorted(orphans):
+                self.stdout.write(f"   {path} ({on_disk[path][0] / 1024:.0f} KB)")
+
+        errors = 0
+        if not options['dry_run'] and orphans:
+            def remove(path):
+                try:
+                    os.remove(os.path.join(settings.MEDIA_ROOT, path))
+                    return True
+                except FileNotFoundError:
+                    return True
+                except OSError as e:
+                    self.stderr.write(f"⚠️ Error borrando {path}: {e}")
+                    return False
+
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                errors = sum(1 for ok in pool.map(remove, orphans) if not ok)
+
+        elapsed = time.time() - start_time
+        prefix = "[Simulación] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {prefix}{len(on_disk)} archivos, {len(referenced)} referencias: "
+            f"{len(orphans)} huérfanos ({freed / 1024 / 1024:.1f} MB) {'a borrar' if options['dry_run'] else 'borrados'} en {elapsed:.2f}s"
+        ))
+        if recent:
+            self.stdout.write(f"   {len(recent)} huérfanos recientes (< {options['min_age']} min) se conservan por ahora.")
+        if missing:
+            self.stdout.write(self.style.WARNING(f"   {len(missing)} referencias apuntan a archivos inexistentes."))
+        if errors:
+            self.stdout.write(self.style.ERROR(f"   {errors} archivos no se pudieron borrar."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from api.models import StockEvent
+
+class Command(BaseCommand):
+    help = 'Borra los eventos de stock más antiguos que la retención (programar en cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.STOCK_EVENTS_RETENTION_HOURS, help='Horas de eventos a conservar')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        # Se borra por rango de id (secuencia), no fila a fila. El último evento se
+        # conserva siempre: marca la secuencia (SQLite reutilizaría ids si la tabla
+        # queda vacía) y permite a los clientes detectar que se perdieron eventos.
+        last_old = StockEvent.objects.filter(created_at__lt=cutoff).order_by('-id').values_list('id', flat=True).first()
+        newest = StockEvent.objects.order_by('-id').values_list('id', flat=True).first()
+        deleted = 0
+        if last_old is not None:
+            deleted, _ = StockEvent.objects.filter(id__lte=last_old, id__lt=newest).delete()
+        self.stdout.write(self.style.SUCCESS(f"✅ Eventos de stock purgados: {deleted}"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from api.analytics import rebuild_inventory_valuation
+import time
+
+class Command(BaseCommand):
+    help = 'Reconstruye el resumen de valorización de inventario (programar en cron)'
+
+    def handle(self, *args, **kwargs):
+        start_time = time.time()
+        total = rebuild_inventory_valuation()
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"✅ Valorización recalculada: {total} grupos en {elapsed:.2f}s"))
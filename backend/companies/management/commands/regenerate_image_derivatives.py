@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api.images import build_derivatives, save_derivatives
+from api.models import ProductImage
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import time
+
+def _build(pk, name):
+    # Corre en otro proceso: solo lee/escribe archivos, la base de datos la toca el proceso principal
+    try:
+        return pk, name, build_derivatives(name), None
+    except Exception as e:
+        return pk, name, None, str(e)
+
+class Command(BaseCommand):
+    help = 'Regenera las variantes (WebP/JPEG por ancho) de las imágenes de producto usando todos los núcleos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Solo imágenes sin variantes o con variantes de otro archivo')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Procesos en paralelo (default: núcleos)')
+
+    def handle(self, *args, **options):
+        rows = list(ProductImage.objects.exclude(image='').values_list('pk', 'image', 'derivatives'))
+        if options['missing']:
+            rows = [(pk, name, d) for pk, name, d in rows if (d or {}).get('source') != name]
+
+        # Los procesos hijos no deben heredar conexiones abiertas
+        connections.close_all()
+        start_time = time.time()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [pool.submit(_build, pk, name) for pk, name, _ in rows]
+            for future in as_completed(futures):
+                pk, name, derivatives, error = future.result()
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"Imagen {pk} ({name}): {error}"))
+                    continue
+                save_derivatives(pk, name, derivatives)
+                done += 1
+
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"✅ Variantes generadas: {done} imágenes ({failed} con error) en {elapsed:.2f}s con {options['workers']} procesos"))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from api.cascades import prepare_resume, resumable_jobs, run_deactivation_job
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Reanuda las descontinuaciones en cascada que no terminaron (PENDING, FAILED o RUNNING sin '
+        'avance en DEACTIVATION_JOB_STALE_MINUTES) desde los productos que siguen activos. Correr al '
+        'iniciar el servidor: el pool de fondo no sobrevive a un reinicio. Cada trabajo se reclama con '
+        'un UPDATE condicional, así que dos procesos no corren el mismo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, action='append', help='Solo estos trabajos (se puede repetir)')
+
+    def handle(self, *args, **options):
+        jobs = resumable_jobs().order_by('created_at')
+        if options['job']:
+            jobs = jobs.filter(pk__in=options['job'])
+
+        start_time = time.time()
+        for job in jobs:
+            prepared = prepare_resume(job)
+            if prepared is None:
+                continue
+            ids, reason, done = prepared
+            self.stdout.write(f"   ▶️  {job}: {len(ids)} productos activos por apagar")
+            # En este mismo proceso: el comando espera a que cada trabajo termine
+            run_deactivation_job(job.pk, ids, reason, done)
+            job.refresh_from_db()
+            style = self.style.SUCCESS if job.status == 'DONE' else self.style.ERROR
+            self.stdout.write(style(f"   {job.get_status_display()}: {job.processed}/{job.total} {job.error}".rstrip()))
+
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"✅ Descontinuaciones revisadas en {elapsed:.2f}s"))
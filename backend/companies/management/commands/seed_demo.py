@@ -5,7 +5,7 @@ from django.core.files.base import ContentFile
 
 from companies.models import Company, UserProfile
 from api.models import (
-    Product, Brand, Category, Provider, ProductImage, StockMovement
+    Product, Brand, Category, Provider, ProductImage, StockMovement, Location, StockBalance
 )
 
 import os
@@ -105,6 +105,8 @@ class Command(BaseCommand):
         self.stdout.write("🧹 Limpiando tablas principales…")
 
         StockMovement.objects.all().delete()
+        StockBalance.objects.all().delete()
+        Location.objects.all().delete()
         ProductImage.objects.all().delete()
         Product.objects.all().delete()
         Brand.objects.all().delete()
@@ -152,13 +154,13 @@ class Command(BaseCommand):
         # 4) MARCAS - CATEGORÍAS - PROVIDERS
         # ===================================================
         brands = ["Makita", "Bosch", "Stanley", "Samsung", "Lenovo", "LG", "HP", "GenPro"]
-        brand_objs = [Brand.objects.create(name=b) for b in brands]
+        brand_objs = [Brand.objects.create(name=b, company=company) for b in brands]
 
         categories_data = ["Herramientas", "Electrónica", "Hogar", "Computación"]
-        cat_objs = [Category.objects.create(name=c) for c in categories_data]
+        cat_objs = [Category.objects.create(name=c, company=company) for c in categories_data]
 
         providers = ["Sodimac Pro", "Ingram Micro", "AliExpress", "Distribuidora Chile"]
-        provider_objs = [Provider.objects.create(name=p) for p in providers]
+        provider_objs = [Provider.objects.create(name=p, company=company) for p in providers]
 
         # ===================================================
         # 5) NOMBRES BASE POR CATEGORÍA
@@ -200,6 +202,7 @@ class Command(BaseCommand):
             # Crear producto
             product = Product.objects.create(
                 user=admin,
+                company=company,
                 nombre_comercial=full_name,
                 brand=random.choice(brand_objs),
                 ean=f"780{random.randint(10000000, 99999999)}",
@@ -214,6 +217,8 @@ class Command(BaseCommand):
                 precio_venta=random.randint(20000, 300000),
                 lugar_bodega=f"Pasillo {random.choice(['A','B','C'])}",
             )
+            # El stock inicial queda en la ubicación del producto
+            StockBalance.objects.create(product=product, location=Location.for_product(product), quantity=product.stock)
 
             # -------------------------------
             # DESCARGAR 2 a 5 IMÁGENES
@@ -33,4 +33,11 @@ class UserProfile(models.Model):
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        UserProfile.objects.create(user=instance)
+
+def get_user_company(user):
+    """
+    Empresa (tenant) del usuario según su perfil, o None si no tiene.
+    """
+    profile = getattr(user, 'profile', None)
+    return getattr(profile, 'company', None)
@@ -0,0 +1,31 @@
+from .models import get_user_company
+
+
+def scope_queryset(queryset, user, field='company'):
+    """
+    Limita `queryset` a la empresa del usuario. Sin empresa asignada solo se
+    ven los registros sin empresa, salvo los superusuarios, que ven todo.
+    """
+    company = get_user_company(user)
+    if company is not None:
+        return queryset.filter(**{field: company})
+    if getattr(user, 'is_superuser', False):
+        return queryset
+    return queryset.filter(**{f'{field}__isnull': True})
+
+
+class CompanyScopedMixin:
+    """
+    Para ViewSets: filtra get_queryset() por la empresa del usuario.
+    `company_field` indica el camino hasta la empresa (ej: 'product__company').
+    """
+    company_field = 'company'
+
+    def get_company(self):
+        return get_user_company(self.request.user)
+
+    def scope_queryset(self, queryset):
+        return scope_queryset(queryset, self.request.user, self.company_field)
+
+    def get_queryset(self):
+        return self.scope_queryset(super().get_queryset())
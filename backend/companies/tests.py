@@ -1,3 +1,131 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.models import Brand, Category, HistoricalProduct, Provider, Product
+
+
+class BackupTests(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.source = os.path.join(self.workdir, 'source.sqlite3')
+        with sqlite3.connect(self.source) as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+            db.executemany('INSERT INTO items (name) VALUES (?)', [(f'item {i}',) for i in range(100)])
+
+    def backup(self, temp_dir):
+        out = StringIO()
+        with override_settings(BASE_DIR=self.workdir), \
+                mock.patch.dict(settings.DATABASES['default'], NAME=self.source), \
+                mock.patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': ''}):
+            call_command('backup_s3', skip_media=True, temp_dir=temp_dir, stdout=out)
+        return out.getvalue()
+
+    def test_backup_in_the_configured_temp_dir(self):
+        temp_dir = os.path.join(self.workdir, 'scratch')
+        output = self.backup(temp_dir)
+        self.assertIn('RESPALDO EXITOSO', output)
+        # Solo se borra la carpeta propia dentro de --temp-dir
+        self.assertEqual(os.listdir(temp_dir), [])
+
+        bucket = os.path.join(self.workdir, 'simulated_s3_bucket')
+        manifest_name = next(name for name in os.listdir(bucket) if name.endswith('.json'))
+        with open(os.path.join(bucket, manifest_name)) as fh:
+            manifest = json.load(fh)
+        restored = os.path.join(self.workdir, 'restored.sqlite3')
+        with gzip.open(os.path.join(bucket, manifest['file'])) as src, open(restored, 'wb') as dst:
+            dst.write(src.read())
+        with sqlite3.connect(restored) as db:
+            self.assertEqual(db.execute('SELECT count(*) FROM items').fetchone()[0], 100)
+
+    def test_stops_before_copying_without_space(self):
+        temp_dir = os.path.join(self.workdir, 'scratch')
+        with mock.patch('companies.backups.shutil.disk_usage', return_value=mock.Mock(free=1024)):
+            output = self.backup(temp_dir)
+        self.assertIn('Espacio insuficiente', output)
+        self.assertEqual(os.listdir(temp_dir), [])
+
+
+class CompactHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('admin', password='x')
+        self.brand = Brand.objects.create(name='Bosch')
+        self.category = Category.objects.create(name='Herramientas')
+        self.provider = Provider.objects.create(name='Sodimac')
+
+    def product(self, i, when):
+        product = Product.objects.create(
+            user=self.user, nombre_comercial=f'Taladro {i}', brand=self.brand, category=self.category,
+            provider=self.provider, ean=f'780{i:010d}', sku=f'SKU-{i}', dimensiones='10x20x30',
+            descripcion='Taladro percutor', costo_cg=1000, lugar_bodega='Pasillo A', stock=10, precio_venta=2000,
+        )
+        self.date_last(product, when)
+        return product
+
+    def date_last(self, product, when):
+        last = HistoricalProduct.objects.filter(id=product.pk).latest('history_id')
+        HistoricalProduct.objects.filter(history_id=last.history_id).update(history_date=when)
+
+    def change(self, product, when, **fields):
+        for field, value in fields.items():
+            setattr(product, field, value)
+        product.save()
+        self.date_last(product, when)
+
+    def revisions(self):
+        return list(HistoricalProduct.objects.order_by('id', 'history_date', 'history_id').values_list('id', 'history_type', 'precio_venta', 'stock'))
+
+    def compact(self, **options):
+        out = StringIO()
+        call_command('compact_history', detail_days=90, retention_days=730, stdout=out, **options)
+        return out.getvalue()
+
+    def test_retention_and_idempotence(self):
+        now = timezone.localtime()
+        old = self.product(1, now - timedelta(days=800))
+        self.change(old, now - timedelta(days=760), precio_venta=2500)
+
+        gone = self.product(2, now - timedelta(days=800)).pk
+        Product.objects.filter(pk=gone).delete()
+        HistoricalProduct.objects.filter(id=gone, history_type='-').update(history_date=now - timedelta(days=790))
+
+        # Un día dentro de la retención: un cambio de precio y tres solo de stock
+        day = (now - timedelta(days=200)).replace(hour=9)
+        product = self.product(3, day - timedelta(days=1))
+        self.change(product, day, precio_venta=3000)
+        for hour, stock in ((10, 9), (11, 8), (12, 7)):
+            self.change(product, day.replace(hour=hour), stock=stock)
+        # En el período de detalle no se compacta
+        for days, stock in ((10, 6), (9, 5)):
+            self.change(product, now - timedelta(days=days), stock=stock)
+
+        dry_run = self.compact(dry_run=True)
+        self.assertIn('Historial compactado: 5 revisiones a borrar', dry_run)
+        self.assertEqual(HistoricalProduct.objects.count(), 11)
+
+        # Se conserva la última revisión anterior al horizonte y la última de la racha de stock
+        self.compact()
+        expected = [
+            (old.pk, '~', 2500, 10),
+            (product.pk, '+', 2000, 10), (product.pk, '~', 3000, 10), (product.pk, '~', 3000, 7),
+            (product.pk, '~', 3000, 6), (product.pk, '~', 3000, 5),
+        ]
+        self.assertEqual(self.revisions(), expected)
+
+        # Una segunda pasada no encuentra nada más
+        self.assertIn('Historial compactado: 0 revisiones borradas', self.compact())
+        self.assertEqual(self.revisions(), expected)
@@ -0,0 +1,22 @@
+#!/usr/bin/env bash
+# exit on error
+set -o errexit
+
+# Comando de inicio del servicio web. Se sirve por ASGI (workers de uvicorn
+# dentro de gunicorn): /api/stock-events/ es una vista async con streaming y,
+# bajo WSGI, la respuesta quedaría acumulada hasta cerrarse la conexión.
+# A la inversa, bajo ASGI una StreamingHttpResponse con un iterador síncrono
+# se acumula entera antes de enviarse: las exportaciones (pim-sheets, as-of
+# ?stream=1) usan iteradores asíncronos y /media/ lo entrega el servidor
+# frontal (MEDIA_DELIVERY). AsgiStreamingTests lo verifica.
+
+# Las descontinuaciones en cascada corren en un pool en memoria: las que un
+# reinicio dejó a medias (RUNNING sin avance reciente) se retoman en paralelo
+# al arranque; las que otro worker sigue procesando no se tocan
+python manage.py resume_deactivation_jobs &
+
+exec gunicorn backend.asgi:application \
+    --worker-class uvicorn.workers.UvicornWorker \
+    --bind "0.0.0.0:${PORT:-8000}" \
+    --workers "${WEB_CONCURRENCY:-2}" \
+    --timeout 120
@@ -1,6 +1,7 @@
 import React, { useEffect, useRef, useState, useMemo } from "react";
 import { Table, Button, Modal, Form, Spinner, Row, Col, Image, Alert, Badge, InputGroup, Toast, ToastContainer, Card, Tab, Tabs } from "react-bootstrap";
 import { useAuth } from "../context/AuthContext";
+import useStockEvents from "../hooks/useStockEvents";
 
 function AdminProducts({ theme }) {
   const { authFetch } = useAuth();
@@ -68,6 +69,12 @@ function AdminProducts({ theme }) {
     // eslint-disable-next-line
   }, []);
 
+  // Stock en vivo: los movimientos de cualquier pantalla llegan por el canal de eventos
+  const stockLive = useStockEvents(
+    ({ product_id, stock, disponible }) => setProducts(prev => prev.map(p => p.id === product_id ? { ...p, stock, disponible } : p)),
+    () => refreshProducts()
+  );
+
   // --- HELPERS ---
   const showFeedback = (message, variant = 'success') => setToastConfig({ show: true, message, variant });
   const formatPrice = (price) => new Intl.NumberFormat("es-CL", { style: "currency", currency: "CLP" }).format(price || 0);
@@ -214,7 +221,7 @@ function AdminProducts({ theme }) {
           setDims({ alto: d[0] || "", largo: d[1] || "", ancho: d[2] || "" });
 
           // Cargar imágenes
-          authFetch(`/api/product-images/?search=${product.id}`)
+          authFetch(`/api/product-images/?product=${product.id}`)
               .then(r => r.json())
               .then(data => {
                   const imgs = data.results || data || [];
@@ -284,24 +291,33 @@ function AdminProducts({ theme }) {
         const prodId = savedProd.id;
 
         // --- GUARDADO DE IMÁGENES ---
+        // Existentes: solo se corrige la marca de principal
         for (let i = 0; i < previews.length; i++) {
             const pv = previews[i];
             const isMain = (i === principalIndex); 
 
-            if (pv.kind === 'existing') {
-                if (pv.is_principal !== isMain) {
-                    await authFetch(`/api/product-images/${pv.id}/`, {
-                        method: "PATCH", 
-                        headers: { "Content-Type": "application/json" },
-                        body: JSON.stringify({ is_principal: isMain })
-                    });
-                }
-            } else if (pv.kind === 'new') {
-                const fd = new FormData();
-                fd.append("image", pv.file);
-                fd.append("product", prodId);
-                fd.append("is_principal", isMain ? "true" : "false");
-                await authFetch("/api/product-images/", { method: "POST", body: fd });
+            if (pv.kind === 'existing' && pv.is_principal !== isMain) {
+                await authFetch(`/api/product-images/${pv.id}/`, {
+                    method: "PATCH", 
+                    headers: { "Content-Type": "application/json" },
+                    body: JSON.stringify({ is_principal: isMain })
+                });
+            }
+        }
+
+        // Nuevas: un solo POST con todo el lote (el servidor las procesa en paralelo)
+        const nuevas = previews.filter(pv => pv.kind === 'new');
+        if (nuevas.length > 0) {
+            const fd = new FormData();
+            fd.append("product", prodId);
+            nuevas.forEach(pv => fd.append("images", pv.file));
+            const principalNueva = nuevas.indexOf(previews[principalIndex]);
+            if (principalNueva !== -1) fd.append("principal", principalNueva);
+            const imgRes = await authFetch("/api/product-images/batch/", { method: "POST", body: fd });
+            if (!imgRes.ok) {
+                const err = await imgRes.json();
+                const detalle = err.images && typeof err.images === 'object' ? Object.entries(err.images).map(([f, m]) => `${f}: ${m}`).join(" / ") : (err.images || err.detail);
+                throw new Error(`Producto guardado, pero fallaron las imágenes: ${detalle || "error desconocido"}`);
             }
         }
 
@@ -440,9 +456,22 @@ function AdminProducts({ theme }) {
           const finalRes = await authFetch(`/api/${endpoint}/${id}/`, { method: "DELETE" });
           
           if (!finalRes.ok) throw new Error("Error al descontinuar registros");
+          setDeleteConfirm({ ...deleteConfirm, show: false });
+
+          // 202: son muchos productos y el backend sigue en segundo plano; consultamos el avance
+          if (finalRes.status === 202) {
+              let job = await finalRes.json();
+              while (job.status === 'PENDING' || job.status === 'RUNNING') {
+                  showFeedback(`Descontinuando productos de ${entity} "${name}": ${job.processed} de ${job.total}...`, "info");
+                  await new Promise(resolve => setTimeout(resolve, 1500));
+                  const jobRes = await authFetch(`/api/deactivation-jobs/${job.id}/`);
+                  if (!jobRes.ok) throw new Error("Error al consultar el avance");
+                  job = await jobRes.json();
+              }
+              if (job.status === 'FAILED') throw new Error(job.error);
+          }
 
           showFeedback(`Operación Exitosa: ${entity} y sus productos han sido descontinuados.`, "success");
-          setDeleteConfirm({ ...deleteConfirm, show: false });
           
           // Recargamos todo para ver los cambios
           loadAllData();
@@ -483,7 +512,8 @@ function AdminProducts({ theme }) {
           
           showFeedback("Stock actualizado exitosamente", "success");
           setShowStockModal(false);
-          refreshProducts();
+          // Sin canal de eventos abierto, el stock nuevo no llega solo
+          if (!stockLive.current) refreshProducts();
       } catch (e) { showFeedback(e.message, "danger"); }
   };
 
@@ -631,8 +661,8 @@ function AdminProducts({ theme }) {
                         <tr key={p.id} className={dark ? "border-secondary" : ""}>
                             <td>
                                 <div className="rounded bg-body-secondary d-flex align-items-center justify-content-center" style={{width:40, height:40, overflow:'hidden'}}>
-                                    {p.images?.[0]?.image ? (
-                                        <Image src={p.images[0].image} style={{width:'100%', height:'100%', objectFit:'cover'}} />
+                                    {p.imagen_principal?.image ? (
+                                        <Image src={p.imagen_principal.thumbnail || p.imagen_principal.image} loading="lazy" style={{width:'100%', height:'100%', objectFit:'cover'}} />
                                     ) : <i className="bi bi-box text-muted"></i>}
                                 </div>
                             </td>
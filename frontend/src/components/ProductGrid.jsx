@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { Modal, Form, Button, Pagination, Card, Badge, Container, Row, Col, Spinner, Alert, Offcanvas, InputGroup, Toast, ToastContainer, Table } from 'react-bootstrap';
 import { useAuth } from '../context/AuthContext';
+import useStockEvents from '../hooks/useStockEvents';
 import {
   Chart as ChartJS,
   CategoryScale,
@@ -60,6 +61,12 @@ const ProductGrid = () => {
 
   useEffect(() => { loadProducts(); }, []); // eslint-disable-line
 
+  // Stock en vivo: se actualiza solo el producto afectado, sin recargar el catálogo
+  const stockLive = useStockEvents(
+    ({ product_id, stock, disponible }) => setProducts(prev => prev.map(p => p.id === product_id ? { ...p, stock, disponible } : p)),
+    () => loadProducts()
+  );
+
   const showFeedback = (message, variant = 'success') => setToastConfig({ show: true, message, variant });
 
   const loadProducts = async () => {
@@ -70,18 +77,39 @@ const ProductGrid = () => {
       const data = await response.json();
       const productsArray = data.results || data;
       
-      setProducts(productsArray.map(product => ({
-        ...product,
-        imagen_principal: product.images?.find(img => img.is_principal)?.image || product.images?.[0]?.image || defaultImage,
-        marca: product.brand?.name || 'Genérico',
-        categoria: product.category?.name || 'General',
-        proveedor: product.provider?.name || 'N/A',
-        images: product.images?.map(img => img.image) || [],
-      })));
+      setProducts(productsArray.map(product => {
+        // El listado trae solo la imagen principal; la galería se pide al abrir el detalle
+        const principal = product.imagen_principal;
+        return {
+          ...product,
+          imagen_principal: principal?.image || defaultImage,
+          // Variantes redimensionadas: el navegador elige el ancho según la tarjeta
+          imagen_srcset: principal?.srcset_webp || principal?.srcset_jpeg || undefined,
+          imagen_miniatura: principal?.thumbnail || principal?.image || defaultImage,
+          marca: product.brand?.name || 'Genérico',
+          categoria: product.category?.name || 'General',
+          proveedor: product.provider?.name || 'N/A',
+          images: principal ? [principal.image] : [],
+        };
+      }));
     } catch (error) { showFeedback("Error al cargar productos", "danger"); } 
     finally { setLoading(false); }
   };
 
+  const openDetail = (product) => {
+    setModalData(product);
+    setCurrentImageIndex(0);
+    setShowModal(true);
+    loadForecast(product.id);
+    authFetch(`/api/product-images/?product=${product.id}`)
+      .then(r => r.ok ? r.json() : [])
+      .then(data => {
+        const imgs = (data.results || data).map(img => img.image);
+        if (imgs.length > 0) setModalData(prev => prev?.id === product.id ? { ...prev, images: imgs } : prev);
+      })
+      .catch(() => {});
+  };
+
   const handleCopyPimSheet = async (e, productId) => {
     e.stopPropagation();
     try {
@@ -115,7 +143,7 @@ const ProductGrid = () => {
 
   const handleProcessSale = async () => {
     if (saleQuantity <= 0) return showFeedback("Cantidad inválida", "warning");
-    if (saleQuantity > saleProduct.stock) return showFeedback("Sin stock suficiente", "danger");
+    if (saleQuantity > saleProduct.disponible) return showFeedback("Sin stock suficiente", "danger");
     setSaleLoading(true);
     try {
       const res = await authFetch('/api/stock-movements/', {
@@ -126,7 +154,8 @@ const ProductGrid = () => {
       if (res.ok) {
         showFeedback(`✅ Venta registrada: -${saleQuantity}`, "success");
         setShowSaleModal(false);
-        loadProducts();
+        // Sin canal de eventos abierto, el stock nuevo no llega solo
+        if (!stockLive.current) loadProducts();
       } else {
         const err = await res.json();
         showFeedback(err.detail || "Error al procesar", "danger");
@@ -266,9 +295,9 @@ const ProductGrid = () => {
             <Row className="g-3 g-xl-4">
               {paginatedProducts.map(p => (
                 <Col key={p.id} xs={6} md={4} lg={3}>
-                  <Card className="h-100 shadow-sm border-0 overflow-hidden bg-body product-card" style={{cursor:'pointer', transition: 'transform 0.2s'}} onClick={() => { setModalData(p); setCurrentImageIndex(0); setShowModal(true); loadForecast(p.id); }}>
+                  <Card className="h-100 shadow-sm border-0 overflow-hidden bg-body product-card" style={{cursor:'pointer', transition: 'transform 0.2s'}} onClick={() => openDetail(p)}>
                     <div className="position-relative text-center p-3 bg-body-tertiary" style={{height: '200px'}}>
-                      <Card.Img variant="top" src={p.imagen_principal} className="h-100 w-auto" style={{objectFit: 'contain', maxWidth: '100%'}} />
+                      <Card.Img variant="top" src={p.imagen_principal} srcSet={p.imagen_srcset} sizes="(max-width: 576px) 100vw, 320px" loading="lazy" className="h-100 w-auto" style={{objectFit: 'contain', maxWidth: '100%'}} />
                       <div className="position-absolute top-0 start-0 m-2">
                          <Badge bg="body" text="body" className="border shadow-sm opacity-75">{p.marca}</Badge>
                       </div>
@@ -282,10 +311,10 @@ const ProductGrid = () => {
                       <div className="mt-auto pt-3">
                         <div className="d-flex justify-content-between align-items-center mb-3">
                             <h5 className="text-primary fw-bold mb-0">{formatPrice(p.precio_venta)}</h5>
-                            <div style={{transform: 'scale(0.9)', transformOrigin: 'right center'}}>{getStatusBadge(p.stock)}</div>
+                            <div style={{transform: 'scale(0.9)', transformOrigin: 'right center'}}>{getStatusBadge(p.disponible)}</div>
                         </div>
                         <div className="d-flex gap-2">
-                            <Button variant="primary" className="flex-grow-1 fw-bold d-flex align-items-center justify-content-center gap-2" onClick={(e) => openSaleModal(e, p)} disabled={p.stock <= 0}>
+                            <Button variant="primary" className="flex-grow-1 fw-bold d-flex align-items-center justify-content-center gap-2" onClick={(e) => openSaleModal(e, p)} disabled={p.disponible <= 0}>
                                 <i className="bi bi-cart-check-fill"></i> VENDER
                             </Button>
                             <Button variant="outline-secondary" className="px-3" onClick={(e) => handleCopyPimSheet(e, p.id)} title="Copiar Ficha Técnica">
@@ -440,7 +469,7 @@ const ProductGrid = () => {
                                 <Badge bg="info" text="dark" className="me-2 fs-6">{modalData.marca}</Badge>
                                 <Badge bg="secondary" className="fs-6">{modalData.categoria}</Badge>
                             </div>
-                            <div className="fs-5">{getStatusBadge(modalData.stock)}</div>
+                            <div className="fs-5">{getStatusBadge(modalData.disponible)}</div>
                         </div>
 
                         <h2 className="fw-bold mb-2 display-6 text-body">{modalData.nombre_comercial}</h2>
@@ -465,7 +494,7 @@ const ProductGrid = () => {
                             <Button variant="outline-secondary" size="lg" className="flex-grow-1 fw-bold border-2" onClick={(e) => handleCopyPimSheet(e, modalData.id)}>
                                 <i className="bi bi-file-earmark-text me-2"></i> Copiar Ficha Técnica
                             </Button>
-                            <Button variant="primary" size="lg" className="flex-grow-1 fw-bold" onClick={(e) => { setShowModal(false); openSaleModal(e, modalData); }} disabled={modalData.stock <= 0}>
+                            <Button variant="primary" size="lg" className="flex-grow-1 fw-bold" onClick={(e) => { setShowModal(false); openSaleModal(e, modalData); }} disabled={modalData.disponible <= 0}>
                                 <i className="bi bi-cart-check-fill me-2"></i> REGISTRAR VENTA
                             </Button>
                         </div>
@@ -484,16 +513,16 @@ const ProductGrid = () => {
             {saleProduct && (
                 <>
                     <div className="d-flex align-items-center gap-3 mb-3 bg-body-tertiary p-2 rounded border border-secondary-subtle">
-                        <img src={saleProduct.imagen_principal} alt="" style={{width: 50, height: 50, objectFit:'contain'}} className="bg-body rounded border" />
+                        <img src={saleProduct.imagen_miniatura} alt="" style={{width: 50, height: 50, objectFit:'contain'}} className="bg-body rounded border" />
                         <div className="overflow-hidden">
                             <div className="fw-bold text-truncate">{saleProduct.nombre_comercial}</div>
-                            <small className="text-muted">Stock actual: {saleProduct.stock}</small>
+                            <small className="text-muted">Disponible: {saleProduct.disponible} (stock {saleProduct.stock}, reservado {saleProduct.reserved})</small>
                         </div>
                     </div>
                     <Form>
                         <Form.Group className="mb-3">
                             <Form.Label className="fw-bold small">Cantidad a descontar</Form.Label>
-                            <Form.Control type="number" min="1" max={saleProduct.stock} value={saleQuantity} onChange={(e) => setSaleQuantity(e.target.value)} autoFocus size="lg" className="text-center fw-bold text-primary bg-body text-body border-secondary" />
+                            <Form.Control type="number" min="1" max={saleProduct.disponible} value={saleQuantity} onChange={(e) => setSaleQuantity(e.target.value)} autoFocus size="lg" className="text-center fw-bold text-primary bg-body text-body border-secondary" />
                         </Form.Group>
                         <Form.Group className="mb-3">
                             <Form.Label className="small">Nota (Opcional)</Form.Label>
@@ -505,7 +534,7 @@ const ProductGrid = () => {
         </Modal.Body>
         <Modal.Footer className="border-top-0 pt-0">
             <Button variant="link" className="text-muted text-decoration-none" onClick={() => setShowSaleModal(false)}>Cancelar</Button>
-            <Button variant="primary" className="px-4 fw-bold" onClick={handleProcessSale} disabled={saleLoading || saleQuantity > saleProduct?.stock || saleQuantity <= 0}>
+            <Button variant="primary" className="px-4 fw-bold" onClick={handleProcessSale} disabled={saleLoading || saleQuantity > saleProduct?.disponible || saleQuantity <= 0}>
                 {saleLoading ? <Spinner size="sm" animation="border"/> : 'Confirmar'}
             </Button>
         </Modal.Footer>
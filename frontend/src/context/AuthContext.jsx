@@ -2,6 +2,8 @@ import React, { createContext, useState, useContext, useEffect } from 'react';
 
 const AuthContext = createContext();
 
+export const API_URL = 'https://bodegas-salas-api.onrender.com';
+
 export function useAuth() {
   return useContext(AuthContext);
 }
@@ -32,7 +34,7 @@ export function AuthProvider({ children }) {
 
   const login = async (username, password) => {
     try {
-      const response = await fetch('https://bodegas-salas-api.onrender.com/api/token/', {
+      const response = await fetch(`${API_URL}/api/token/`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ username, password }),
@@ -74,7 +76,7 @@ export function AuthProvider({ children }) {
 
     finalOptions.headers = headers;
 
-    const response = await fetch(`https://bodegas-salas-api.onrender.com${url}`, finalOptions);
+    const response = await fetch(`${API_URL}${url}`, finalOptions);
 
     if (response.status === 401) {
       logout();
@@ -90,6 +92,7 @@ export function AuthProvider({ children }) {
   return (
     <AuthContext.Provider value={{ 
         user, 
+        token,
         isAdmin, // <--- AGREGADO: Ahora el menú sabrá si eres admin
         login, 
         logout, 
@@ -0,0 +1,30 @@
+import { useEffect, useRef } from 'react';
+import { useAuth, API_URL } from '../context/AuthContext';
+
+// Escucha /api/stock-events/ (Server-Sent Events) y entrega cada cambio
+// { seq, product_id, stock, disponible }. EventSource se reconecta solo y
+// envía Last-Event-ID, así que no se pierden eventos entre reconexiones.
+// `onReset` se llama si el servidor ya purgó eventos pendientes: hay que recargar.
+// Devuelve un ref que vale true mientras el canal está abierto; si no lo está
+// (sin EventSource, reconectando, o un servidor que no hace streaming) quien
+// lo usa debe recargar por su cuenta después de un cambio.
+export default function useStockEvents(onEvent, onReset) {
+  const { token } = useAuth();
+  const handlers = useRef({ onEvent, onReset });
+  handlers.current = { onEvent, onReset };
+  const live = useRef(false);
+
+  useEffect(() => {
+    if (!token || typeof EventSource === 'undefined') return;
+    const source = new EventSource(`${API_URL}/api/stock-events/?token=${encodeURIComponent(token)}`);
+    source.onopen = () => { live.current = true; };
+    source.onerror = () => { live.current = false; };
+    source.onmessage = (e) => {
+      try { handlers.current.onEvent(JSON.parse(e.data)); } catch (err) { console.error(err); }
+    };
+    source.addEventListener('reset', () => handlers.current.onReset?.());
+    return () => { live.current = false; source.close(); };
+  }, [token]);
+
+  return live;
+}
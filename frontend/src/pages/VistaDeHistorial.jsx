@@ -13,6 +13,8 @@ function VistaDeHistorial() {
   const { authFetch } = useAuth();
   const [movements, setMovements] = useState([]);
   const [history, setHistory] = useState([]);
+  const [historyNext, setHistoryNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
@@ -27,15 +29,35 @@ function VistaDeHistorial() {
     try {
       const [resMov, resHist] = await Promise.all([
         authFetch('/api/stock-movements/'),
-        authFetch('/api/product-history/')
+        authFetch('/api/product-history/diffs/')
       ]);
       
       if (resMov.ok) setMovements(await resMov.json().then(d => d.results || d));
-      if (resHist.ok) setHistory(await resHist.json().then(d => d.results || d));
+      if (resHist.ok) {
+        const data = await resHist.json();
+        setHistory(data.results || data);
+        setHistoryNext(data.next || null);
+      }
     } catch (e) { setError("No se pudieron cargar los registros de auditoría."); }
     finally { setLoading(false); }
   };
 
+  // El historial viene paginado por cursor: 'next' es la URL completa de la página siguiente
+  const loadMoreHistory = async () => {
+    if (!historyNext) return;
+    setLoadingMore(true);
+    try {
+      const next = new URL(historyNext);
+      const res = await authFetch(next.pathname + next.search);
+      if (res.ok) {
+        const data = await res.json();
+        setHistory(prev => [...prev, ...data.results]);
+        setHistoryNext(data.next || null);
+      }
+    } catch (e) { setError("No se pudieron cargar más cambios."); }
+    finally { setLoadingMore(false); }
+  };
+
   // --- HELPERS VISUALES ---
   const getUserName = (username) => USER_MAP[username?.toLowerCase()] || username || 'Usuario Desconocido';
   
@@ -49,62 +71,46 @@ function VistaDeHistorial() {
     );
   };
 
-  const getChanges = (current, index, all) => {
-      // 1. BÚSQUEDA INTELIGENTE DEL ANCESTRO
-      // Buscamos hacia atrás en la lista el primer registro que tenga el MISMO ID de producto.
-      // Esto evita comparar "Peras con Manzanas" (o Lavadoras con Refrigeradores).
-      const prev = all.slice(index + 1).find(h => h.id === current.id);
+  // Etiquetas de los campos que reporta /api/product-history/diffs/
+  const FIELD_LABELS = {
+      nombre_comercial: { l: 'Nombre' },
+      precio_venta: { l: 'Precio', money: true },
+      costo_cg: { l: 'Costo', money: true },
+      stock: { l: 'Stock' },
+      sku: { l: 'SKU' },
+      ean: { l: 'EAN' },
+      brand: { l: 'Marca' },
+      category: { l: 'Categoría' },
+      provider: { l: 'Proveedor' },
+      descripcion: { l: 'Descripción' },
+      lugar_bodega: { l: 'Ubicación' },
+  };
 
-      // 2. LÓGICA DE ESTADO (Descontinuado / Reactivado)
-      // Si no hay registro previo con este ID, asumimos que nació activo.
-      const currentActive = current.is_active;
-      const prevActive = prev ? prev.is_active : true;
+  const getChanges = (revision) => {
+      // El servidor ya compara cada revisión con la anterior del mismo producto
+      const status = revision.changes.find(c => c.field === 'is_active');
 
       // CASO A: Se descontinuó
-      if (currentActive === false && prevActive === true) {
+      if (status && status.new === false) {
           return <Badge bg="danger" className="w-100 p-2">⛔ DESCONTINUADO (Eliminación Lógica)</Badge>;
       }
-      
+
       // CASO B: Se reactivó
-      if (currentActive === true && prevActive === false) {
+      if (status && status.new === true) {
           return <Badge bg="success" className="w-100 p-2">♻️ REACTIVADO</Badge>;
       }
 
-      // CASO C: Creación Inicial (No existe un ancestro para este ID)
-      if (!prev) {
-          return <Badge bg="success" className="bg-opacity-75"><i className="bi bi-stars"></i> Creación Inicial</Badge>;
-      }
-
-      // 3. DETECCIÓN DE CAMBIOS DE DATOS
-      const changes = [];
-      const fields = [
-          { k: 'nombre_comercial', l: 'Nombre' },
-          { k: 'precio_venta', l: 'Precio', money: true },
-          { k: 'stock', l: 'Stock' },
-          { k: 'sku', l: 'SKU' },
-          { k: 'brand_name', l: 'Marca' }, 
-          { k: 'category_name', l: 'Categoría' },
-          { k: 'provider_name', l: 'Proveedor' },
-          { k: 'descripcion', l: 'Descripción' }
-      ];
-
-      fields.forEach(f => {
-          const valNow = current[f.k];
-          const valPrev = prev[f.k];
-
-          // Comparación estricta de texto (trim) para evitar falsos positivos por espacios o tipos
-          if (String(valNow || '').trim() !== String(valPrev || '').trim()) {
-              const displayNow = f.money ? `$${parseInt(valNow||0).toLocaleString('es-CL')}` : (valNow || '---');
-              const displayPrev = f.money ? `$${parseInt(valPrev||0).toLocaleString('es-CL')}` : (valPrev || '---');
-              
-              changes.push(
-                  <div key={f.k} className="mb-1 p-2 rounded bg-warning bg-opacity-10 text-body border border-warning small">
-                      <strong>{f.l}:</strong> <span className="text-decoration-line-through text-muted opacity-75 mx-1">{displayPrev}</span> 
-                      <i className="bi bi-arrow-right-short text-warning"></i> 
-                      <span className="fw-bold mx-1">{displayNow}</span>
-                  </div>
-              );
-          }
+      // CASO C: Detalle de cambios (solo los campos con etiqueta)
+      const changes = revision.changes.filter(c => FIELD_LABELS[c.field]).map(c => {
+          const f = FIELD_LABELS[c.field];
+          const display = (val) => f.money ? `$${parseInt(val || 0).toLocaleString('es-CL')}` : (val ?? '---');
+          return (
+              <div key={c.field} className="mb-1 p-2 rounded bg-warning bg-opacity-10 text-body border border-warning small">
+                  <strong>{f.l}:</strong> <span className="text-decoration-line-through text-muted opacity-75 mx-1">{display(c.old)}</span> 
+                  <i className="bi bi-arrow-right-short text-warning"></i> 
+                  <span className="fw-bold mx-1">{display(c.new)}</span>
+              </div>
+          );
       });
 
       return changes.length > 0 ? changes : <span className="text-muted small fst-italic">Edición menor (sin cambios clave)</span>;
@@ -150,7 +156,7 @@ function VistaDeHistorial() {
                             </div>
                             <div>
                                 <h6 className="text-muted mb-0 text-uppercase small fw-bold">Cambios en Catálogo</h6>
-                                <h3 className="fw-bold mb-0 text-body">{history.length}</h3>
+                                <h3 className="fw-bold mb-0 text-body">{history.length}{historyNext ? '+' : ''}</h3>
                             </div>
                         </Card.Body>
                     </Card>
@@ -244,7 +250,7 @@ function VistaDeHistorial() {
                                         </tr>
                                     </thead>
                                     <tbody className="border-top-0">
-                                        {history.map((h, i) => (
+                                        {history.map(h => (
                                             <tr key={h.history_id}>
                                                 <td className="ps-4">{formatDate(h.history_date)}</td>
                                                 <td>
@@ -265,7 +271,7 @@ function VistaDeHistorial() {
                                                     <span className="font-monospace text-muted small">{h.sku}</span>
                                                 </td>
                                                 <td className="pe-4">
-                                                    {h.history_type === '~' ? getChanges(h, i, history) : 
+                                                    {h.history_type === '~' ? getChanges(h) : 
                                                      h.history_type === '-' ? <span className="text-danger fw-bold"><i className="bi bi-trash"></i> Eliminado del sistema</span> :
                                                      <span className="text-success"><i className="bi bi-stars"></i> Creación inicial</span>}
                                                 </td>
@@ -274,6 +280,13 @@ function VistaDeHistorial() {
                                         {history.length === 0 && <tr><td colSpan="5" className="text-center py-5 text-muted">No hay ediciones registradas.</td></tr>}
                                     </tbody>
                                 </Table>
+                                {historyNext && (
+                                    <div className="text-center py-3 border-top">
+                                        <Button variant="outline-secondary" onClick={loadMoreHistory} disabled={loadingMore}>
+                                            {loadingMore ? <Spinner size="sm" animation="border" /> : <><i className="bi bi-chevron-down me-2"></i>Cargar más</>}
+                                        </Button>
+                                    </div>
+                                )}
                             </div>
                         </Tab.Pane>
                     </Tab.Content>